@@ -0,0 +1 @@
+"""Data-scale benchmarks of the app's hot paths, see ``benchmarks.run``."""
@@ -0,0 +1,65 @@
+"""factory-boy factories producing realistic shop data for the benchmarks."""
+
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import factory
+from factory import fuzzy
+from faker import Faker
+
+from duda import inventory
+
+fake = Faker()
+
+# Orders are spread over this many days before today.
+HISTORY_DAYS = 3 * 365
+
+# Most orders end up paid or delivered, a few are returned or cancelled.
+STATUS_WEIGHTS = {
+    "Pending": 10,
+    "Likujduar": 55,
+    "Dorezuar": 25,
+    "Anulluar": 6,
+    "Kthyer": 4,
+}
+
+
+class ProductFactory(factory.DictFactory):
+    Produkti = factory.Sequence(lambda n: f"{fake.word().title()} {n}")
+
+
+class OrderFactory(factory.DictFactory):
+    """One inventory row; pass ``Produkti`` and ``Porositesi`` choices in."""
+
+    Produkti = None
+    Porositesi = None
+    Cmim_blerje = fuzzy.FuzzyDecimal(200, 8000)
+    Cmim_shitje = factory.LazyAttribute(
+        lambda o: round(o.Cmim_blerje * Decimal(random.uniform(1.1, 1.8)), 2)
+    )
+    Cmim_pound = factory.LazyAttribute(lambda o: round(o.Cmim_blerje / 125, 2))
+    Description = factory.Faker("sentence", nb_words=5)
+    magazinim = fuzzy.FuzzyChoice(inventory.STORAGE_OPTIONS)
+    status_porosie = factory.LazyFunction(
+        lambda: random.choices(
+            list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values())
+        )[0]
+    )
+    link = factory.Faker("url")
+    date_created = fuzzy.FuzzyDate(date.today() - timedelta(days=HISTORY_DAYS))
+
+
+def customers(count):
+    """A pool of returning customers, so per-client views have history."""
+    return [fake.name() for _ in range(count)]
+
+
+def orders(count, product_names, customer_names):
+    """Builds ``count`` order rows in the column order of ``EDITABLE_COLUMNS``."""
+    rows = OrderFactory.build_batch(
+        count,
+        Produkti=fuzzy.FuzzyChoice(product_names),
+        Porositesi=fuzzy.FuzzyChoice(customer_names),
+    )
+    return [tuple(row[column] for column in inventory.EDITABLE_COLUMNS) for row in rows]
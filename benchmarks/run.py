@@ -0,0 +1,405 @@
+"""Data-scale benchmarks of the Inventory page's hot paths.
+
+Seeds a local Postgres database with synthetic orders at each size, times
+the page's hot paths against it and writes the timings as JSON.  The
+database is wiped first, so its name must contain "bench"::
+
+    python -m benchmarks.run --dsn "dbname=duda_bench user=postgres" \\
+        --sizes 10000 100000 1000000 --output bench_results.json
+
+With ``--sqlite bench.db`` instead of ``--dsn`` the same cases run against
+the embedded SQLite backend (``repository.SQLiteRepository``), without a
+database server; the file is recreated for every size.
+
+Saves go through the repository as the page's SAVE does, so with Postgres
+through the write-behind journal: ``update_data_*`` times what SAVE waits
+for, ``save_landed_*`` the time until the save's result is in.
+
+Run it from the repository root, the page render case loads
+``pages/Inventory_Page.py`` through Streamlit's app-testing harness.
+"""
+
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import psycopg2
+import streamlit as st
+from psycopg2 import extensions
+
+from benchmarks import factories
+from duda import (
+    counters,
+    customers,
+    db,
+    inventory,
+    journal,
+    migrations,
+    repository,
+    rollups,
+    search,
+)
+
+PRODUCTS = 200
+CUSTOMERS = 5_000
+SEED_CHUNK_ROWS = 50_000
+
+# Number of rows changed by one save in the update_data cases.
+BATCH_SIZES = (1, 100, 500)
+
+# Window of the date filter and per-product report cases.
+WINDOW_DAYS = 30
+
+# Longest a save case waits for its save to land.
+SAVE_TIMEOUT_SECONDS = 120
+
+
+def seed(conn, rows):
+    """Replaces the inventory and products with ``rows`` synthetic orders."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        TRUNCATE inventory, products, inventory_deletions, {rollups.TABLE},
+            {counters.TABLE}, {customers.TABLE}
+        RESTART IDENTITY
+        """
+    )
+    product_names = [p["Produkti"] for p in factories.ProductFactory.build_batch(PRODUCTS)]
+    cursor.execute(
+        "INSERT INTO products (Produkti) SELECT unnest(%s::text[])", (product_names,)
+    )
+    customer_names = factories.customers(CUSTOMERS)
+
+    copy_sql = (
+        f"COPY inventory ({', '.join(inventory.EDITABLE_COLUMNS)}) "
+        "FROM STDIN WITH (FORMAT csv)"
+    )
+    for start in range(0, rows, SEED_CHUNK_ROWS):
+        count = min(SEED_CHUNK_ROWS, rows - start)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(factories.orders(count, product_names, customer_names))
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+        print(f"  seeded {start + count}/{rows} orders", flush=True)
+
+    # The triggers kept the counters, ledger and rollups current during COPY
+    cursor.execute("ANALYZE")
+    conn.commit()
+
+
+def seed_sqlite(path, rows):
+    """Creates a SQLite database at ``path`` with ``rows`` synthetic orders."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    repo = repository.SQLiteRepository(path)
+    product_names = [p["Produkti"] for p in factories.ProductFactory.build_batch(PRODUCTS)]
+    repo.add_products(product_names)
+    customer_names = factories.customers(CUSTOMERS)
+
+    def generate():
+        for start in range(0, rows, SEED_CHUNK_ROWS):
+            count = min(SEED_CHUNK_ROWS, rows - start)
+            orders = factories.orders(count, product_names, customer_names)
+            # Explicit ids and a first row version, as ``replace_all`` expects
+            for i, order in enumerate(orders, start + 1):
+                yield (i, *order, 1)
+            print(f"  seeded {start + count}/{rows} orders", flush=True)
+
+    repo.replace_all(generate())
+    return repo
+
+
+def measure(results, rows, case, fn, repeat, after=None):
+    """Times ``fn`` ``repeat`` times and appends the summary to ``results``."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+        if after is not None:
+            after()
+    timings.sort()
+    results.append(
+        {
+            "rows": rows,
+            "case": case,
+            "runs": repeat,
+            "min_ms": round(timings[0], 3),
+            "median_ms": round(timings[len(timings) // 2], 3),
+            "p95_ms": round(timings[math.ceil(0.95 * len(timings)) - 1], 3),
+        }
+    )
+    print(f"  {case:<28} median {results[-1]['median_ms']:>10.1f} ms", flush=True)
+
+
+def bench_queries(conn, repo, rows, repeat, results):
+    today = date.today()
+    window = (today - timedelta(days=WINDOW_DAYS), today)
+
+    measure(results, rows, "load_data", lambda: inventory.load_data(conn), repeat, conn.rollback)
+
+    snapshot = inventory.InventorySnapshot()
+    measure(results, rows, "snapshot_refresh_cold", lambda: snapshot.refresh(conn), 1)
+    measure(results, rows, "snapshot_refresh_delta", lambda: snapshot.refresh(conn), repeat)
+
+    page = bench_saves(repo, rows, repeat, results)
+
+    measure(
+        results,
+        rows,
+        "report_daily_profit",
+        lambda: rollups.daily_profit(conn),
+        repeat,
+        conn.rollback,
+    )
+    measure(
+        results,
+        rows,
+        "report_monthly_profit",
+        lambda: rollups.monthly_profit(conn),
+        repeat,
+        conn.rollback,
+    )
+    measure(
+        results,
+        rows,
+        "report_product_counts",
+        lambda: rollups.product_counts(conn, *window),
+        repeat,
+        conn.rollback,
+    )
+    measure(
+        results,
+        rows,
+        "report_customer_ledger",
+        lambda: customers.read_page(conn),
+        repeat,
+        conn.rollback,
+    )
+
+    measure(
+        results,
+        rows,
+        "date_filter",
+        lambda: inventory.load_filtered(conn, *window),
+        repeat,
+        conn.rollback,
+    )
+
+    # The first letters of a customer's name, as typed into the search box
+    query = page["Porositesi"].iloc[0][:4]
+    trigrams = search.has_trigrams(conn)
+    measure(
+        results,
+        rows,
+        "search_prefix",
+        lambda: search.load_matches(conn, query, trigrams=trigrams),
+        repeat,
+        conn.rollback,
+    )
+
+
+def bench_repository(repo, rows, repeat, results):
+    """The cases of ``bench_queries``, through a repository backend."""
+    today = date.today()
+    window = (today - timedelta(days=WINDOW_DAYS), today)
+
+    snapshot = inventory.InventorySnapshot()
+    measure(
+        results, rows, "snapshot_refresh_cold", lambda: repo.refresh_snapshot(snapshot), 1
+    )
+    measure(
+        results,
+        rows,
+        "snapshot_refresh_delta",
+        lambda: repo.refresh_snapshot(snapshot),
+        repeat,
+    )
+
+    page = bench_saves(repo, rows, repeat, results)
+
+    measure(results, rows, "report_daily_profit", repo.daily_profit, repeat)
+    measure(results, rows, "report_monthly_profit", repo.monthly_profit, repeat)
+    measure(
+        results,
+        rows,
+        "report_product_counts",
+        lambda: repo.product_counts(*window),
+        repeat,
+    )
+    measure(results, rows, "report_customer_ledger", repo.customer_ledger, repeat)
+    measure(results, rows, "date_filter", lambda: repo.load_filtered(*window), repeat)
+
+    query = page["Porositesi"].iloc[0][:4]
+    # The first search builds the index, later ones only look it up
+    measure(results, rows, "search_index_build", lambda: repo.search(query), 1)
+    measure(results, rows, "search_prefix", lambda: repo.search(query), repeat)
+
+
+def bench_saves(repo, rows, repeat, results):
+    """Times saves of every kind and batch size, returns the page they edit.
+
+    Saves commit, so the page is reloaded after every run and each run edits
+    or deletes current rows.
+    """
+    page = {}
+
+    def reload():
+        page["frame"], _ = repo.load_page(page_size=max(BATCH_SIZES))
+
+    def land(key):
+        deadline = time.monotonic() + SAVE_TIMEOUT_SECONDS
+        while not repo.save_results([key]):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"save {key} did not land")
+            time.sleep(0.001)
+
+    reload()
+    for n in BATCH_SIZES:
+        new_rows = [
+            dict(zip(inventory.EDITABLE_COLUMNS, row))
+            for row in factories.orders(n, ["Bench"], ["Bench"])
+        ]
+        cases = {
+            "edits": {i: {"Cmim_shitje": 999.0, "status_porosie": "Dorezuar"} for i in range(n)},
+            "inserts": new_rows,
+            "deletes": list(range(n)),
+        }
+        for kind, change in cases.items():
+            changes = {
+                "edited_rows": change if kind == "edits" else {},
+                "added_rows": change if kind == "inserts" else [],
+                "deleted_rows": change if kind == "deletes" else [],
+            }
+            keys = []
+
+            def save():
+                keys.append(repo.save(inventory.resolve_changes(page["frame"], changes)))
+
+            def landed():
+                land(keys.pop())
+                reload()
+
+            measure(results, rows, f"update_data_{kind}_{n}", save, repeat, landed)
+            measure(
+                results, rows, f"save_landed_{kind}_{n}", lambda: (save(), landed()), repeat
+            )
+    return page["frame"]
+
+
+def bench_page(rows, repeat, results, dsn=None):
+    """Renders the page against ``dsn``, or the configured SQLite file without one."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file("pages/Inventory_Page.py", default_timeout=600)
+    if dsn is not None:
+        params = extensions.parse_dsn(dsn)
+        app.secrets["db_credentials"] = {
+            "host": params.get("host", "localhost"),
+            "port": params.get("port", "5432"),
+            "db_name": params["dbname"],
+            "db_user": params.get("user", ""),
+            "db_password": params.get("password", ""),
+        }
+
+    def render():
+        app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+
+    # The first run pays for the backend, the migration check and the snapshot
+    measure(results, rows, "page_render_cold", render, 1)
+    measure(results, rows, "page_render_warm", render, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--dsn", help="libpq DSN of the bench database")
+    target.add_argument("--sqlite", help="SQLite file to bench the embedded backend on")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--skip-page", action="store_true", help="skip the page render case")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        if "bench" not in os.path.basename(args.sqlite):
+            parser.error("the database is wiped, its file name must contain 'bench'")
+        results = []
+        for rows in args.sizes:
+            print(f"{rows} orders", flush=True)
+            repo = seed_sqlite(args.sqlite, rows)
+            bench_repository(repo, rows, args.repeat, results)
+            if not args.skip_page:
+                repository.SQLITE_FILE = args.sqlite
+                st.cache_resource.clear()
+                st.cache_data.clear()
+                bench_page(rows, args.repeat, results)
+        write_results(args.output, {"sqlite": sqlite3.sqlite_version}, results)
+        return
+
+    if "bench" not in extensions.parse_dsn(args.dsn).get("dbname", ""):
+        parser.error("the database is wiped, its name must contain 'bench'")
+
+    conn = psycopg2.connect(args.dsn)
+    migrations.migrate(conn)
+    # Saves take the page's path, through a journal of their own
+    db_pool = db.ConnectionPool(1, 2, dsn=args.dsn)
+    journal_file = os.path.join(tempfile.mkdtemp(), "bench_journal.sqlite3")
+    repo = repository.PostgresRepository(db_pool, journal.Journal(journal_file, db_pool))
+    cursor = conn.cursor()
+    cursor.execute("SELECT version()")
+    server_version = cursor.fetchone()[0]
+    conn.commit()
+
+    results = []
+    for rows in args.sizes:
+        print(f"{rows} orders", flush=True)
+        seed(conn, rows)
+        bench_queries(conn, repo, rows, args.repeat, results)
+        if not args.skip_page:
+            # The page's process-wide caches still hold the previous size
+            st.cache_resource.clear()
+            st.cache_data.clear()
+            bench_page(rows, args.repeat, results, args.dsn)
+    conn.close()
+    db_pool.closeall()
+    write_results(args.output, {"postgres": server_version}, results)
+
+
+def write_results(path, versions, results):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    with open(path, "w") as out:
+        json.dump(
+            {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "commit": commit,
+                "python": platform.python_version(),
+                **versions,
+                "results": results,
+            },
+            out,
+            indent=2,
+        )
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared database and data helpers used by the Duda Shop pages."""
@@ -0,0 +1,142 @@
+"""Static images of the landing page, served by Streamlit itself.
+
+The source images in the repository root are resized to a few widths and
+compressed as WebP plus a JPEG/PNG fallback.  The results go to ``static/``
+(served at ``app/static/`` with ``server.enableStaticServing``) under
+content-hashed names listed in ``static/manifest.json``.  After changing a
+source image, regenerate and commit them with::
+
+    python -m duda.assets build
+"""
+
+import hashlib
+import io
+import json
+import sys
+from pathlib import Path
+
+import streamlit as st
+
+ROOT = Path(__file__).resolve().parent.parent
+STATIC_DIR = ROOT / "static"
+MANIFEST = STATIC_DIR / "manifest.json"
+
+# name: (source image, widths to generate, fallback format).  The logo is
+# shown 200px wide, so it gets 1x and 2x variants.
+SOURCES = {
+    "background": ("background.JPG", (480, 960, 1280, 1600), "JPEG"),
+    "logo": ("vector-logo.png", (200, 400), "PNG"),
+}
+
+FORMATS = {
+    "WEBP": ("webp", "image/webp", {"quality": 75, "method": 6}),
+    "JPEG": ("jpg", "image/jpeg", {"quality": 80, "optimize": True, "progressive": True}),
+    "PNG": ("png", "image/png", {"optimize": True}),
+}
+
+
+def build():
+    """Regenerates every variant and the manifest, removing stale files."""
+    from PIL import Image
+
+    manifest = {}
+    for name, (source, widths, fallback) in SOURCES.items():
+        with Image.open(ROOT / source) as image:
+            image.load()
+        variants = []
+        for width in widths:
+            width = min(width, image.width)
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS)
+            for image_format in ("WEBP", fallback):
+                variants.append(_save(resized, name, width, image_format))
+        manifest[name] = variants
+
+    keep = {variant["file"] for variants in manifest.values() for variant in variants}
+    for path in STATIC_DIR.iterdir():
+        # Directories hold files of their own, like the prepared exports
+        if path.is_file() and path.name != MANIFEST.name and path.name not in keep:
+            path.unlink()
+    MANIFEST.write_text(json.dumps(manifest, indent=2) + "\n")
+    return manifest
+
+
+def _save(image, name, width, image_format):
+    extension, mime, options = FORMATS[image_format]
+    if image_format == "JPEG":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    data = buffer.getvalue()
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    file_name = f"{name}-{width}.{digest}.{extension}"
+    STATIC_DIR.mkdir(exist_ok=True)
+    (STATIC_DIR / file_name).write_bytes(data)
+    return {
+        "width": width,
+        "type": mime,
+        "file": file_name,
+        "hash": digest,
+        "bytes": len(data),
+    }
+
+
+@st.cache_data(show_spinner=False)
+def manifest():
+    """The generated variants per image, read once per process."""
+    return json.loads(MANIFEST.read_text())
+
+
+def url(variant):
+    # Tornado only sends the far-future Cache-Control for versioned URLs
+    return f"app/static/{variant['file']}?v={variant['hash']}"
+
+
+def background_css(selector):
+    """CSS giving ``selector`` the background sized to the viewport width."""
+    by_width = {}
+    for variant in manifest()["background"]:
+        by_width.setdefault(variant["width"], []).append(variant)
+
+    rules = []
+    widths = sorted(by_width, reverse=True)
+    for i, width in enumerate(widths):
+        variants = by_width[width]
+        fallback = variants[-1]
+        image_set = ", ".join(f'url("{url(v)}") type("{v["type"]}")' for v in variants)
+        rule = (
+            f'{selector} {{ background-image: url("{url(fallback)}"); '
+            f"background-image: image-set({image_set}); }}"
+        )
+        # The largest variant is the default, smaller screens override it
+        if i:
+            rule = f"@media (max-width: {width}px) {{ {rule} }}"
+        rules.append(rule)
+    return "\n".join(rules)
+
+
+def logo_html(width=200):
+    """A <picture> of the logo, WebP where supported, 1x and 2x."""
+    variants = manifest()["logo"]
+
+    def srcset(mime):
+        return ", ".join(
+            f"{url(v)} {v['width'] / width:g}x" for v in variants if v["type"] == mime
+        )
+
+    fallback = [v for v in variants if v["type"] != "image/webp"]
+    return (
+        "<picture>"
+        f'<source type="image/webp" srcset="{srcset("image/webp")}">'
+        f'<img src="{url(fallback[0])}" srcset="{srcset(fallback[0]["type"])}" '
+        f'width="{width}" alt="Duda Shop">'
+        "</picture>"
+    )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        sys.exit("usage: python -m duda.assets build")
+    for name, variants in build().items():
+        for variant in variants:
+            print(f"{variant['file']:<40} {variant['bytes']:>8} bytes")
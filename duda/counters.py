@@ -0,0 +1,116 @@
+"""Live order counters behind the Inventory page's KPI strip.
+
+Statement-level triggers on the inventory apply every insert, update and
+delete to the counters table as a delta, so the whole strip is one read of
+a few rows however long the order history gets.  Should the counters ever
+drift (e.g. after a TRUNCATE, which fires no delete triggers), rebuild
+them with::
+
+    python -m duda.counters rebuild
+"""
+
+import pandas as pd
+
+from duda import deltas
+
+TABLE = "inventory_counters"
+
+# Counter kinds: orders and their summed sale price per status, and units
+# on hand per product (orders stored as "Inventar").
+STATUS = "status"
+STOCK = "stock"
+
+_AGGREGATE = f"""
+    SELECT '{STATUS}', COALESCE(status_porosie, ''), SUM(sign), COALESCE(SUM(sign * Cmim_shitje), 0)
+    FROM {{source}} AS changed
+    GROUP BY 2
+    UNION ALL
+    SELECT '{STOCK}', COALESCE(Produkti, ''), SUM(sign), 0
+    FROM {{source}} AS changed
+    WHERE magazinim = 'Inventar'
+    GROUP BY 2
+"""
+
+_APPLY = f"""
+    INSERT INTO {TABLE} AS c (kind, key, order_count, amount)
+    SELECT * FROM ({_AGGREGATE}) AS delta (kind, key, order_count, amount)
+    WHERE order_count <> 0 OR amount <> 0
+    ORDER BY kind, key
+    ON CONFLICT (kind, key) DO UPDATE SET
+        order_count = c.order_count + EXCLUDED.order_count,
+        amount = c.amount + EXCLUDED.amount
+"""
+
+_TRIGGERS = deltas.delta_triggers("count", _APPLY)
+
+
+def initialize(conn):
+    """Creates the counters table and its triggers, then fills it."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            order_count BIGINT NOT NULL,
+            amount NUMERIC(14, 2) NOT NULL,
+            PRIMARY KEY (kind, key)
+        )
+        """
+    )
+    cursor.execute(_TRIGGERS)
+    rebuild(conn)
+
+
+def rebuild(conn):
+    """Recounts the whole table from the inventory."""
+    deltas.rebuild(conn, TABLE, _AGGREGATE)
+
+
+def aggregate(source):
+    """The counter rows of ``source``, inventory rows with a ``sign`` column.
+
+    Plain SQL that SQLite runs as well.
+    """
+    return deltas.aggregate(_AGGREGATE, source)
+
+
+def read(conn):
+    """Returns the status counts and the stock on hand.
+
+    The first frame has one row per status with its order count and the
+    summed sale price; the second one the units on hand per product.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT kind, key, order_count, amount
+        FROM {TABLE}
+        WHERE order_count <> 0
+        ORDER BY kind, key
+        """
+    )
+    return split(
+        pd.DataFrame(cursor.fetchall(), columns=["kind", "key", "count", "amount"])
+    )
+
+
+def split(rows):
+    """Splits counter rows (kind, key, count, amount) into the frames of ``read``."""
+    statuses = (
+        rows[rows["kind"] == STATUS]
+        .drop(columns="kind")
+        .rename(columns={"key": "status_porosie"})
+        .reset_index(drop=True)
+    )
+    stock = (
+        rows[rows["kind"] == STOCK]
+        .drop(columns=["kind", "amount"])
+        .rename(columns={"key": "Produkti"})
+        .reset_index(drop=True)
+    )
+    return statuses, stock
+
+
+if __name__ == "__main__":
+    deltas.main("duda.counters", TABLE, rebuild)
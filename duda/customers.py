@@ -0,0 +1,161 @@
+"""Per-customer ledger behind the "Raport Sipas Klientit" report.
+
+One row per customer (``Porositesi``) holds their order count, the open
+balance of their pending orders, the revenue and purchase cost of their
+paid orders and how many orders they returned or cancelled.  Like the KPI
+counters, statement-level triggers apply every insert, update and delete
+on the inventory as a delta, so the report reads one page of customers
+however long the order history gets.  Rebuild it with::
+
+    python -m duda.customers rebuild
+"""
+
+import pandas as pd
+
+from duda import deltas
+
+TABLE = "inventory_customer_rollup"
+
+# The ledger's columns after the customer name, all sums of the orders.
+COLUMNS = [
+    "order_count",
+    "pending_count",
+    "pending_amount",
+    "paid_revenue",
+    "paid_cost",
+    "returned_count",
+    "cancelled_count",
+]
+
+# Orderings of the report, largest first; the same SQL runs on SQLite.
+SORT_KEYS = {
+    "revenue": "paid_revenue",
+    "margin": "paid_revenue - paid_cost",
+    "pending": "pending_amount",
+    "orders": "order_count",
+    "returns": "returned_count",
+}
+
+# The columns holding amounts of money, the others count orders.
+AMOUNTS = ["pending_amount", "paid_revenue", "paid_cost"]
+
+PAGE_SIZE = 25
+
+_AGGREGATE = """
+    SELECT
+        COALESCE(Porositesi, ''),
+        SUM(sign),
+        COALESCE(SUM(sign) FILTER (WHERE status_porosie = 'Pending'), 0),
+        COALESCE(SUM(sign * Cmim_shitje) FILTER (WHERE status_porosie = 'Pending'), 0),
+        COALESCE(SUM(sign * Cmim_shitje) FILTER (WHERE status_porosie = 'Likujduar'), 0),
+        COALESCE(SUM(sign * Cmim_blerje) FILTER (WHERE status_porosie = 'Likujduar'), 0),
+        COALESCE(SUM(sign) FILTER (WHERE status_porosie = 'Kthyer'), 0),
+        COALESCE(SUM(sign) FILTER (WHERE status_porosie = 'Anulluar'), 0)
+    FROM {source} AS changed
+    GROUP BY 1
+"""
+
+_APPLY = f"""
+    INSERT INTO {TABLE} AS c (Porositesi, {', '.join(COLUMNS)})
+    SELECT * FROM ({_AGGREGATE}) AS delta (Porositesi, {', '.join(COLUMNS)})
+    -- Edits that leave a customer's sums as they were change nothing
+    WHERE {' OR '.join(f'{column} <> 0' for column in COLUMNS)}
+    ORDER BY Porositesi
+    ON CONFLICT (Porositesi) DO UPDATE SET
+        {', '.join(f'{column} = c.{column} + EXCLUDED.{column}' for column in COLUMNS)}
+"""
+
+_TRIGGERS = deltas.delta_triggers("customer", _APPLY)
+
+
+def initialize(conn):
+    """Creates the ledger table and its triggers, then fills it."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+            Porositesi TEXT PRIMARY KEY,
+            order_count BIGINT NOT NULL,
+            pending_count BIGINT NOT NULL,
+            pending_amount NUMERIC(14, 2) NOT NULL,
+            paid_revenue NUMERIC(14, 2) NOT NULL,
+            paid_cost NUMERIC(14, 2) NOT NULL,
+            returned_count BIGINT NOT NULL,
+            cancelled_count BIGINT NOT NULL
+        )
+        """
+    )
+    cursor.execute(_TRIGGERS)
+    rebuild(conn)
+
+
+def rebuild(conn):
+    """Recomputes the whole ledger from the inventory."""
+    deltas.rebuild(conn, TABLE, _AGGREGATE)
+
+
+def aggregate(source):
+    """The ledger rows of ``source``, inventory rows with a ``sign`` column.
+
+    Plain SQL that SQLite runs as well.
+    """
+    return deltas.aggregate(_AGGREGATE, source)
+
+
+def page_query(sort_key, after, placeholder="%s"):
+    """The SQL and parameters of one keyset page, for Postgres or SQLite.
+
+    Takes ``page_size + 1`` as the last parameter, see ``read_page``.
+    """
+    if sort_key not in SORT_KEYS:
+        raise ValueError(f"Cannot sort the customer ledger on {sort_key!r}")
+    sort = SORT_KEYS[sort_key]
+    # Customers whose orders were all deleted keep a row of zeros
+    conditions, params = ["order_count > 0"], []
+    if after is not None:
+        conditions.append(
+            f"({sort} < {placeholder} OR ({sort} = {placeholder} AND Porositesi > {placeholder}))"
+        )
+        params.extend([after[0], after[0], after[1]])
+    return (
+        f"""
+        SELECT Porositesi, {', '.join(COLUMNS)}, {sort}
+        FROM {TABLE}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {sort} DESC, Porositesi
+        LIMIT {placeholder}
+        """,
+        params,
+    )
+
+
+def read_page(conn, sort_key="revenue", after=None, page_size=PAGE_SIZE):
+    """Loads one keyset page of the ledger, the largest ``sort_key`` first.
+
+    ``after`` is the cursor of the previous page, ``None`` for the first one,
+    so the first page is the top ``page_size`` customers.  Returns the page
+    and the cursor of the next page, ``None`` on the last page.
+    """
+    query, params = page_query(sort_key, after)
+    cursor = conn.cursor()
+    cursor.execute(query, (*params, page_size + 1))
+    return frame_from_rows(cursor.fetchall(), page_size)
+
+
+def frame_from_rows(rows, page_size):
+    """The page and next cursor of rows selected by ``page_query``."""
+    next_cursor = None
+    if len(rows) > page_size:
+        last = rows[page_size - 1]
+        next_cursor = (last[-1], last[0])
+    frame = pd.DataFrame(
+        [row[:-1] for row in rows[:page_size]], columns=["Porositesi", *COLUMNS]
+    )
+    # Float columns on an empty page too, which pandas leaves as object
+    frame[AMOUNTS] = frame[AMOUNTS].astype(float)
+    frame["margin"] = frame["paid_revenue"] - frame["paid_cost"]
+    return frame, next_cursor
+
+
+if __name__ == "__main__":
+    deltas.main("duda.customers", TABLE, rebuild)
@@ -0,0 +1,166 @@
+"""Process-wide pooled access to the Supabase PostgreSQL database.
+
+Connection settings come from the ``[db_credentials]`` section of the
+Streamlit secrets.  Besides the connection keys used so far, two optional
+keys size the pool::
+
+    [db_credentials]
+    pool_size = 5        # connections kept open between reruns
+    pool_max_size = 10   # hard cap under load, extra ones are closed on return
+"""
+
+import contextlib
+import threading
+import time
+
+import psycopg2
+import streamlit as st
+from psycopg2 import extensions, pool
+
+from duda import metrics
+
+# Connections idle for longer than this are pinged before they are handed out.
+IDLE_CHECK_SECONDS = 30
+
+# How long a rerun waits for a free connection before giving up.
+CHECKOUT_TIMEOUT_SECONDS = 10
+
+# Prices are stored as NUMERIC; hand them to pandas as floats, not Decimals.
+extensions.register_type(
+    extensions.new_type(
+        extensions.DECIMAL.values,
+        "DEC2FLOAT",
+        lambda value, cursor: float(value) if value is not None else None,
+    )
+)
+
+
+class ConnectionPool:
+    """Thread-safe connection pool that validates idle connections.
+
+    The connections are opened on the first checkout, so a process started
+    while the database is down still serves what it can without it.
+    """
+
+    def __init__(self, minconn, maxconn, **dsn):
+        self._minconn = minconn
+        self._dsn = dsn
+        self._pool = None
+        self._opening = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self.maxconn = maxconn
+
+    def getconn(self):
+        """Returns a healthy connection, waiting for a free slot if needed."""
+        if not self._slots.acquire(timeout=CHECKOUT_TIMEOUT_SECONDS):
+            raise pool.PoolError("Timed out waiting for a free database connection")
+        try:
+            self._open()
+            while True:
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                # Stale connection: drop it, the pool opens a fresh one next.
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        """Returns a connection to the pool, closing it if it is broken."""
+        try:
+            status = conn.info.transaction_status if not conn.closed else None
+            if status in (None, extensions.TRANSACTION_STATUS_UNKNOWN):
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._last_used.clear()
+        if self._pool is not None:
+            self._pool.closeall()
+
+    def _open(self):
+        with self._opening:
+            if self._pool is None:
+                self._pool = pool.ThreadedConnectionPool(
+                    self._minconn, self.maxconn, **self._dsn
+                )
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < IDLE_CHECK_SECONDS:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool():
+    """Creates the connection pool once per process."""
+    credentials = st.secrets.db_credentials
+    pool_size = int(credentials.get("pool_size", 5))
+    return ConnectionPool(
+        minconn=pool_size,
+        maxconn=max(pool_size, int(credentials.get("pool_max_size", 10))),
+        cursor_factory=metrics.InstrumentedCursor,
+        **connect_args(),
+    )
+
+
+def connect_args():
+    """The ``psycopg2.connect`` arguments of the ``[db_credentials]`` secrets.
+
+    For connections kept apart from the pool, like the change listener's.
+    """
+    credentials = st.secrets.db_credentials
+    return dict(
+        host=credentials["host"],
+        port=credentials["port"],
+        dbname=credentials["db_name"],
+        user=credentials["db_user"],
+        password=credentials["db_password"],
+        connect_timeout=10,
+        # Let the OS notice dead peers instead of hanging on a half-open socket.
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=3,
+    )
+
+
+@contextlib.contextmanager
+def connection(db_pool=None):
+    """Checks a connection out of the shared pool for the duration of a block.
+
+    Uncommitted work is rolled back when the connection is returned.  Threads
+    without a Streamlit script context cannot reach the cached pool and must
+    pass the one from ``get_pool()`` explicitly.
+    """
+    db_pool = db_pool or get_pool()
+    start = time.perf_counter()
+    conn = db_pool.getconn()
+    metrics.REGISTRY.observe("duda_pool_checkout_seconds", time.perf_counter() - start)
+    try:
+        yield conn
+    except Exception:
+        with contextlib.suppress(psycopg2.Error):
+            conn.rollback()
+        raise
+    finally:
+        db_pool.putconn(conn)
@@ -0,0 +1,81 @@
+"""Aggregate tables kept current by statement-level triggers on the inventory.
+
+The counters, the customer ledger and the day rollups all work the same way:
+an aggregate over inventory rows carrying a ``sign`` column (1 for rows
+added, -1 for rows removed) is added onto the table as a delta.  Every
+insert, update and delete on the inventory applies the rows it touched, read
+from the statement's transition tables, so concurrent writers add up instead
+of racing.  Each module supplies its apply SQL, an upsert of its aggregate
+over ``{source}`` that should lock its keys in a fixed order (``ORDER BY``
+the conflict key) to keep concurrent saves from deadlocking.
+"""
+
+import sys
+
+# The source of a full recount: every inventory row, added once.
+ALL_ROWS = "(SELECT *, 1 AS sign FROM inventory)"
+
+_TRIGGERS = """
+    CREATE OR REPLACE FUNCTION inventory_{name}_changes() RETURNS trigger AS $$
+    DECLARE
+        source TEXT := CASE TG_OP
+            WHEN 'INSERT' THEN '(SELECT *, 1 AS sign FROM new_rows)'
+            WHEN 'DELETE' THEN '(SELECT *, -1 AS sign FROM old_rows)'
+            ELSE '(SELECT *, 1 AS sign FROM new_rows
+                   UNION ALL SELECT *, -1 AS sign FROM old_rows)'
+        END;
+    BEGIN
+        EXECUTE replace($apply${apply}$apply$, '{{source}}', source);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS inventory_{name}_inserts ON inventory;
+    CREATE TRIGGER inventory_{name}_inserts AFTER INSERT ON inventory
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION inventory_{name}_changes();
+
+    DROP TRIGGER IF EXISTS inventory_{name}_updates ON inventory;
+    CREATE TRIGGER inventory_{name}_updates AFTER UPDATE ON inventory
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION inventory_{name}_changes();
+
+    DROP TRIGGER IF EXISTS inventory_{name}_deletes ON inventory;
+    CREATE TRIGGER inventory_{name}_deletes AFTER DELETE ON inventory
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION inventory_{name}_changes();
+"""
+
+
+def delta_triggers(name, apply_sql):
+    """The SQL (re)creating the ``inventory_{name}_*`` triggers running ``apply_sql``.
+
+    ``apply_sql`` refers to the changed rows as ``{source}``.
+    """
+    return _TRIGGERS.format(name=name, apply=apply_sql)
+
+
+def aggregate(aggregate_sql, source):
+    """``aggregate_sql`` over ``source``, inventory rows with a ``sign`` column."""
+    return aggregate_sql.replace("{source}", source)
+
+
+def rebuild(conn, table, aggregate_sql):
+    """Recomputes ``table`` from the whole inventory; the caller commits."""
+    cursor = conn.cursor()
+    # Writers wait until the rebuild commits instead of being lost in it
+    cursor.execute("LOCK TABLE inventory IN SHARE MODE")
+    cursor.execute(f"DELETE FROM {table}")
+    cursor.execute(f"INSERT INTO {table} " + aggregate(aggregate_sql, ALL_ROWS))
+
+
+def main(module, table, rebuild):
+    """The ``python -m <module> rebuild`` command of an aggregate module."""
+    from duda import db
+
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit(f"usage: python -m {module} rebuild")
+    with db.connection() as conn:
+        rebuild(conn)
+        conn.commit()
+    print(f"Rebuilt {table}")
@@ -0,0 +1,102 @@
+"""Diagnostics view of the in-process metrics.
+
+It is not listed in the navigation; open it at ``/?diagnostics``.  When
+``DUDA_DIAGNOSTICS_KEY``, or else the secrets' ``diagnostics_key``, is set
+the URL must carry it: ``/?diagnostics=<key>``.
+"""
+
+import os
+
+import pandas as pd
+import streamlit as st
+
+from duda import metrics
+
+DIAGNOSTICS_KEY = os.environ.get("DUDA_DIAGNOSTICS_KEY")
+
+
+def render():
+    key = _access_key()
+    if key and st.query_params.get("diagnostics") != key:
+        st.error("Nuk keni akses ne diagnostiken.")
+        return
+
+    st.header("Diagnostika")
+    rows = metrics.REGISTRY.summary()
+    if not rows:
+        st.info("Ky proces nuk ka matur ende asnje rerun.")
+        return
+
+    st.caption(
+        f"Percentilet llogariten mbi {metrics.WINDOW} matjet e fundit te cdo serie, "
+        "kohet jane ne milisekonda."
+    )
+    st.subheader("Fazat e rerun-it")
+    st.dataframe(
+        _timings(rows, "duda_phase_seconds", ["page", "phase"]),
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    st.subheader("Query-t sipas funksionit")
+    queries = _timings(rows, "duda_query_seconds", ["function"])
+    row_counts = {
+        row["labels"]["function"]: row
+        for row in rows
+        if row["metric"] == "duda_query_rows"
+    }
+    queries["rows_p50"] = queries["function"].map(lambda f: row_counts[f]["p50"])
+    queries["rows_total"] = queries["function"].map(lambda f: row_counts[f]["sum"])
+    st.dataframe(queries, hide_index=True, use_container_width=True)
+
+    st.subheader("Pritja per lidhje nga pool-i")
+    st.dataframe(
+        _timings(rows, "duda_pool_checkout_seconds", []),
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    st.subheader("Nisja e procesit")
+    st.dataframe(
+        _timings(rows, "duda_startup_seconds", ["step"]),
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    metrics.REGISTRY.write(force=True)
+    st.download_button(
+        "Shkarko metrikat (Prometheus)",
+        data=metrics.REGISTRY.prometheus_text(),
+        file_name="duda_metrics.prom",
+        mime="text/plain",
+    )
+
+
+def _access_key():
+    if DIAGNOSTICS_KEY:
+        return DIAGNOSTICS_KEY
+    try:
+        return st.secrets.get("diagnostics_key")
+    except FileNotFoundError:
+        # No secrets.toml at all, e.g. with the SQLite backend
+        return None
+
+
+def _timings(rows, metric, labels):
+    frame = pd.DataFrame(
+        [
+            {
+                **{label: row["labels"].get(label) for label in labels},
+                "count": row["count"],
+                "total_ms": row["sum"] * 1000,
+                "p50_ms": row["p50"] * 1000,
+                "p90_ms": row["p90"] * 1000,
+                "p99_ms": row["p99"] * 1000,
+                "max_ms": row["max"] * 1000,
+            }
+            for row in rows
+            if row["metric"] == metric
+        ],
+        columns=[*labels, "count", "total_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms"],
+    )
+    return frame.sort_values("total_ms", ascending=False)
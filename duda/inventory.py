@@ -0,0 +1,638 @@
+"""Inventory queries shared by the pages."""
+
+import io
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+import streamlit as st
+from pyarrow import csv as pa_csv
+
+from duda import metrics
+
+# Columns of every inventory frame handed to the pages, selected by name so
+# the physical column order of the table does not matter.
+COLUMNS = [
+    "id",
+    "Produkti",
+    "Cmim_shitje",
+    "Cmim_pound",
+    "Cmim_blerje",
+    "Description",
+    "magazinim",
+    "status_porosie",
+    "Porositesi",
+    "link",
+    "date_created",
+    "row_version",
+]
+
+# Arrow types the inventory is parsed into.  The low-cardinality text
+# columns become pandas categoricals, dates a datetime64 column and prices
+# float64, without going through Python tuples.
+ARROW_TYPES = {
+    "id": pa.int64(),
+    "Produkti": pa.dictionary(pa.int32(), pa.string()),
+    "Cmim_shitje": pa.float64(),
+    "Cmim_pound": pa.float64(),
+    "Cmim_blerje": pa.float64(),
+    "Description": pa.string(),
+    "magazinim": pa.dictionary(pa.int32(), pa.string()),
+    "status_porosie": pa.dictionary(pa.int32(), pa.string()),
+    "Porositesi": pa.string(),
+    "link": pa.string(),
+    "date_created": pa.date32(),
+    "row_version": pa.int64(),
+}
+CATEGORICAL_COLUMNS = ["Produkti", "magazinim", "status_porosie"]
+
+# Allowed values of the two selectbox columns of the editor.
+STATUSES = ["Pending", "Likujduar", "Dorezuar", "Anulluar", "Kthyer"]
+STORAGE_OPTIONS = ["Porosi e re", "Inventar"]
+
+# SQL type of every column the editor can write, used to type the VALUES
+# lists of bulk writes (a bare NULL would otherwise be read as text).
+EDITABLE_COLUMNS = {
+    "Produkti": "text",
+    "Cmim_shitje": "numeric",
+    "Cmim_pound": "numeric",
+    "Cmim_blerje": "numeric",
+    "Description": "text",
+    "magazinim": "text",
+    "status_porosie": "text",
+    "Porositesi": "text",
+    "link": "text",
+    "date_created": "date",
+}
+
+# Keys the editor can be paged on.  Dates are not unique, so date paging
+# uses the (date_created, id) pair as its cursor.
+SORT_KEYS = ("id", "date_created")
+
+# Delta fetches re-read this much history before the watermark, so rows
+# written by transactions still open while the last fetch ran are not missed.
+WATERMARK_OVERLAP = timedelta(minutes=2)
+
+# Deletions are logged this long; older snapshots are reloaded in full.
+DELETION_RETENTION = timedelta(days=7)
+
+
+def load_data(conn):
+    """Loads the inventory data from the database."""
+    try:
+        return read_frame(conn, f"SELECT {', '.join(COLUMNS)} FROM inventory ORDER BY id")
+    except psycopg2.Error:
+        return None
+
+
+def load_page(conn, sort_key="id", after=None, page_size=100, date_from=None, date_to=None):
+    """Loads one keyset page of inventory rows.
+
+    ``after`` is the cursor of the previous page, ``None`` for the first one.
+    Returns the page and the cursor of the next page, which is ``None`` when
+    this is the last page.
+    """
+    query, params = page_query(sort_key, after, page_size, date_from, date_to)
+    return split_page(read_frame(conn, query, params), sort_key, page_size)
+
+
+def page_query(sort_key, after, page_size, date_from=None, date_to=None, placeholder="%s"):
+    """The SQL and parameters of one keyset page, for Postgres or SQLite.
+
+    Selects ``page_size + 1`` rows: the extra one tells ``split_page``
+    whether there is a next page.  Orders without a date come after all the
+    others on both backends; their date cursors hold ``None``.
+    """
+    if sort_key not in SORT_KEYS:
+        raise ValueError(f"Cannot page inventory on {sort_key!r}")
+
+    limit = page_size + 1
+    conditions, params = [], []
+    if date_from is not None:
+        conditions.append(f"date_created >= {placeholder}")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append(f"date_created <= {placeholder}")
+        params.append(date_to)
+
+    if sort_key == "id":
+        if after is not None:
+            conditions.append(f"id > {placeholder}")
+            params.append(after)
+        return _page_select(conditions, "id", placeholder), [*params, limit]
+    if after is None:
+        order_by = "date_created NULLS LAST, id"
+        return _page_select(conditions, order_by, placeholder), [*params, limit]
+
+    day, row_id = after
+    if day is None:
+        # Past the dated orders, only undated ones are left
+        conditions += ["date_created IS NULL", f"id > {placeholder}"]
+        return _page_select(conditions, "id", placeholder), [*params, row_id, limit]
+    conditions.append(f"(date_created, id) > ({placeholder}, {placeholder})")
+    dated = _page_select(conditions, "date_created, id", placeholder)
+    params += [day, row_id, limit]
+    if date_from is not None or date_to is not None:
+        return dated, params
+    # A row comparison with NULL is never true, so the undated orders that
+    # follow the dated ones are read on their own; both parts use the
+    # (date_created, id) index.
+    undated = _page_select(["date_created IS NULL"], "id", placeholder)
+    return (
+        f"""
+        SELECT * FROM ({dated}) AS dated
+        UNION ALL
+        SELECT * FROM ({undated}) AS undated
+        ORDER BY date_created NULLS LAST, id
+        LIMIT {placeholder}
+        """,
+        [*params, limit, limit],
+    )
+
+
+def _page_select(conditions, order_by, placeholder):
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"""
+        SELECT {', '.join(COLUMNS)}
+        FROM inventory
+        {where}
+        ORDER BY {order_by}
+        LIMIT {placeholder}
+    """
+
+
+def split_page(frame, sort_key, page_size):
+    """The page and next cursor of a frame selected by ``page_query``."""
+    next_cursor = None
+    if len(frame) > page_size:
+        last = frame.iloc[page_size - 1]
+        if sort_key == "id":
+            next_cursor = int(last["id"])
+        else:
+            day = last["date_created"]
+            next_cursor = (None if pd.isna(day) else day.date(), int(last["id"]))
+
+    return frame.iloc[:page_size], next_cursor
+
+
+def load_filtered(conn, date_from, date_to, statuses=(), products=(), client=None):
+    """Loads the orders of the days from ``date_from`` to ``date_to``.
+
+    Empty ``statuses`` and ``products`` match every value; ``client`` matches
+    any customer name containing it, case-insensitively.  The date range is
+    served by the ``(date_created, id)`` index.
+    """
+    return read_frame(conn, *filtered_query(date_from, date_to, statuses, products, client))
+
+
+def filtered_query(
+    date_from,
+    date_to,
+    statuses=(),
+    products=(),
+    client=None,
+    placeholder="%s",
+    columns=COLUMNS,
+):
+    """The SQL and parameters of ``load_filtered``, for Postgres or SQLite.
+
+    ``columns`` are the ones selected, e.g. a file export's.
+    """
+
+    def any_of(values):
+        return f"({', '.join([placeholder] * len(values))})"
+
+    conditions = [f"date_created BETWEEN {placeholder} AND {placeholder}"]
+    params = [date_from, date_to]
+    if statuses:
+        conditions.append(f"status_porosie IN {any_of(statuses)}")
+        params.extend(statuses)
+    if products:
+        conditions.append(f"Produkti IN {any_of(products)}")
+        params.extend(products)
+    if client:
+        # SQLite has no ILIKE; LOWER folds case as each database's ILIKE or LIKE does
+        conditions.append(f"LOWER(Porositesi) LIKE LOWER({placeholder}) ESCAPE '\\'")
+        params.append(f"%{escape_like(client)}%")
+
+    return (
+        f"""
+        SELECT {', '.join(columns)}
+        FROM inventory
+        WHERE {' AND '.join(conditions)}
+        ORDER BY date_created, id
+        """,
+        params,
+    )
+
+
+def watermark(conn):
+    """The last write time, row count and last deletion of the inventory.
+
+    A few index lookups and a count, no row is read into Python.  A write
+    moves at least one of them, except one committing after a later-started
+    write with a newer ``updated_at``; the change listener has no such gap.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT
+            (SELECT max(updated_at) FROM inventory),
+            (SELECT count(*) FROM inventory),
+            (SELECT max(deleted_at) FROM inventory_deletions)
+        """
+    )
+    return cursor.fetchone()
+
+
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@metrics.passthrough
+def read_frame(conn, query, params=None):
+    """Runs an inventory query and parses its rows straight into typed columns.
+
+    The query must select ``COLUMNS`` in order.  Rows are streamed out with
+    COPY and parsed by Arrow, so no Python object is built per cell.
+    """
+    types = ARROW_TYPES
+    cursor = conn.cursor()
+    if params is not None:
+        query = cursor.mogrify(query, params).decode()
+
+    buffer = io.BytesIO()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buffer)
+    if not buffer.tell():
+        table = pa.schema(types).empty_table()
+    else:
+        buffer.seek(0)
+        table = pa_csv.read_csv(
+            buffer,
+            read_options=pa_csv.ReadOptions(column_names=list(types)),
+            # Text values may span lines, e.g. an imported Description
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=types,
+                # COPY writes NULL unquoted and the empty string as ""
+                null_values=[""],
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+            ),
+        )
+    return table.to_pandas(date_as_object=False)
+
+
+def frame_from_rows(rows):
+    """Builds the typed inventory frame of rows holding ``COLUMNS`` in order.
+
+    For sources other than Postgres; the frame has the same dtypes as the
+    ones ``read_frame`` parses.
+    """
+    columns = list(zip(*rows)) or [()] * len(ARROW_TYPES)
+    table = pa.table(
+        {
+            name: pa.array(values, type=type_)
+            for (name, type_), values in zip(ARROW_TYPES.items(), columns)
+        }
+    )
+    return table.to_pandas(date_as_object=False)
+
+
+def editor_frame(df, product_names):
+    """The frame to hand to the data editor, without ids and row versions.
+
+    The categorical columns get every value the editor's selectboxes offer,
+    so picking one that is not in the data yet is a valid edit.
+    """
+    options = {
+        "Produkti": product_names,
+        "magazinim": STORAGE_OPTIONS,
+        "status_porosie": STATUSES,
+    }
+    df = df.drop(columns=["id", "row_version"])
+    for column, values in options.items():
+        categories = df[column].cat.categories
+        missing = [v for v in values if v is not None and v not in categories]
+        df[column] = df[column].cat.add_categories(missing)
+    return df
+
+
+def with_pending(df, pending):
+    """``df`` with the saves still on their way laid over it, for display.
+
+    ``pending`` holds ``resolve_changes`` results.  Edited rows show their
+    new cells, deleted rows stay until the delete lands and added rows are
+    appended; the ``pending`` column marks all of them.
+    """
+    edits = defaultdict(dict)
+    deleted = set()
+    added = []
+    for resolved in pending:
+        for row_id, _, delta in resolved["edited"]:
+            edits[row_id].update(delta)
+        deleted.update(row_id for row_id, _ in resolved["deleted"])
+        added.extend(resolved["added"])
+
+    df = df.copy()
+    df["pending"] = None
+    for column in CATEGORICAL_COLUMNS:
+        values = {delta[column] for delta in edits.values() if column in delta}
+        missing = [v for v in values - {None} if v not in df[column].cat.categories]
+        df[column] = df[column].cat.add_categories(missing)
+    for row_id, delta in edits.items():
+        row = df["id"] == row_id
+        for column, value in delta.items():
+            if column == "date_created":
+                value = pd.Timestamp(value) if value is not None else pd.NaT
+            df.loc[row, column] = value
+        df.loc[row, "pending"] = "Ndryshim"
+    df.loc[df["id"].isin(deleted), "pending"] = "Fshirje"
+    if not added:
+        return df
+
+    def typed(values):
+        day = values.get("date_created")
+        values = {**values, "date_created": pd.Timestamp(day).date() if day else None}
+        return [values.get(column) for column in COLUMNS]
+
+    new_rows = frame_from_rows([typed(values) for values in added])
+    return concat_frames([df, new_rows.assign(pending="Shtim")])
+
+
+def save_changes(conn, df, changes):
+    """Writes the data editor's changes, skipping rows changed meanwhile.
+
+    ``df`` is the frame the editor was showing, the positions in
+    ``edited_rows`` and ``deleted_rows`` refer to its rows.  See
+    ``resolve_changes`` and ``apply_changes``.
+    """
+    return apply_changes(conn, resolve_changes(df, changes))
+
+
+def resolve_changes(df, changes):
+    """Turns the editor's positional changes into row ids and versions.
+
+    The result only holds JSON types, so it can be queued and applied later:
+    ``edited`` lists ``[id, row_version, cells]``, ``deleted`` lists
+    ``[id, row_version]`` and ``added`` the new rows.
+    """
+    # Row by row, df.iloc would build a Series per changed row
+    ids, versions = df["id"].to_numpy(), df["row_version"].to_numpy()
+    deleted = [[int(ids[i]), int(versions[i])] for i in changes["deleted_rows"]]
+    deleted_ids = {row_id for row_id, _ in deleted}
+    edited = []
+    for i, delta in changes["edited_rows"].items():
+        row_id = int(ids[i])
+        delta = {c: v for c, v in delta.items() if c in EDITABLE_COLUMNS}
+        if delta and row_id not in deleted_ids:
+            edited.append([row_id, int(versions[i]), delta])
+    return {"edited": edited, "deleted": deleted, "added": list(changes["added_rows"])}
+
+
+def apply_changes(conn, resolved):
+    """Writes changes from ``resolve_changes``, skipping rows changed meanwhile.
+
+    An edit or delete only applies while the row still has the row_version
+    the editor showed, so a concurrent save is never overwritten.  Edits only
+    set the cells that changed; all writes go out as one statement.  Nothing
+    is committed, the caller owns the transaction.
+
+    Returns the rows that were not written, as dicts with their ``id``, the
+    ``change`` attempted (the edited cells, ``None`` for a delete) and the
+    ``status`` the row was found in: ``"changed"`` or ``"deleted"``.
+    """
+    edited = {row_id: (version, delta) for row_id, version, delta in resolved["edited"]}
+    deleted = dict(resolved["deleted"])
+    added = resolved["added"]
+    if not (edited or deleted or added):
+        return []
+
+    cursor = conn.cursor()
+    results = _write(cursor, edited, deleted, added)
+    existing = {row_id for kind, row_id in results if kind == "old"}
+    written = {(kind, row_id) for kind, row_id in results if kind != "old"}
+    if deleted:
+        cursor.execute(_PRUNE_DELETIONS, (DELETION_RETENTION,))
+
+    conflicts = [
+        (row_id, delta)
+        for row_id, (_, delta) in edited.items()
+        if ("edit", row_id) not in written
+    ]
+    conflicts += [
+        (row_id, None) for row_id in deleted if ("delete", row_id) not in written
+    ]
+    return [
+        {
+            "id": row_id,
+            "change": change,
+            "status": "changed" if row_id in existing else "deleted",
+        }
+        for row_id, change in conflicts
+    ]
+
+
+def _write(cursor, edited, deleted, added):
+    # One statement of data-modifying CTEs.  "old" reads the rows before the
+    # writes, to tell changed from deleted rows.
+    ctes = [
+        (
+            "old",
+            cursor.mogrify(
+                "SELECT id FROM inventory WHERE id = ANY(%s)",
+                ([*edited, *deleted],),
+            ),
+        )
+    ]
+    selects = [b"SELECT 'old', id FROM old"]
+    for n, statement in enumerate(_update_statements(cursor, edited)):
+        ctes.append((f"edit{n}", statement + b" RETURNING t.id"))
+        selects.append(f"SELECT 'edit', id FROM edit{n}".encode())
+    if deleted:
+        ctes.append(
+            (
+                "removed",
+                b"DELETE FROM inventory AS t USING (VALUES "
+                + _values(cursor, ["integer", "integer"], deleted.items())
+                + b") AS v(id, row_version)"
+                b" WHERE t.id = v.id AND t.row_version = v.row_version"
+                b" RETURNING t.id",
+            )
+        )
+        selects.append(b"SELECT 'delete', id FROM removed")
+    if added:
+        ctes.append(
+            (
+                "inserted",
+                _insert_statement(cursor, added) + b" RETURNING id",
+            )
+        )
+        selects.append(b"SELECT 'insert', id FROM inserted")
+
+    cursor.execute(
+        b"WITH "
+        + b",\n".join(name.encode() + b" AS (" + sql + b")" for name, sql in ctes)
+        + b"\n"
+        + b"\nUNION ALL ".join(selects)
+    )
+    return cursor.fetchall()
+
+
+def _update_statements(cursor, edited):
+    # One UPDATE ... FROM (VALUES ...) per distinct set of changed columns,
+    # each row only matching while it still has the version the editor showed
+    by_columns = defaultdict(list)
+    for row_id, (version, delta) in edited.items():
+        columns = tuple(column for column in EDITABLE_COLUMNS if column in delta)
+        by_columns[columns].append((row_id, version, *(delta[c] for c in columns)))
+
+    statements = []
+    for columns, rows in by_columns.items():
+        assignments = ", ".join(f"{column} = v.{column}" for column in columns)
+        types = ["integer", "integer", *(EDITABLE_COLUMNS[c] for c in columns)]
+        statements.append(
+            f"UPDATE inventory AS t SET {assignments} FROM (VALUES ".encode()
+            + _values(cursor, types, rows)
+            + f") AS v(id, row_version, {', '.join(columns)})".encode()
+            + b" WHERE t.id = v.id AND t.row_version = v.row_version"
+        )
+    return statements
+
+
+def _insert_statement(cursor, added):
+    columns = list(EDITABLE_COLUMNS)
+    rows = [tuple(row.get(column) for column in columns) for row in added]
+    return (
+        f"INSERT INTO inventory ({', '.join(columns)}) VALUES ".encode()
+        + _values(cursor, EDITABLE_COLUMNS.values(), rows)
+    )
+
+
+def _values(cursor, types, rows):
+    template = "(" + ", ".join(f"%s::{sql_type}" for sql_type in types) + ")"
+    return b", ".join(cursor.mogrify(template, row) for row in rows)
+
+
+_PRUNE_DELETIONS = "DELETE FROM inventory_deletions WHERE deleted_at < now() - %s"
+
+
+def prune_deletions(conn):
+    """Drops deletion log entries no snapshot can still need."""
+    cursor = conn.cursor()
+    cursor.execute(_PRUNE_DELETIONS, (DELETION_RETENTION,))
+
+
+class InventorySnapshot:
+    """In-memory copy of the inventory, kept current with delta fetches.
+
+    The frame is shared by every session of the process, so callers must
+    treat it as read-only.  ``version`` goes up whenever the frame changes,
+    so caches of query results can key on it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.frame = None
+        self.watermark = None
+        self.version = 0
+        self._versions = set()
+
+    def refresh(self, conn):
+        """Merges rows changed since the last refresh and returns the frame."""
+        with self._lock:
+            cursor = conn.cursor()
+            cursor.execute("SELECT now()")
+            fetched_at = cursor.fetchone()[0]
+
+            if self.frame is None or fetched_at - self.watermark > DELETION_RETENTION:
+                frame = load_data(conn)
+                if frame is None:
+                    return self.frame
+                self.frame = frame
+                self.version += 1
+                self._versions = set()
+            else:
+                self._merge_changes(conn, self.watermark - WATERMARK_OVERLAP)
+
+            self.watermark = fetched_at
+            conn.commit()
+            return self.frame
+
+    def replace(self, frame, watermark):
+        """Swaps in a whole new frame, for sources without delta fetches."""
+        with self._lock:
+            self.frame = frame
+            self.watermark = watermark
+            self.version += 1
+            self._versions = set()
+
+    def merge(self, changed, deleted_ids, watermark):
+        """Merges changed rows and drops deleted ones, for sources finding them."""
+        with self._lock:
+            self._apply(changed, deleted_ids)
+            self.watermark = watermark
+
+    def _merge_changes(self, conn, since):
+        changed = read_frame(
+            conn,
+            f"""
+            SELECT {', '.join(COLUMNS)}
+            FROM inventory
+            WHERE updated_at > %s
+            """,
+            (since,),
+        )
+        # The overlap window returns the same versions on consecutive
+        # refreshes, only merge the ones not seen last time.
+        versions = list(zip(changed["id"], changed["row_version"]))
+        fresh = [version not in self._versions for version in versions]
+        changed = changed.loc[fresh]
+        self._versions = set(versions)
+
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT DISTINCT id FROM inventory_deletions WHERE deleted_at > %s",
+            (since,),
+        )
+        self._apply(changed, [row[0] for row in cursor.fetchall()])
+
+    def _apply(self, changed, deleted_ids):
+        stale = self.frame["id"].isin(changed["id"]) | self.frame["id"].isin(deleted_ids)
+        if changed.empty and not stale.any():
+            return
+        self.frame = (
+            concat_frames([self.frame[~stale], changed])
+            .sort_values("id")
+            .reset_index(drop=True)
+        )
+        self.version += 1
+
+
+@st.cache_resource(show_spinner=False)
+def get_snapshot():
+    """The process-wide inventory snapshot."""
+    return InventorySnapshot()
+
+
+def concat_frames(frames):
+    """Concatenates inventory frames without losing the categorical dtypes.
+
+    ``pd.concat`` falls back to object columns when categories differ, so
+    every frame first gets the union of the categories.
+    """
+    frames = list(frames)
+    for column in CATEGORICAL_COLUMNS:
+        categories = list(
+            dict.fromkeys(
+                category for frame in frames for category in frame[column].cat.categories
+            )
+        )
+        frames = [
+            frame.assign(**{column: frame[column].cat.set_categories(categories)})
+            for frame in frames
+        ]
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,254 @@
+"""Write-behind journal of inventory saves.
+
+SAVE appends the resolved changes to a local SQLite journal and returns; a
+background worker flushes the journal to Postgres in batches, retrying with
+backoff while the database is slow or unreachable.  Every entry carries an
+idempotency key recorded in ``applied_saves`` with its result, in the same
+transaction as its writes, so an entry flushed twice (e.g. the commit went
+through but the journal was not updated) is applied once and keeps its result.
+
+The journal lives in ``DUDA_JOURNAL_FILE`` (``duda_journal.sqlite3`` by
+default).  It survives restarts of the process, not the loss of its disk.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+
+import psycopg2
+import streamlit as st
+from psycopg2 import pool
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from duda import db, inventory, metrics
+
+JOURNAL_FILE = os.environ.get("DUDA_JOURNAL_FILE", "duda_journal.sqlite3")
+
+# Entries flushed together, in one Postgres transaction.
+BATCH_SIZE = 50
+
+# The worker also wakes up this often, to retry after failures.
+POLL_SECONDS = 5
+
+# Finished entries are kept this long for the pages to pick up their result.
+RESULT_RETENTION_SECONDS = 3600
+
+# Idempotency keys are kept in Postgres far longer than any entry can wait.
+_PRUNE_KEYS = "DELETE FROM applied_saves WHERE applied_at < now() - interval '30 days'"
+
+# Errors worth retrying: the database is down, slow or the pool exhausted.
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, pool.PoolError)
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pending_saves (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL UNIQUE,
+        created_at REAL NOT NULL,
+        changes TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT
+    );
+    CREATE TABLE IF NOT EXISTS finished_saves (
+        key TEXT PRIMARY KEY,
+        finished_at REAL NOT NULL,
+        conflicts TEXT,
+        error TEXT
+    );
+"""
+
+
+class Journal:
+    """The SQLite journal and the worker thread flushing it."""
+
+    def __init__(self, path, db_pool):
+        self.path = path
+        # The worker has no Streamlit script context to reach the cached pool
+        self._db_pool = db_pool
+        self._wake = threading.Event()
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        self._worker = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._worker.start()
+
+    def append(self, changes):
+        """Journals resolved changes for the worker and returns their key."""
+        key = str(uuid.uuid4())
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO pending_saves (key, created_at, changes) VALUES (?, ?, ?)",
+                (key, time.time(), json.dumps(changes, default=str)),
+            )
+        self._wake.set()
+        return key
+
+    def pending(self):
+        """Number of saves not flushed yet, and the last error seen flushing."""
+        with closing(self._connect()) as conn:
+            count, last_error = conn.execute(
+                """
+                SELECT COUNT(*),
+                    (SELECT last_error FROM pending_saves ORDER BY seq LIMIT 1)
+                FROM pending_saves
+                """
+            ).fetchone()
+        return count, last_error
+
+    def results(self, keys):
+        """Results of the finished saves among ``keys``, by key.
+
+        Each result is a dict with the save's ``conflicts`` (see
+        ``inventory.apply_changes``) and its ``error``, if it was rejected.
+        """
+        if not keys:
+            return {}
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"""
+                SELECT key, conflicts, error FROM finished_saves
+                WHERE key IN ({', '.join('?' * len(keys))})
+                """,
+                list(keys),
+            ).fetchall()
+        return {
+            key: {"conflicts": json.loads(conflicts), "error": error}
+            for key, conflicts, error in rows
+        }
+
+    def flush(self):
+        """Flushes the pending saves, returns how many were flushed."""
+        flushed = 0
+        while True:
+            with closing(self._connect()) as conn:
+                batch = conn.execute(
+                    "SELECT seq, key, changes FROM pending_saves ORDER BY seq LIMIT ?",
+                    (BATCH_SIZE,),
+                ).fetchall()
+            if not batch:
+                return flushed
+            start = time.perf_counter()
+            try:
+                results = self._apply_with_retry(batch)
+            except TRANSIENT_ERRORS as e:
+                self._record_failure(batch, e)
+                raise
+            metrics.REGISTRY.observe(
+                "duda_journal_flush_seconds", time.perf_counter() - start
+            )
+            self._finish(results)
+            flushed += len(batch)
+
+    @retry(
+        retry=retry_if_exception_type(TRANSIENT_ERRORS),
+        wait=wait_exponential(multiplier=0.5, max=30),
+        stop=stop_after_attempt(5),
+        reraise=True,
+    )
+    def _apply_with_retry(self, batch):
+        with db.connection(self._db_pool) as conn:
+            try:
+                results = [self._apply(conn, key, changes) for _, key, changes in batch]
+                conn.cursor().execute(_PRUNE_KEYS)
+                conn.commit()
+                return results
+            except TRANSIENT_ERRORS:
+                raise
+            except psycopg2.Error:
+                conn.rollback()
+            # A save the database rejects must not hold back the others: apply
+            # the batch one save per transaction.  Each result is committed
+            # with its key, so a retry of the batch reads back the saves this
+            # loop already applied.
+            return [self._apply_alone(conn, key, changes) for _, key, changes in batch]
+
+    def _apply_alone(self, conn, key, changes):
+        try:
+            result = self._apply(conn, key, changes)
+            conn.commit()
+            return result
+        except TRANSIENT_ERRORS:
+            raise
+        except psycopg2.Error as e:
+            conn.rollback()
+            conn.cursor().execute(
+                "INSERT INTO applied_saves (key, error) VALUES (%s, %s)", (key, str(e))
+            )
+            conn.commit()
+            return key, None, str(e)
+
+    def _apply(self, conn, key, changes):
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO applied_saves (key) VALUES (%s) ON CONFLICT DO NOTHING", (key,)
+        )
+        if not cursor.rowcount:
+            # Applied by an earlier flush whose result was not journaled
+            cursor.execute(
+                "SELECT conflicts, error FROM applied_saves WHERE key = %s", (key,)
+            )
+            conflicts, error = cursor.fetchone()
+            return key, conflicts, error
+        conflicts = inventory.apply_changes(conn, json.loads(changes))
+        cursor.execute(
+            "UPDATE applied_saves SET conflicts = %s WHERE key = %s",
+            (json.dumps(conflicts, default=str), key),
+        )
+        return key, conflicts, None
+
+    def _finish(self, results):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO finished_saves VALUES (?, ?, ?, ?)",
+                [
+                    (key, now, json.dumps(conflicts or [], default=str), error)
+                    for key, conflicts, error in results
+                ],
+            )
+            conn.executemany(
+                "DELETE FROM pending_saves WHERE key = ?",
+                [(key,) for key, _, _ in results],
+            )
+            conn.execute(
+                "DELETE FROM finished_saves WHERE finished_at < ?",
+                (now - RESULT_RETENTION_SECONDS,),
+            )
+
+    def _record_failure(self, batch, error):
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                """
+                UPDATE pending_saves SET attempts = attempts + 1, last_error = ?
+                WHERE seq = ?
+                """,
+                [(str(error), seq) for seq, _, _ in batch],
+            )
+
+    def _run(self):
+        while True:
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Still journaled, the next wake-up tries again
+                print(f"Journal flush failed: {e!r}", file=sys.stderr)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+
+@st.cache_resource(show_spinner=False)
+def get_journal():
+    """The process-wide journal, started on first use."""
+    return Journal(JOURNAL_FILE, db.get_pool())
@@ -0,0 +1,238 @@
+"""In-process timings of page reruns and database queries.
+
+Samples are kept in a process-wide registry that the diagnostics view
+(``main.py?diagnostics``) summarises as percentiles.  The registry is also
+written as Prometheus text to ``DUDA_METRICS_FILE`` (``duda_metrics.prom``
+by default), e.g. for node_exporter's textfile collector.
+"""
+
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+
+from psycopg2 import extensions
+
+METRICS_FILE = os.environ.get("DUDA_METRICS_FILE", "duda_metrics.prom")
+
+# Samples kept per series for the percentiles; counts and sums are all-time.
+WINDOW = 1000
+
+# The metrics file is rewritten at most this often.
+WRITE_INTERVAL_SECONDS = 15
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+HELP = {
+    "duda_phase_seconds": "Time spent in each phase of a page rerun.",
+    "duda_query_seconds": "Time spent executing queries, by calling function.",
+    "duda_query_rows": "Rows returned or affected by queries, by calling function.",
+    "duda_pool_checkout_seconds": "Time spent waiting for a pooled connection.",
+    "duda_journal_flush_seconds": "Time spent flushing a batch of journaled saves.",
+    "duda_startup_seconds": "Warmup steps and the time to the first finished rerun.",
+}
+
+
+class _Series:
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.count = 0
+        self.total = 0.0
+
+
+class Registry:
+    """Thread-safe store of observed values, keyed by metric and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = defaultdict(_Series)
+        self._written_at = 0.0
+
+    def observe(self, metric, value, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._series[key]
+            series.samples.append(value)
+            series.count += 1
+            series.total += value
+
+    def summary(self):
+        """One dict per series with its labels, count, sum and percentiles."""
+        with self._lock:
+            items = [
+                (metric, labels, sorted(series.samples), series.count, series.total)
+                for (metric, labels), series in self._series.items()
+            ]
+        return [
+            {
+                "metric": metric,
+                "labels": dict(labels),
+                "count": count,
+                "sum": total,
+                **{f"p{round(q * 100)}": _quantile(samples, q) for q in QUANTILES},
+                "max": samples[-1],
+            }
+            for metric, labels, samples, count, total in items
+        ]
+
+    def prometheus_text(self):
+        lines = []
+        rows = sorted(self.summary(), key=lambda row: row["metric"])
+        for metric in dict.fromkeys(row["metric"] for row in rows):
+            lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {metric} summary")
+            for row in rows:
+                if row["metric"] != metric:
+                    continue
+                labels = row["labels"]
+                for q in QUANTILES:
+                    value = row[f"p{round(q * 100)}"]
+                    lines.append(f"{metric}{_labels(labels, quantile=q)} {value}")
+                lines.append(f"{metric}_sum{_labels(labels)} {row['sum']}")
+                lines.append(f"{metric}_count{_labels(labels)} {row['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=METRICS_FILE, force=False):
+        """Rewrites the metrics file atomically, at most every few seconds."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._written_at < WRITE_INTERVAL_SECONDS:
+                return
+            self._written_at = now
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as out:
+            out.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+
+
+class RerunTimer:
+    """Records the phases of one page rerun as consecutive laps.
+
+    ``lap(name)`` attributes the time since the previous lap to ``name``,
+    ``finish()`` records the whole rerun and refreshes the metrics file.  The
+    first rerun to finish in the process also records the time since start.
+    """
+
+    # Acquired once and never released: only the first rerun gets it
+    _first = threading.Lock()
+
+    def __init__(self, page):
+        self.page = page
+        self.started = self._last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        REGISTRY.observe("duda_phase_seconds", now - self._last, page=self.page, phase=phase)
+        self._last = now
+
+    def finish(self):
+        now = time.perf_counter()
+        REGISTRY.observe(
+            "duda_phase_seconds", now - self.started, page=self.page, phase="rerun"
+        )
+        if RerunTimer._first.acquire(blocking=False):
+            REGISTRY.observe(
+                "duda_startup_seconds",
+                time.time() - _process_started(),
+                step="first_render",
+            )
+        try:
+            REGISTRY.write()
+        except OSError:
+            pass
+
+
+# Code of the public helpers skipped when labelling statements.
+_PASSTHROUGH = set()
+
+
+def passthrough(fn):
+    """Marks a public query helper, so its statements are labelled with its caller.
+
+    For helpers like ``inventory.read_frame`` that run the queries of many
+    functions, which would otherwise all be counted under the helper's name.
+    """
+    _PASSTHROUGH.add(fn.__code__)
+    return fn
+
+
+class InstrumentedCursor(extensions.cursor):
+    """Cursor recording the duration and row count of every statement.
+
+    Statements are labelled with the name of the public function that ran
+    them, e.g. ``load_data`` or ``save_changes``; private ``_helpers`` and
+    ``passthrough`` helpers in between are skipped.
+    """
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(start)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            self._record(start)
+
+    def _record(self, start):
+        frame = sys._getframe(2)
+        while frame.f_back is not None and (
+            frame.f_code.co_name.startswith("_") or frame.f_code in _PASSTHROUGH
+        ):
+            frame = frame.f_back
+        function = frame.f_code.co_name
+        REGISTRY.observe(
+            "duda_query_seconds", time.perf_counter() - start, function=function
+        )
+        REGISTRY.observe("duda_query_rows", max(self.rowcount, 0), function=function)
+
+
+def _process_started():
+    """Wall-clock start of this process, read from /proc where available.
+
+    ``streamlit run`` imports no app code before the first visit, so the
+    import time of this module would miss the server's own startup.
+    """
+    try:
+        with open("/proc/self/stat") as stat:
+            # Field 22, counted after the parenthesised command name
+            ticks = int(stat.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as stat:
+            boot_time = next(
+                int(line.split()[1]) for line in stat if line.startswith("btime ")
+            )
+    except (OSError, ValueError, StopIteration):
+        return _IMPORTED_AT
+    return boot_time + ticks / os.sysconf("SC_CLK_TCK")
+
+
+_IMPORTED_AT = time.time()
+
+
+def _quantile(samples, q):
+    if not samples:
+        return math.nan
+    return samples[min(len(samples) - 1, math.ceil(q * len(samples)) - 1)]
+
+
+def _labels(labels, **extra):
+    pairs = {**labels, **extra}
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs.items()) + "}"
@@ -0,0 +1,238 @@
+"""Versioned schema migrations, applied once per process.
+
+Every migration runs in its own transaction and is recorded in the
+``schema_migrations`` table, so a database is only ever moved forward.  New
+schema changes are appended to ``MIGRATIONS`` with the next version number;
+released entries must never be edited.  To migrate without starting the app::
+
+    python -m duda.migrations
+"""
+
+import streamlit as st
+
+from duda import counters, customers, db, notifications, rollups, search
+
+# Any constant works, it only has to be the same for every app instance.
+_LOCK_KEY = 7_401_093
+
+# (version, description, step); a step is SQL or a callable taking the
+# connection.  Versions 1-3 are idempotent so they also adopt databases
+# created before migrations were tracked.
+MIGRATIONS = [
+    (
+        1,
+        "inventory and products tables",
+        """
+        CREATE TABLE IF NOT EXISTS inventory (
+            id SERIAL PRIMARY KEY,
+            Produkti TEXT,
+            Cmim_shitje FLOAT,
+            Cmim_blerje FLOAT,
+            Cmim_pound FLOAT,
+            Description TEXT,
+            magazinim TEXT,
+            status_porosie TEXT,
+            Porositesi TEXT,
+            link TEXT,
+            date_created DATE
+        );
+        CREATE TABLE IF NOT EXISTS products (
+            id SERIAL PRIMARY KEY,
+            Produkti TEXT
+        );
+        """,
+    ),
+    (
+        2,
+        "updated_at column and deletion log for delta fetches",
+        """
+        ALTER TABLE inventory
+            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        CREATE INDEX IF NOT EXISTS inventory_updated_at_idx ON inventory (updated_at);
+
+        CREATE TABLE IF NOT EXISTS inventory_deletions (
+            id INTEGER NOT NULL,
+            deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS inventory_deletions_deleted_at_idx
+            ON inventory_deletions (deleted_at);
+
+        CREATE OR REPLACE FUNCTION inventory_touch() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := now();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION inventory_log_deletion() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO inventory_deletions (id) VALUES (OLD.id);
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS inventory_touch ON inventory;
+        CREATE TRIGGER inventory_touch BEFORE UPDATE ON inventory
+            FOR EACH ROW EXECUTE FUNCTION inventory_touch();
+
+        DROP TRIGGER IF EXISTS inventory_log_deletion ON inventory;
+        CREATE TRIGGER inventory_log_deletion AFTER DELETE ON inventory
+            FOR EACH ROW EXECUTE FUNCTION inventory_log_deletion();
+        """,
+    ),
+    (
+        3,
+        "daily rollups behind the profit reports",
+        rollups.initialize,
+    ),
+    (
+        4,
+        "indexes for the date, status and product filters",
+        """
+        CREATE INDEX IF NOT EXISTS inventory_date_created_id_idx
+            ON inventory (date_created, id);
+        CREATE INDEX IF NOT EXISTS inventory_status_porosie_idx
+            ON inventory (status_porosie);
+        CREATE INDEX IF NOT EXISTS inventory_produkti_idx ON inventory (Produkti);
+        """,
+    ),
+    (
+        5,
+        "unique product names",
+        """
+        DELETE FROM products AS duplicate
+        USING products AS kept
+        WHERE duplicate.Produkti = kept.Produkti AND duplicate.id > kept.id;
+        ALTER TABLE products ADD CONSTRAINT products_produkti_key UNIQUE (Produkti);
+        """,
+    ),
+    (
+        6,
+        "exact prices and constrained status values",
+        # NOT VALID: new and edited rows are checked, legacy rows are left
+        # as they are until someone cleans them up and validates.
+        """
+        ALTER TABLE inventory
+            ALTER COLUMN Cmim_shitje TYPE NUMERIC(12, 2),
+            ALTER COLUMN Cmim_blerje TYPE NUMERIC(12, 2),
+            ALTER COLUMN Cmim_pound TYPE NUMERIC(12, 2);
+        ALTER TABLE inventory ADD CONSTRAINT inventory_status_porosie_check
+            CHECK (status_porosie IN ('Pending', 'Likujduar', 'Dorezuar', 'Anulluar', 'Kthyer'))
+            NOT VALID;
+        ALTER TABLE inventory ADD CONSTRAINT inventory_magazinim_check
+            CHECK (magazinim IN ('Porosi e re', 'Inventar'))
+            NOT VALID;
+        """,
+    ),
+    (
+        7,
+        "status and stock counters kept by triggers",
+        counters.initialize,
+    ),
+    (
+        8,
+        "row versions for optimistic concurrency",
+        """
+        ALTER TABLE inventory
+            ADD COLUMN IF NOT EXISTS row_version INTEGER NOT NULL DEFAULT 1;
+
+        CREATE OR REPLACE FUNCTION inventory_touch() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := now();
+            NEW.row_version := OLD.row_version + 1;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+    ),
+    (
+        9,
+        "idempotency keys of journaled saves",
+        """
+        CREATE TABLE applied_saves (
+            key TEXT PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX applied_saves_applied_at_idx ON applied_saves (applied_at);
+        """,
+    ),
+    (
+        10,
+        "trigram index of the order search",
+        search.initialize,
+    ),
+    (
+        11,
+        "per-customer ledger kept by triggers",
+        customers.initialize,
+    ),
+    (
+        12,
+        "notify other app instances of inventory and product writes",
+        notifications.initialize,
+    ),
+    (
+        13,
+        "day rollups kept by triggers with exact sums",
+        rollups.install_triggers,
+    ),
+    (
+        14,
+        "results of journaled saves kept with their idempotency keys",
+        """
+        ALTER TABLE applied_saves ADD COLUMN conflicts JSONB, ADD COLUMN error TEXT;
+        """,
+    ),
+]
+
+
+def migrate(conn):
+    """Applies the pending migrations and returns their versions."""
+    cursor = conn.cursor()
+    # Instances starting together wait here instead of racing each other
+    cursor.execute("SELECT pg_advisory_lock(%s)", (_LOCK_KEY,))
+    try:
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """
+        )
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+        conn.commit()
+
+        pending = [m for m in MIGRATIONS if m[0] not in applied]
+        for version, description, step in pending:
+            if callable(step):
+                step(conn)
+            else:
+                cursor.execute(step)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (version, description),
+            )
+            conn.commit()
+        return [m[0] for m in pending]
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_KEY,))
+        conn.commit()
+
+
+@st.cache_resource(show_spinner=False)
+def ensure_schema():
+    """Migrates the database the first time any page of this process needs it."""
+    with db.connection() as conn:
+        return migrate(conn)
+
+
+if __name__ == "__main__":
+    with db.connection() as conn:
+        versions = migrate(conn)
+    print(f"Applied migrations: {versions or 'none'}")
@@ -0,0 +1,147 @@
+"""Change notifications between app instances through Postgres LISTEN/NOTIFY.
+
+Several instances behind a load balancer each cache what they read.
+Statement triggers on ``inventory`` and ``products`` (migration 12) notify
+``CHANNEL`` with the table's name whenever a write commits, whatever wrote
+it: a SAVE flushed by the journal, an import, a product added or deleted,
+or an edit made by hand.
+
+Every process runs one ``Listener`` on a connection of its own, outside
+the pool.  It counts the notifications per table in ``generations``;
+caches key on those counters the way they key on the snapshot version, so
+a write on any instance makes the next read on every instance miss.
+"""
+
+import select
+import sys
+import threading
+import time
+import uuid
+
+import psycopg2
+import streamlit as st
+
+from duda import db
+
+CHANNEL = "duda_changes"
+
+# The tables whose writes are notified.
+TABLES = ("inventory", "products")
+
+# How often the listener notifies itself a probe, and how long it waits for
+# it to come back before it reconnects, so a connection dropped without a
+# word is noticed.
+PING_SECONDS = 30
+
+# Pause before reconnecting after the listening connection failed.
+RECONNECT_SECONDS = 5
+
+_TRIGGERS = f"""
+    CREATE OR REPLACE FUNCTION duda_notify_change() RETURNS trigger AS $$
+    BEGIN
+        -- Sent on commit, once per transaction and table
+        PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+""" + "".join(
+    f"""
+    DROP TRIGGER IF EXISTS {table}_notify ON {table};
+    CREATE TRIGGER {table}_notify AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE
+        ON {table} FOR EACH STATEMENT EXECUTE FUNCTION duda_notify_change();
+    """
+    for table in TABLES
+)
+
+
+def initialize(conn):
+    """Installs the triggers notifying the writes."""
+    conn.cursor().execute(_TRIGGERS)
+
+
+class Listener:
+    """The thread listening on ``CHANNEL`` for the whole process.
+
+    ``generations`` moves on every notified write of a table, and for every
+    table once the listener is live again after (re)connecting, since writes
+    made while it was not listening were missed.  ``live`` is set once a
+    probe the listener notifies itself comes back; until then callers must
+    not trust the counters and read as they would without a listener.
+    """
+
+    def __init__(self, connect_args):
+        self._connect_args = connect_args
+        self._callbacks = []
+        # Told apart from the probes of the other instances
+        self._probe = f"probe {uuid.uuid4().hex}"
+        self.generations = dict.fromkeys(TABLES, 0)
+        self.live = False
+        self.last_error = None
+        self._worker = threading.Thread(target=self._run, name="listener", daemon=True)
+        self._worker.start()
+
+    def subscribe(self, callback):
+        """Calls ``callback(tables)`` from the listener thread after each change."""
+        self._callbacks.append(callback)
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Change listener failed: {e!r}", file=sys.stderr)
+            self.live = False
+            time.sleep(RECONNECT_SECONDS)
+
+    def _listen(self):
+        conn = psycopg2.connect(**self._connect_args)
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {CHANNEL}")
+            while True:
+                # Only our own probe coming back proves notifications arrive:
+                # a pooler in transaction mode accepts LISTEN and never delivers
+                cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, self._probe))
+                if not self._receive(conn, time.monotonic() + PING_SECONDS):
+                    raise psycopg2.OperationalError(
+                        f"No notification came back within {PING_SECONDS} seconds"
+                    )
+        finally:
+            conn.close()
+
+    def _receive(self, conn, deadline):
+        # Passes notifications on until the deadline, returns whether the
+        # probe came back meanwhile
+        probed = False
+        while (timeout := deadline - time.monotonic()) > 0:
+            # Notifications arriving with a query's results are already read
+            if not conn.notifies:
+                if not select.select([conn], [], [], timeout)[0]:
+                    continue
+                conn.poll()
+            payloads = {notify.payload for notify in conn.notifies}
+            conn.notifies.clear()
+            if self._probe in payloads and not probed:
+                probed = True
+                if not self.live:
+                    # Writes made while not listening were missed
+                    self._changed(TABLES)
+                    self.live, self.last_error = True, None
+            tables = payloads & set(TABLES)
+            if tables and self.live:
+                self._changed(tables)
+        return probed
+
+    def _changed(self, tables):
+        for table in tables:
+            self.generations[table] += 1
+        for callback in self._callbacks:
+            callback(tables)
+
+
+@st.cache_resource(show_spinner=False)
+def get_listener():
+    """The process-wide listener, started on first use."""
+    return Listener(db.connect_args())
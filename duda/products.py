@@ -0,0 +1,48 @@
+"""The product catalog, cached across reruns and sessions.
+
+Every page reads the catalog through ``catalog()``; the functions changing
+it clear the cache so the next read sees the change.  The cache is keyed on
+the repository's ``products`` generation, which changes made by other
+instances move.
+"""
+
+import time
+
+import streamlit as st
+
+from duda import repository
+
+# How often the catalog is read again while no generation is notified, so
+# changes made outside this process show up, e.g. by another instance.
+UNNOTIFIED_TTL_SECONDS = 300
+
+# Safety net for notifications lost on their way.
+CATALOG_TTL_SECONDS = 24 * 3600
+
+
+def catalog():
+    """Returns the product names in alphabetical order."""
+    generation = repository.get_repository().generation("products")
+    if generation is None:
+        generation = ("unnotified", int(time.time() // UNNOTIFIED_TTL_SECONDS))
+    return _catalog(generation)
+
+
+@st.cache_data(ttl=CATALOG_TTL_SECONDS, max_entries=4, show_spinner=False)
+def _catalog(generation):
+    return repository.get_repository().catalog()
+
+
+def add_products(names):
+    """Adds the new names in one statement and returns how many were new."""
+    names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+    if not names:
+        return 0
+    added = repository.get_repository().add_products(names)
+    _catalog.clear()
+    return added
+
+
+def delete_product(name):
+    repository.get_repository().delete_product(name)
+    _catalog.clear()
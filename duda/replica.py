@@ -0,0 +1,236 @@
+"""Optional local read replica of the inventory in SQLite.
+
+When ``DUDA_REPLICA_FILE`` names a file, a background thread copies the
+inventory and the product catalog from Postgres into it every few seconds
+(right after each write instead, while the change listener is live), and
+the pages read from the local copy instead of going over the network:
+the inventory pages, the filters, the counters and the profit reports.
+Writes still go to Postgres.
+
+Like the in-memory snapshot, the sync only fetches rows whose ``updated_at``
+moved past the last watermark, plus the ids logged in
+``inventory_deletions``.  The local counters and day rollup follow the
+copied rows through the SQLite triggers of the ``repository.SQLiteRepository``
+reading the copy, so the reports never scan the whole table.  While Postgres is unreachable
+the replica keeps serving the last synced state.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import streamlit as st
+
+from duda import customers, db, inventory, repository, search
+
+REPLICA_FILE = os.environ.get("DUDA_REPLICA_FILE")
+
+# Pause between two syncs of the background loop.
+SYNC_SECONDS = 2
+
+# The pause while the change listener wakes the loop on every write.
+LISTENING_SYNC_SECONDS = 60
+
+# How long a page waits for the sync that makes its own save visible.
+SYNC_WAIT_SECONDS = 5
+
+# Rows fetched from Postgres per round trip during a full copy.
+CHUNK_ROWS = 10000
+
+
+class Replica:
+    """The SQLite copy of Postgres and the thread keeping it in sync.
+
+    Reads come from the copy; writes go to ``primary`` and then wait for the
+    sync that brings them back, so the page that made them sees them.  Only
+    the sync writes to the copy, so the replica offers the methods of
+    ``repository.PostgresRepository`` and none of the SQLite writers.  The
+    thread has no Streamlit script context, so it is handed the pool.
+    """
+
+    def __init__(self, path, primary, db_pool, listener=None):
+        self._copy = repository.SQLiteRepository(path)
+        self.primary = primary
+        self._db_pool = db_pool
+        self._listener = listener
+        # The listener's generations the last sync started at
+        self._synced_generations = None
+        self._wake = threading.Event()
+        if listener is not None:
+            listener.subscribe(lambda tables: self._wake.set())
+        self._synced = threading.Condition()
+        self._syncs_started = self._syncs_done = 0
+        self.synced_at = None
+        self.last_error = None
+        self._worker = threading.Thread(target=self._run, name="replica", daemon=True)
+        self._worker.start()
+
+    def ready(self):
+        """Whether the copy was synced at least once, by this process or earlier."""
+        return self._copy.watermark() is not None
+
+    def wait_for_sync(self, timeout=SYNC_WAIT_SECONDS):
+        """Wakes the loop and waits for a sync that started after this call."""
+        with self._synced:
+            target = self._syncs_started + 1
+            self._wake.set()
+            self._synced.wait_for(lambda: self._syncs_done >= target, timeout)
+
+    def sync(self):
+        """Copies the changes since the last sync from Postgres."""
+        listener = self._listener
+        generations = dict(listener.generations) if listener and listener.live else None
+        with db.connection(self._db_pool) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT now()")
+            fetched_at = cursor.fetchone()[0]
+            cursor.execute("SELECT Produkti FROM products")
+            products = [row[0] for row in cursor.fetchall()]
+            # Only this thread writes the copy, its watermark cannot move meanwhile
+            watermark = self._copy.watermark()
+            if (
+                watermark is None
+                or fetched_at - watermark > inventory.DELETION_RETENTION
+            ):
+                self._copy.apply_full_copy(_all_rows(conn), products, fetched_at)
+            else:
+                since = watermark - inventory.WATERMARK_OVERLAP
+                self._copy.apply_delta(*_changes(conn, since), products, fetched_at)
+            conn.commit()
+        self._synced_generations = generations
+
+    def transaction(self):
+        return self._copy.transaction()
+
+    def ensure_schema(self):
+        try:
+            self.primary.ensure_schema()
+        except repository.ERRORS as e:
+            # The synced copy is still readable, the pages say it is not current
+            self.last_error = str(e)
+
+    def generation(self, table):
+        # Only writes the copy already has, so caches keyed on it see them
+        if self._synced_generations is None or not self._listener.live:
+            return None
+        return self._synced_generations[table]
+
+    def data_version(self):
+        # Moves with every sync that changed the copy
+        return self._copy.data_version()
+
+    def refresh_snapshot(self, snapshot):
+        # From the copy, only for the unpaged view that needs the whole frame
+        return self._copy.refresh_snapshot(snapshot)
+
+    def load_page(self, **kwargs):
+        return self._copy.load_page(**kwargs)
+
+    def load_filtered(self, *args):
+        return self._copy.load_filtered(*args)
+
+    def search(self, query, limit=search.LIMIT):
+        return self._copy.search(query, limit)
+
+    def counters(self):
+        return self._copy.counters()
+
+    def catalog(self):
+        return self._copy.catalog()
+
+    def add_products(self, names):
+        added = self.primary.add_products(names)
+        self.wait_for_sync()
+        return added
+
+    def delete_product(self, name):
+        self.primary.delete_product(name)
+        self.wait_for_sync()
+
+    def save(self, resolved):
+        return self.primary.save(resolved)
+
+    def save_results(self, keys):
+        results = self.primary.save_results(keys)
+        if results:
+            self.wait_for_sync()
+        return results
+
+    def pending_saves(self):
+        return self.primary.pending_saves()
+
+    def import_chunks(self, chunks, on_progress=None):
+        result = self.primary.import_chunks(chunks, on_progress)
+        self.wait_for_sync()
+        return result
+
+    def export_csv(self, out, date_from, date_to, statuses=(), products=(), client=None):
+        return self._copy.export_csv(out, date_from, date_to, statuses, products, client)
+
+    def daily_profit(self, status="Likujduar", date_from=None, date_to=None):
+        return self._copy.daily_profit(status, date_from, date_to)
+
+    def monthly_profit(self, status="Likujduar"):
+        return self._copy.monthly_profit(status)
+
+    def product_counts(self, date_from, date_to):
+        return self._copy.product_counts(date_from, date_to)
+
+    def customer_ledger(self, sort_key="revenue", after=None, page_size=customers.PAGE_SIZE):
+        return self._copy.customer_ledger(sort_key, after, page_size)
+
+    def _run(self):
+        while True:
+            with self._synced:
+                self._syncs_started += 1
+                started = self._syncs_started
+            try:
+                self.sync()
+                self.synced_at, self.last_error = time.time(), None
+            except Exception as e:
+                # The pages keep reading the last synced copy meanwhile
+                self.last_error = str(e)
+                print(f"Replica sync failed: {e!r}", file=sys.stderr)
+            with self._synced:
+                self._syncs_done = started
+                self._synced.notify_all()
+            listening = self._listener is not None and self._listener.live
+            self._wake.wait(LISTENING_SYNC_SECONDS if listening else SYNC_SECONDS)
+            self._wake.clear()
+
+
+def _all_rows(conn):
+    # A server-side cursor, so a full copy never holds the table in memory
+    cursor = conn.cursor(name="replica_copy")
+    cursor.execute(f"SELECT {', '.join(inventory.COLUMNS)} FROM inventory")
+    while rows := cursor.fetchmany(CHUNK_ROWS):
+        yield from rows
+    cursor.close()
+
+
+def _changes(conn, since):
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT {', '.join(inventory.COLUMNS)} FROM inventory WHERE updated_at > %s",
+        (since,),
+    )
+    changed = cursor.fetchall()
+    cursor.execute(
+        "SELECT DISTINCT id FROM inventory_deletions WHERE deleted_at > %s",
+        (since,),
+    )
+    return changed, [row[0] for row in cursor.fetchall()]
+
+
+@st.cache_resource(show_spinner=False)
+def get_replica():
+    """The process-wide replica, or ``None`` when no replica file is configured."""
+    if not REPLICA_FILE:
+        return None
+    return Replica(
+        REPLICA_FILE,
+        repository.get_primary(),
+        db.get_pool(),
+        repository.get_listener(),
+    )
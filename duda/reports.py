@@ -0,0 +1,305 @@
+"""Report tables and charts, precomputed in a background worker pool.
+
+Every report is built once per inventory version: a worker reads its
+rollups and derives the table, and the result is kept in a small LRU keyed
+by ``(version, report, arguments)``.  The page calls ``precompute()`` with
+the repository's data version on every rerun; after a save that bumps the
+version all tables are rebuilt concurrently, so switching between reports
+is a lookup.  The Plotly figure is only built, and Plotly only imported,
+once ``get()`` opens a report.
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from duda import customers, repository
+
+DAILY = "Raport Ditor Profit"
+MONTHLY = "Raport Mujor Profit"
+BY_PRODUCT = "Raport Sipas Produktit"
+BY_CUSTOMER = "Raport Sipas Klientit"
+
+# Results kept across versions and date ranges, least recently used first out.
+CACHE_ENTRIES = 16
+
+WORKERS = 3
+
+# Points per trace sent to the browser; longer series are downsampled with
+# LTTB, which keeps peaks and troughs that plain striding would drop.
+MAX_POINTS = 2000
+
+# From this many points on, traces render with WebGL instead of SVG.
+WEBGL_THRESHOLD = 500
+
+# Upper bound on the axis ticks, Plotly picks evenly spaced dates below it.
+MAX_TICKS = 12
+
+# ``next_cursor`` is set by the paged reports, ``None`` on their last page.
+Report = namedtuple("Report", ["table", "figure", "next_cursor"], defaults=[None])
+
+
+class ReportEngine:
+    """Builds reports on a thread pool and keeps the latest ones.
+
+    The workers have no Streamlit script context, so they are handed the
+    repositories to read from rather than calling ``get_repository()``: the
+    ``local`` replica once it has synced, ``primary`` otherwise.
+    """
+
+    def __init__(self, primary, local=None, workers=WORKERS, capacity=CACHE_ENTRIES):
+        self._primary = primary
+        self._local = local
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="reports")
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        # The opened reports, with their figures
+        self._opened = OrderedDict()
+
+    def precompute(self, version):
+        """Starts building every table of ``version`` that is not cached yet.
+
+        Returns the futures of the tables, without figures.
+        """
+        today = date.today()
+        return [
+            self._submit(key)
+            for key in [
+                (version, DAILY),
+                (version, MONTHLY),
+                (version, BY_PRODUCT, today, today),
+                # The top customers by revenue, the report's first page
+                (version, BY_CUSTOMER, "revenue", None, customers.PAGE_SIZE),
+            ]
+        ]
+
+    def get(self, version, report, *args):
+        """The report for ``version`` with its figure, built on first opening.
+
+        Waits for the table if it is still being built.
+        """
+        key = (version, report, *args)
+        with self._lock:
+            opened = self._opened.get(key)
+            if opened is not None:
+                self._opened.move_to_end(key)
+                return opened
+        future = self._submit(key)
+        try:
+            table = future.result()
+        except Exception:
+            # Do not keep the failure, the next rerun tries again
+            with self._lock:
+                if self._results.get(key) is future:
+                    del self._results[key]
+            raise
+        opened = table._replace(figure=FIGURES[report](table.table))
+        with self._lock:
+            self._opened[key] = opened
+            while len(self._opened) > self._capacity:
+                self._opened.popitem(last=False)
+        return opened
+
+    def _submit(self, key):
+        with self._lock:
+            future = self._results.get(key)
+            if future is None:
+                future = self._executor.submit(self._build, *key[1:])
+                self._results[key] = future
+                while len(self._results) > self._capacity:
+                    self._results.popitem(last=False)
+            else:
+                self._results.move_to_end(key)
+            return future
+
+    def _build(self, report, *args):
+        source = repository.choose(self._primary, self._local)
+        if report == DAILY:
+            data = source.daily_profit("Likujduar", *args)
+        elif report == MONTHLY:
+            data = source.monthly_profit(status="Likujduar")
+        elif report == BY_CUSTOMER:
+            data = source.customer_ledger(*args)
+        else:
+            data = source.product_counts(*args)
+        return TABLES[report](data)
+
+
+@st.cache_resource(show_spinner=False)
+def get_engine():
+    """The process-wide report engine."""
+    return ReportEngine(repository.get_primary(), repository.get_local())
+
+
+def daily_profit(data):
+    """The daily table; built with a date range it covers just those days."""
+    table = data.set_axis(["Dita", "Xhiro (ALL)", "Blerje (ALL)"], axis=1)
+    table["Difference"] = table["Xhiro (ALL)"] - table["Blerje (ALL)"]
+    return Report(table, None)
+
+
+def daily_figure(table):
+    return _profit_figure(table, "Dita", "%d %b %Y ", "plotly_white")
+
+
+def monthly_profit(data):
+    table = data.set_axis(["Muaji", "Xhiro (ALL)", "Blerje (ALL)"], axis=1)
+    table["Difference"] = table["Xhiro (ALL)"] - table["Blerje (ALL)"]
+    return Report(table, None)
+
+
+def monthly_figure(table):
+    return _profit_figure(table, "Muaji", "%b %Y", "plotly_dark")
+
+
+def product_counts(data):
+    return Report(data, None)
+
+
+def product_figure(data):
+    if data.empty:
+        return None
+
+    import plotly.graph_objs as go
+
+    fig = go.Figure(
+        data=[
+            go.Pie(
+                labels=data["Produkti"],
+                values=data["Count"],
+                hole=0.3,  # Creates a donut chart; set to 0 for a regular pie chart
+                textinfo="label+value",
+                insidetextorientation="radial",
+            )
+        ]
+    )
+    fig.update_layout(
+        annotations=[dict(text="Chart", x=0.5, y=0.5, font_size=25, showarrow=False)]
+    )
+    return fig.to_dict()
+
+
+def customer_ledger(data):
+    """One page of the customer ledger."""
+    ledger, next_cursor = data
+    table = ledger[
+        [
+            "Porositesi",
+            "order_count",
+            "paid_revenue",
+            "margin",
+            "pending_count",
+            "pending_amount",
+            "returned_count",
+            "cancelled_count",
+        ]
+    ].set_axis(
+        [
+            "Klienti",
+            "Porosi",
+            "Xhiro (ALL)",
+            "Fitimi (ALL)",
+            "Ne pritje",
+            "Balanca ne pritje (ALL)",
+            "Kthyer",
+            "Anulluar",
+        ],
+        axis=1,
+    )
+    return Report(table, None, next_cursor)
+
+
+def customer_figure(table):
+    """Paid revenue and margin of the page's customers."""
+    if table.empty:
+        return None
+
+    import plotly.graph_objs as go
+
+    fig = go.Figure(
+        data=[
+            go.Bar(name=column, x=table["Klienti"], y=table[column])
+            for column in ["Xhiro (ALL)", "Fitimi (ALL)"]
+        ]
+    )
+    fig.update_layout(barmode="group", yaxis_title="Vlerat", template="plotly_white")
+    return fig.to_dict()
+
+
+TABLES = {
+    DAILY: daily_profit,
+    MONTHLY: monthly_profit,
+    BY_PRODUCT: product_counts,
+    BY_CUSTOMER: customer_ledger,
+}
+
+FIGURES = {
+    DAILY: daily_figure,
+    MONTHLY: monthly_figure,
+    BY_PRODUCT: product_figure,
+    BY_CUSTOMER: customer_figure,
+}
+
+
+def _profit_figure(table, x_column, tickformat, template):
+    # Plotly is slow to import, only a rerun opening a report pays for it
+    import plotly.graph_objs as go
+
+    # Real dates give Plotly a date axis it can thin the ticks of
+    x = pd.to_datetime(table[x_column])
+    webgl = min(len(table), MAX_POINTS) >= WEBGL_THRESHOLD
+    trace = go.Scattergl if webgl else go.Scatter
+
+    fig = go.Figure()
+    for column in table.columns[1:]:  # Skip the first column for x-values
+        y = table[column].to_numpy(float)
+        keep = lttb(x.to_numpy(dtype="int64"), y, MAX_POINTS)
+        fig.add_trace(
+            trace(
+                x=x.iloc[keep],
+                y=y[keep],
+                mode="lines" if webgl else "lines+markers",
+                name=column,
+            )
+        )
+    fig.update_layout(
+        xaxis_title=x_column,
+        yaxis_title="Vlerat",
+        xaxis=dict(tickformat=tickformat, nticks=MAX_TICKS),
+        template=template,
+    )
+    # Plain dicts, so sessions sharing a cached report cannot mutate it
+    return fig.to_dict()
+
+
+def lttb(x, y, threshold):
+    """Indices of at most ``threshold`` points keeping the shape of ``y``.
+
+    Largest-Triangle-Three-Buckets: the first and last points are kept, and
+    from each bucket in between the point forming the largest triangle with
+    the previously kept point and the average of the next bucket.
+    """
+    n = len(x)
+    if n <= threshold or threshold < 3:
+        return np.arange(n)
+    x = x.astype(float)
+    every = (n - 2) / (threshold - 2)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
@@ -0,0 +1,902 @@
+"""Data access of the pages, behind one interface with interchangeable backends.
+
+The pages read and write through ``get_repository()``; which backend it
+returns depends on the configuration:
+
+* ``PostgresRepository``, the default: the database of the
+  ``[db_credentials]`` secrets, through the connection pool.  Saves go
+  through the write-behind journal (``duda.journal``).
+* ``SQLiteRepository``, when ``DUDA_SQLITE_FILE`` names a database file: an
+  embedded database in the app's own process, for a single-shop deployment
+  without a database server and for benchmarks on one machine.
+* ``replica.Replica``, when ``DUDA_REPLICA_FILE`` is set next to Postgres:
+  a SQLite copy serving the reads once it has synced, passing the writes on
+  to Postgres.
+
+Every backend has the same methods: ``ensure_schema``, ``generation``,
+``data_version``, ``refresh_snapshot``, ``load_page``, ``load_filtered``, ``search``,
+``counters``, ``catalog``, ``add_products``, ``delete_product``, ``save``,
+``save_results``, ``pending_saves``, ``import_chunks``, ``export_csv``,
+``daily_profit``, ``monthly_profit``, ``product_counts`` and
+``customer_ledger``.  ``transaction()`` runs the calls of a block on one
+connection, where the backend has connections to share.
+
+``generation(table)`` counts the writes to ``table`` notified by every app
+instance (``duda.notifications``), as far as the backend's reads reflect
+them; it is ``None`` where nothing is notified.  ``data_version()`` moves
+with every write to the inventory the backend's reads reflect, the key of
+the caches; it never loads the inventory itself.
+"""
+
+import contextlib
+import csv
+import io
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+import streamlit as st
+from psycopg2 import pool
+
+from duda import (
+    counters,
+    customers,
+    db,
+    deltas,
+    inventory,
+    journal,
+    migrations,
+    notifications,
+    rollups,
+    search,
+    transfer,
+)
+
+SQLITE_FILE = os.environ.get("DUDA_SQLITE_FILE")
+
+# Errors of any backend the pages report instead of crashing on; Arrow's
+# come from parsing the rows Postgres streams out.
+ERRORS = (psycopg2.Error, pool.PoolError, sqlite3.Error, pa.ArrowInvalid)
+
+# Distinct filters whose results are kept by ``filtered()``.
+FILTER_CACHE_ENTRIES = 64
+
+# Distinct queries whose results are kept by ``matches()``.
+SEARCH_CACHE_ENTRIES = 256
+
+# Ids of changed rows the SQLite snapshot refresh looks up per query.
+SNAPSHOT_FETCH_IDS = 10_000
+
+# Logged changes the SQLite search index takes in before it is rebuilt.
+SEARCH_REBUILD_ROWS = 20_000
+
+
+class PostgresRepository:
+    """The Postgres database, through the process-wide connection pool.
+
+    Every call checks a connection out and commits, unless it runs inside
+    ``transaction()``: the calls of that block share one connection and one
+    commit, saving round trips.  The pool is passed in, so the methods also
+    work from threads without a Streamlit script context.
+
+    With a change ``listener`` the snapshot is only refreshed after a write
+    was notified, instead of on every rerun.
+    """
+
+    def __init__(self, db_pool, save_journal, listener=None):
+        self._db_pool = db_pool
+        self._journal = save_journal
+        self._listener = listener
+        # The listener's inventory generation the snapshot was last refreshed at
+        self._snapshot_generation = None
+        self._current = threading.local()
+        # Whether pg_trgm is installed, looked up on the first search
+        self._trigrams = None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self._connection() as conn:
+            self._current.conn = conn
+            try:
+                yield
+            finally:
+                self._current.conn = None
+
+    def ensure_schema(self):
+        """Migrates the database once per process; call it from a page."""
+        migrations.ensure_schema()
+
+    def generation(self, table):
+        """The listener's count of writes to ``table``, ``None`` while not live."""
+        if self._listener is None or not self._listener.live:
+            return None
+        return self._listener.generations[table]
+
+    def data_version(self):
+        generation = self.generation("inventory")
+        if generation is not None:
+            return "notified", generation
+        # Without notifications, the table's watermark tells a write happened
+        return "watermark", *self._run(inventory.watermark)
+
+    def refresh_snapshot(self, snapshot):
+        generation = self.generation("inventory")
+        if (
+            generation is not None
+            and generation == self._snapshot_generation
+            and snapshot.frame is not None
+        ):
+            return snapshot.frame
+        frame = self._run(snapshot.refresh)
+        self._snapshot_generation = generation
+        return frame
+
+    def load_page(self, **kwargs):
+        return self._run(inventory.load_page, **kwargs)
+
+    def load_filtered(self, *args):
+        return self._run(inventory.load_filtered, *args)
+
+    def search(self, query, limit=search.LIMIT):
+        with self._connection() as conn:
+            if self._trigrams is None:
+                self._trigrams = search.has_trigrams(conn)
+            return search.load_matches(conn, query, limit, self._trigrams)
+
+    def counters(self):
+        return self._run(counters.read)
+
+    def catalog(self):
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT Produkti FROM products ORDER BY Produkti")
+            return [row[0] for row in cursor.fetchall()]
+
+    def add_products(self, names):
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO products (Produkti)
+                SELECT unnest(%s::text[])
+                ON CONFLICT (Produkti) DO NOTHING
+                """,
+                (names,),
+            )
+            return cursor.rowcount
+
+    def delete_product(self, name):
+        with self._connection() as conn:
+            conn.cursor().execute("DELETE FROM products WHERE Produkti = %s", (name,))
+
+    def save(self, resolved):
+        return self._journal.append(resolved)
+
+    def save_results(self, keys):
+        results = self._journal.results(keys)
+        if results:
+            # The page reruns to show them, maybe before they were notified
+            self._snapshot_generation = None
+        return results
+
+    def pending_saves(self):
+        return self._journal.pending()
+
+    def import_chunks(self, chunks, on_progress=None):
+        return self._run(transfer.import_chunks, chunks, on_progress)
+
+    def export_csv(self, out, date_from, date_to, statuses=(), products=(), client=None):
+        return self._run(
+            transfer.export_csv, out, date_from, date_to, statuses, products, client
+        )
+
+    def daily_profit(self, status="Likujduar", date_from=None, date_to=None):
+        return self._run(rollups.daily_profit, status, date_from, date_to)
+
+    def monthly_profit(self, status="Likujduar"):
+        return self._run(rollups.monthly_profit, status)
+
+    def product_counts(self, date_from, date_to):
+        return self._run(rollups.product_counts, date_from, date_to)
+
+    def customer_ledger(self, sort_key="revenue", after=None, page_size=customers.PAGE_SIZE):
+        return self._run(customers.read_page, sort_key, after, page_size)
+
+    def _run(self, fn, *args, **kwargs):
+        with self._connection() as conn:
+            return fn(conn, *args, **kwargs)
+
+    @contextlib.contextmanager
+    def _connection(self):
+        conn = getattr(self._current, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        with db.connection(self._db_pool) as conn:
+            yield conn
+            conn.commit()
+
+
+# SQLite column types of the inventory, in ``inventory.COLUMNS`` order.  The
+# CHECKs mirror the Postgres ones.
+_SQLITE_COLUMNS = {
+    "id": "INTEGER PRIMARY KEY",
+    "Produkti": "TEXT",
+    "Cmim_shitje": "REAL",
+    "Cmim_pound": "REAL",
+    "Cmim_blerje": "REAL",
+    "Description": "TEXT",
+    "magazinim": "TEXT CHECK (magazinim IN ('Porosi e re', 'Inventar'))",
+    "status_porosie": (
+        "TEXT CHECK (status_porosie IN "
+        "('Pending', 'Likujduar', 'Dorezuar', 'Anulluar', 'Kthyer'))"
+    ),
+    "Porositesi": "TEXT",
+    "link": "TEXT",
+    "date_created": "DATE",
+    "row_version": "INTEGER NOT NULL DEFAULT 1",
+}
+
+
+def _count_row(row, sign):
+    # Adds one inventory row to the counters and the day rollup, or takes it
+    # away with sign -1; the SQLite counterpart of the Postgres triggers
+    return f"""
+        INSERT INTO counters VALUES (
+            '{counters.STATUS}', COALESCE({row}.status_porosie, ''),
+            {sign}, {sign} * COALESCE({row}.Cmim_shitje, 0)
+        )
+        ON CONFLICT (kind, key) DO UPDATE SET
+            order_count = order_count + excluded.order_count,
+            amount = amount + excluded.amount;
+        INSERT INTO counters
+        SELECT '{counters.STOCK}', COALESCE({row}.Produkti, ''), {sign}, 0
+        WHERE {row}.magazinim = 'Inventar'
+        ON CONFLICT (kind, key) DO UPDATE SET
+            order_count = order_count + excluded.order_count;
+        INSERT INTO daily_rollup
+        SELECT
+            {row}.date_created,
+            COALESCE({row}.Produkti, ''),
+            COALESCE({row}.status_porosie, ''),
+            {sign} * COALESCE({row}.Cmim_shitje, 0),
+            {sign} * COALESCE({row}.Cmim_blerje, 0),
+            {sign}
+        WHERE {row}.date_created IS NOT NULL
+        ON CONFLICT (day, Produkti, status_porosie) DO UPDATE SET
+            revenue = revenue + excluded.revenue,
+            cost = cost + excluded.cost,
+            order_count = order_count + excluded.order_count;
+        DELETE FROM daily_rollup
+        WHERE order_count = 0
+            AND day = {row}.date_created
+            AND Produkti = COALESCE({row}.Produkti, '')
+            AND status_porosie = COALESCE({row}.status_porosie, '');
+    """
+
+
+def _ledger_row(row, sign):
+    # The SQLite counterpart of the customer ledger's Postgres triggers
+    def when(status, value):
+        return f"CASE {row}.status_porosie WHEN '{status}' THEN {sign} * {value} ELSE 0 END"
+
+    return f"""
+        INSERT INTO {customers.TABLE} VALUES (
+            COALESCE({row}.Porositesi, ''),
+            {sign},
+            {when('Pending', 1)},
+            {when('Pending', f'COALESCE({row}.Cmim_shitje, 0)')},
+            {when('Likujduar', f'COALESCE({row}.Cmim_shitje, 0)')},
+            {when('Likujduar', f'COALESCE({row}.Cmim_blerje, 0)')},
+            {when('Kthyer', 1)},
+            {when('Anulluar', 1)}
+        )
+        ON CONFLICT (Porositesi) DO UPDATE SET
+            {', '.join(f'{c} = {c} + excluded.{c}' for c in customers.COLUMNS)};
+    """
+
+
+def _log_search(row):
+    # Rows whose searched text changed, for the search index to catch up on
+    return f"INSERT INTO search_changes (id) VALUES ({row}.id);"
+
+
+_TRIGGERS = {
+    "inventory_count_inserts": f"AFTER INSERT ON inventory BEGIN {_count_row('NEW', 1)} END",
+    "inventory_count_updates": (
+        f"AFTER UPDATE ON inventory BEGIN {_count_row('OLD', -1)} {_count_row('NEW', 1)} END"
+    ),
+    "inventory_count_deletes": f"AFTER DELETE ON inventory BEGIN {_count_row('OLD', -1)} END",
+    "inventory_ledger_inserts": f"AFTER INSERT ON inventory BEGIN {_ledger_row('NEW', 1)} END",
+    "inventory_ledger_updates": (
+        f"AFTER UPDATE ON inventory BEGIN {_ledger_row('OLD', -1)} {_ledger_row('NEW', 1)} END"
+    ),
+    "inventory_ledger_deletes": f"AFTER DELETE ON inventory BEGIN {_ledger_row('OLD', -1)} END",
+    "inventory_log_search_inserts": f"AFTER INSERT ON inventory BEGIN {_log_search('NEW')} END",
+    "inventory_log_search_updates": (
+        "AFTER UPDATE OF Porositesi, Produkti, Description ON inventory "
+        f"BEGIN {_log_search('NEW')} END"
+    ),
+    "inventory_log_search_deletes": f"AFTER DELETE ON inventory BEGIN {_log_search('OLD')} END",
+}
+
+_SQLITE_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS inventory (
+        {', '.join(f'{name} {type_}' for name, type_ in _SQLITE_COLUMNS.items())}
+    );
+    CREATE INDEX IF NOT EXISTS inventory_date_created_id
+        ON inventory (date_created, id);
+    CREATE TABLE IF NOT EXISTS products (Produkti TEXT PRIMARY KEY);
+    CREATE TABLE IF NOT EXISTS counters (
+        kind TEXT NOT NULL,
+        key TEXT NOT NULL,
+        order_count INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY (kind, key)
+    );
+    CREATE TABLE IF NOT EXISTS daily_rollup (
+        day DATE NOT NULL,
+        Produkti TEXT NOT NULL,
+        status_porosie TEXT NOT NULL,
+        revenue REAL NOT NULL,
+        cost REAL NOT NULL,
+        order_count INTEGER NOT NULL,
+        PRIMARY KEY (day, Produkti, status_porosie)
+    );
+    CREATE TABLE IF NOT EXISTS {customers.TABLE} (
+        Porositesi TEXT PRIMARY KEY,
+        order_count INTEGER NOT NULL,
+        pending_count INTEGER NOT NULL,
+        pending_amount REAL NOT NULL,
+        paid_revenue REAL NOT NULL,
+        paid_cost REAL NOT NULL,
+        returned_count INTEGER NOT NULL,
+        cancelled_count INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value NOT NULL);
+    CREATE TABLE IF NOT EXISTS search_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id INTEGER NOT NULL
+    );
+    {''.join(f'CREATE TRIGGER IF NOT EXISTS {name} {body};' for name, body in _TRIGGERS.items())}
+"""
+
+# Recounts the customer ledger, for bulk loads and databases created before it.
+_SQLITE_LEDGER_RECOUNT = [
+    f"DELETE FROM {customers.TABLE}",
+    f"INSERT INTO {customers.TABLE} " + customers.aggregate(deltas.ALL_ROWS),
+]
+
+# Recounts the counters and the rollups, for bulk loads run without triggers.
+_SQLITE_RECOUNT = [
+    "DELETE FROM counters",
+    "INSERT INTO counters " + counters.aggregate(deltas.ALL_ROWS),
+    "DELETE FROM daily_rollup",
+    "INSERT INTO daily_rollup " + rollups.aggregate(deltas.ALL_ROWS),
+    *_SQLITE_LEDGER_RECOUNT,
+]
+
+# The logged changes after a sequence number, with the rows' current text.
+_SQLITE_SEARCH_CHANGES = f"""
+    SELECT search_changes.seq, search_changes.id, inventory.id IS NOT NULL, {search.SEARCH_TEXT}
+    FROM search_changes
+    LEFT JOIN inventory ON inventory.id = search_changes.id
+    WHERE search_changes.seq > ?
+    ORDER BY search_changes.seq
+"""
+
+_SQLITE_INSERT = f"""
+    INSERT INTO inventory ({', '.join(inventory.COLUMNS)})
+    VALUES ({', '.join('?' * len(inventory.COLUMNS))})
+"""
+
+_SQLITE_INSERT_EDITABLE = f"""
+    INSERT INTO inventory ({', '.join(inventory.EDITABLE_COLUMNS)})
+    VALUES ({', '.join('?' * len(inventory.EDITABLE_COLUMNS))})
+"""
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()))
+
+
+class SQLiteRepository:
+    """An embedded SQLite database file, inside the app's own process.
+
+    Row triggers keep the status and stock counters and the day rollup
+    current, as the Postgres triggers and rollup refreshes do.  Saves apply
+    at once, without a journal.  Each thread uses its own connection; writes
+    hold the database lock for their transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Opening a connection costs more than most queries, keep one per thread
+        self._connections = threading.local()
+        self._results = {}
+        # (generation, last logged change taken in, search.TrigramIndex)
+        self._search = None
+        self._search_lock = threading.Lock()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        ledger_existed = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (customers.TABLE,)
+        ).fetchone()
+        conn.executescript(_SQLITE_SCHEMA)
+        if not ledger_existed:
+            with self._transaction() as conn:
+                for statement in _SQLITE_LEDGER_RECOUNT:
+                    conn.execute(statement)
+
+    def transaction(self):
+        # Reads are local, there are no round trips to save
+        return contextlib.nullcontext()
+
+    def ensure_schema(self):
+        """The schema is created with the repository."""
+
+    def generation(self, table):
+        # Nothing notifies writes to an embedded database
+        return None
+
+    def data_version(self):
+        # Bumped by every write, no row is read
+        return "sqlite", self._data_version(self._connection())
+
+    def refresh_snapshot(self, snapshot):
+        """Merges the rows whose ``row_version`` moved since the last refresh.
+
+        Only the ids and versions are read to find them; after a bulk load,
+        which starts the ids over, the whole table is reloaded.
+        """
+        with self._transaction(immediate=False) as conn:
+            watermark = self._data_version(conn, "bulk_loads"), self._data_version(conn)
+            if snapshot.frame is not None and snapshot.watermark == watermark:
+                return snapshot.frame
+            if snapshot.frame is None or snapshot.watermark[0] != watermark[0]:
+                rows = conn.execute(
+                    f"SELECT {', '.join(inventory.COLUMNS)} FROM inventory ORDER BY id"
+                ).fetchall()
+                snapshot.replace(inventory.frame_from_rows(rows), watermark)
+                return snapshot.frame
+            current = pd.DataFrame(
+                conn.execute("SELECT id, row_version FROM inventory").fetchall(),
+                columns=["id", "row_version"],
+            ).set_index("id")["row_version"]
+            held = snapshot.frame.set_index("id")["row_version"]
+            changed_ids = current.index[current.ne(held.reindex(current.index))].tolist()
+            rows = []
+            for start in range(0, len(changed_ids), SNAPSHOT_FETCH_IDS):
+                ids = changed_ids[start : start + SNAPSHOT_FETCH_IDS]
+                rows += conn.execute(
+                    f"""
+                    SELECT {', '.join(inventory.COLUMNS)}
+                    FROM inventory
+                    WHERE id IN ({', '.join('?' * len(ids))})
+                    """,
+                    ids,
+                ).fetchall()
+            snapshot.merge(
+                inventory.frame_from_rows(rows),
+                held.index.difference(current.index).tolist(),
+                watermark,
+            )
+        return snapshot.frame
+
+    def load_page(self, sort_key="id", after=None, page_size=100, date_from=None, date_to=None):
+        query, params = inventory.page_query(
+            sort_key, after, page_size, date_from, date_to, placeholder="?"
+        )
+        rows = self._fetch(query, params)
+        return inventory.split_page(inventory.frame_from_rows(rows), sort_key, page_size)
+
+    def load_filtered(self, date_from, date_to, statuses=(), products=(), client=None):
+        query, params = inventory.filtered_query(
+            date_from, date_to, statuses, products, client, placeholder="?"
+        )
+        return inventory.frame_from_rows(self._fetch(query, params))
+
+    def search(self, query, limit=search.LIMIT):
+        """Ranks the orders with an in-memory trigram index of this database."""
+        ids = self._search_index().search(query, limit)
+        if not ids:
+            return inventory.frame_from_rows([])
+        rows = self._fetch(
+            f"""
+            SELECT {', '.join(inventory.COLUMNS)}
+            FROM inventory
+            WHERE id IN ({', '.join('?' * len(ids))})
+            """,
+            ids,
+        )
+        rank = {row_id: i for i, row_id in enumerate(ids)}
+        return inventory.frame_from_rows(sorted(rows, key=lambda row: rank[row[0]]))
+
+    def counters(self):
+        rows = self._fetch(
+            """
+            SELECT kind, key, order_count, amount FROM counters
+            WHERE order_count <> 0
+            ORDER BY kind, key
+            """
+        )
+        return counters.split(pd.DataFrame(rows, columns=["kind", "key", "count", "amount"]))
+
+    def catalog(self):
+        rows = self._fetch("SELECT Produkti FROM products ORDER BY Produkti")
+        return [row[0] for row in rows]
+
+    def add_products(self, names):
+        with self._transaction() as conn:
+            return conn.executemany(
+                "INSERT OR IGNORE INTO products VALUES (?)", [(name,) for name in names]
+            ).rowcount
+
+    def delete_product(self, name):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM products WHERE Produkti = ?", (name,))
+
+    def save(self, resolved):
+        """Applies the changes right away; the result is kept under the key."""
+        key = str(uuid.uuid4())
+        try:
+            result = {"conflicts": self.apply_changes(resolved), "error": None}
+        except sqlite3.DatabaseError as e:
+            result = {"conflicts": [], "error": str(e)}
+        self._results[key] = result
+        return key
+
+    def save_results(self, keys):
+        return {key: self._results.pop(key) for key in keys if key in self._results}
+
+    def pending_saves(self):
+        return 0, None
+
+    def apply_changes(self, resolved):
+        """Writes changes from ``inventory.resolve_changes``, returns the conflicts.
+
+        Like ``inventory.apply_changes``, an edit or delete only applies while
+        the row still has the row_version the editor showed.
+        """
+        conflicts = []
+        with self._transaction() as conn:
+            for row_id, version, delta in resolved["edited"]:
+                columns = [c for c in inventory.EDITABLE_COLUMNS if c in delta]
+                cursor = conn.execute(
+                    f"""
+                    UPDATE inventory
+                    SET {', '.join(f'{c} = ?' for c in columns)},
+                        row_version = row_version + 1
+                    WHERE id = ? AND row_version = ?
+                    """,
+                    [*(_cell(c, delta[c]) for c in columns), row_id, version],
+                )
+                if not cursor.rowcount:
+                    conflicts.append(_conflict(conn, row_id, delta))
+            for row_id, version in resolved["deleted"]:
+                cursor = conn.execute(
+                    "DELETE FROM inventory WHERE id = ? AND row_version = ?",
+                    (row_id, version),
+                )
+                if not cursor.rowcount:
+                    conflicts.append(_conflict(conn, row_id, None))
+            conn.executemany(
+                _SQLITE_INSERT_EDITABLE,
+                [
+                    [_cell(c, row.get(c)) for c in inventory.EDITABLE_COLUMNS]
+                    for row in resolved["added"]
+                ],
+            )
+            self._bump_version(conn)
+        return conflicts
+
+    def replace_all(self, rows):
+        """Replaces the whole inventory with ``rows`` of ``inventory.COLUMNS``.
+
+        For bulk loads: the rows go in without the triggers, the counters and
+        the rollup are recounted once at the end.
+        """
+        with self._transaction() as conn:
+            self._replace_all(conn, rows)
+
+    def import_chunks(self, chunks, on_progress=None):
+        """``transfer.import_chunks`` for this database."""
+        with self._transaction() as conn:
+            products = {row[0] for row in conn.execute("SELECT Produkti FROM products")}
+
+            def write(valid):
+                # NA and NaN cells are NULLs
+                valid = valid.astype(object).where(valid.notna(), None)
+                conn.executemany(_SQLITE_INSERT_EDITABLE, valid.itertuples(index=False))
+
+            imported, rejected, sample = transfer.import_with(
+                write, products, chunks, on_progress
+            )
+            self._bump_version(conn)
+        return imported, rejected, sample
+
+    def export_csv(self, out, date_from, date_to, statuses=(), products=(), client=None):
+        """``transfer.export_csv`` for this database."""
+        query, params = inventory.filtered_query(
+            date_from,
+            date_to,
+            statuses,
+            products,
+            client,
+            placeholder="?",
+            columns=transfer.COLUMNS,
+        )
+        text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(transfer.COLUMNS)
+        writer.writerows(self._connection().execute(query, params))
+        text.flush()
+        text.detach()
+
+    def daily_profit(self, status="Likujduar", date_from=None, date_to=None):
+        rows = self._fetch(
+            """
+            SELECT day, SUM(revenue), SUM(cost)
+            FROM daily_rollup
+            WHERE status_porosie = ?
+                AND (? IS NULL OR day >= ?)
+                AND (? IS NULL OR day <= ?)
+            GROUP BY day
+            ORDER BY day
+            """,
+            (status, date_from, date_from, date_to, date_to),
+        )
+        return pd.DataFrame(rows, columns=["day", "revenue", "cost"])
+
+    def monthly_profit(self, status="Likujduar"):
+        rows = self._fetch(
+            """
+            SELECT strftime('%Y-%m', day) AS month, SUM(revenue), SUM(cost)
+            FROM daily_rollup
+            WHERE status_porosie = ?
+            GROUP BY month
+            ORDER BY month
+            """,
+            (status,),
+        )
+        return pd.DataFrame(rows, columns=["month", "revenue", "cost"])
+
+    def product_counts(self, date_from, date_to):
+        rows = self._fetch(
+            """
+            SELECT Produkti, SUM(order_count)
+            FROM daily_rollup
+            WHERE day BETWEEN ? AND ? AND Produkti <> ''
+            GROUP BY Produkti
+            HAVING SUM(order_count) <> 0
+            ORDER BY Produkti
+            """,
+            (date_from, date_to),
+        )
+        return pd.DataFrame(rows, columns=["Produkti", "Count"])
+
+    def customer_ledger(self, sort_key="revenue", after=None, page_size=customers.PAGE_SIZE):
+        query, params = customers.page_query(sort_key, after, placeholder="?")
+        return customers.frame_from_rows(self._fetch(query, (*params, page_size + 1)), page_size)
+
+    def watermark(self):
+        """The time of the source database a copy is current to.
+
+        ``None`` until ``apply_full_copy`` ran once; for a database kept as
+        a copy of another, like ``replica.Replica``'s.
+        """
+        rows = self._fetch("SELECT value FROM sync_state WHERE key = 'watermark'")
+        return datetime.fromisoformat(rows[0][0]) if rows else None
+
+    def apply_full_copy(self, rows, products, watermark):
+        """Replaces the inventory and the catalog with a copy taken at ``watermark``.
+
+        ``rows`` hold ``inventory.COLUMNS``, ids and row versions included.
+        """
+        with self._transaction() as conn:
+            self._replace_all(conn, rows)
+            self._copied(conn, products, watermark)
+
+    def apply_delta(self, changed, deleted_ids, products, watermark):
+        """Applies the rows changed and deleted at the source up to ``watermark``."""
+        with self._transaction() as conn:
+            self._merge(conn, changed, deleted_ids)
+            self._copied(conn, products, watermark)
+
+    def _copied(self, conn, products, watermark):
+        conn.execute("DELETE FROM products")
+        conn.executemany("INSERT INTO products VALUES (?)", [(name,) for name in products])
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES ('watermark', ?)",
+            (watermark.isoformat(),),
+        )
+
+    def _replace_all(self, conn, rows):
+        for name in _TRIGGERS:
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.execute("DELETE FROM inventory")
+        conn.executemany(_SQLITE_INSERT, rows)
+        for statement in _SQLITE_RECOUNT:
+            conn.execute(statement)
+        for name, body in _TRIGGERS.items():
+            conn.execute(f"CREATE TRIGGER {name} {body}")
+        # Nothing was logged, the search indexes start over
+        conn.execute("DELETE FROM search_changes")
+        self._bump_version(conn, "search_generation")
+        # Ids start over too, the snapshots reload instead of merging
+        self._bump_version(conn, "bulk_loads")
+        self._bump_version(conn)
+
+    def _merge(self, conn, rows, deleted_ids):
+        # Rows copied from another database, ids and row versions included
+        if not rows and not deleted_ids:
+            return
+        conn.executemany(
+            "DELETE FROM inventory WHERE id = ?",
+            [(row[0],) for row in rows] + [(row_id,) for row_id in deleted_ids],
+        )
+        conn.executemany(_SQLITE_INSERT, rows)
+        self._bump_version(conn)
+
+    def _search_index(self):
+        # Built once, then caught up with the changes the triggers logged.  A
+        # process too far behind the log rebuilds instead, so a rebuild can
+        # prune the entries no process reads any more.  A bulk load clears
+        # the log and starts a new generation, which makes every process
+        # rebuild.
+        with self._search_lock:
+            if self._search is not None:
+                generation, seq, index = self._search
+                with self._transaction(immediate=False) as conn:
+                    current = self._data_version(conn, "search_generation")
+                    last = conn.execute(
+                        "SELECT COALESCE(MAX(seq), 0) FROM search_changes"
+                    ).fetchone()[0]
+                    behind = last - seq + len(index.changed)
+                    if current == generation and behind <= SEARCH_REBUILD_ROWS:
+                        changes = conn.execute(_SQLITE_SEARCH_CHANGES, (seq,)).fetchall()
+                    else:
+                        changes = None
+                if changes == []:
+                    return index
+                if changes is not None:
+                    changed = {
+                        row_id: text if exists else None
+                        for _, row_id, exists, text in changes
+                    }
+                    index = index.updated(list(changed), list(changed.values()))
+                    self._search = (generation, changes[-1][0], index)
+                    return index
+
+            with self._transaction() as conn:
+                rows = conn.execute(
+                    f"SELECT id, {search.SEARCH_TEXT} FROM inventory"
+                ).fetchall()
+                seq = conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) FROM search_changes"
+                ).fetchone()[0]
+                conn.execute(
+                    "DELETE FROM search_changes WHERE seq <= ?",
+                    (seq - SEARCH_REBUILD_ROWS,),
+                )
+                generation = self._data_version(conn, "search_generation")
+            index = search.TrigramIndex(
+                [row[0] for row in rows], [row[1] for row in rows]
+            )
+            self._search = (generation, seq, index)
+            return index
+
+    def _bump_version(self, conn, key="data_version"):
+        conn.execute(
+            """
+            INSERT INTO sync_state VALUES (?, 1)
+            ON CONFLICT (key) DO UPDATE SET value = value + 1
+            """,
+            (key,),
+        )
+
+    def _data_version(self, conn, key="data_version"):
+        row = conn.execute(
+            "SELECT value FROM sync_state WHERE key = ?", (key,)
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    @contextlib.contextmanager
+    def _transaction(self, immediate=True):
+        conn = self._connection()
+        # Writers take the lock up front instead of failing to upgrade to it
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _fetch(self, query, params=()):
+        return self._connection().execute(query, params).fetchall()
+
+    def _connection(self):
+        conn = getattr(self._connections, "conn", None)
+        if conn is None:
+            conn = self._connections.conn = sqlite3.connect(
+                self.path,
+                timeout=30,
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                # Transactions are begun explicitly, see ``_transaction``
+                isolation_level=None,
+            )
+        return conn
+
+
+def _cell(column, value):
+    # Editor values as Postgres would store them: dates and 2-decimal prices
+    if value is None:
+        return None
+    if column == "date_created":
+        return date.fromisoformat(str(value)[:10])
+    if inventory.EDITABLE_COLUMNS[column] == "numeric":
+        return round(float(value), 2)
+    return value
+
+
+def _conflict(conn, row_id, change):
+    exists = conn.execute("SELECT 1 FROM inventory WHERE id = ?", (row_id,)).fetchone()
+    return {"id": row_id, "change": change, "status": "changed" if exists else "deleted"}
+
+
+def choose(primary, local):
+    """``local`` once it has synced, ``primary`` until then or without one."""
+    return local if local is not None and local.ready() else primary
+
+
+@st.cache_resource(show_spinner=False)
+def get_primary():
+    """The backend holding the data: SQLite when configured, Postgres otherwise."""
+    if SQLITE_FILE:
+        return SQLiteRepository(SQLITE_FILE)
+    return PostgresRepository(db.get_pool(), journal.get_journal(), get_listener())
+
+
+def get_listener():
+    """The process's change listener, ``None`` without Postgres."""
+    if SQLITE_FILE:
+        return None
+    return notifications.get_listener()
+
+
+def get_local():
+    """The read replica of Postgres, ``None`` when there is none."""
+    if SQLITE_FILE:
+        return None
+    # The replica module builds on this one
+    from duda import replica
+
+    return replica.get_replica()
+
+
+def get_repository():
+    """The backend the pages read and write through."""
+    return choose(get_primary(), get_local())
+
+
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES, show_spinner=False)
+def filtered(version, date_from, date_to, statuses=(), products=(), client=None):
+    """Cached ``load_filtered``, keyed by the filter and the data version.
+
+    Pass the repository's ``data_version`` as ``version`` so a save, here or
+    on another instance, makes the next rerun query again.
+    """
+    return get_repository().load_filtered(date_from, date_to, statuses, products, client)
+
+
+@st.cache_data(max_entries=SEARCH_CACHE_ENTRIES, show_spinner=False)
+def matches(version, query):
+    """Cached ``search``, keyed by the query and the data version."""
+    return get_repository().search(query)
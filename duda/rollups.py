@@ -0,0 +1,156 @@
+"""Day x product rollups of the inventory behind the profit reports.
+
+Each row of the rollup table sums one (day, product, status) group, so the
+reports read a few hundred pre-aggregated rows instead of the order history.
+Like the KPI counters, statement-level triggers apply every insert, update
+and delete on the inventory as a delta, so concurrent writers touching the
+same day add up instead of racing; the whole table can be rebuilt with::
+
+    python -m duda.rollups rebuild
+"""
+
+import pandas as pd
+
+from duda import deltas
+
+TABLE = "inventory_daily_rollup"
+
+_AGGREGATE = """
+    SELECT
+        date_created,
+        COALESCE(Produkti, ''),
+        COALESCE(status_porosie, ''),
+        COALESCE(SUM(sign * Cmim_shitje), 0),
+        COALESCE(SUM(sign * Cmim_blerje), 0),
+        SUM(sign)
+    FROM {source} AS changed
+    WHERE date_created IS NOT NULL
+    GROUP BY 1, 2, 3
+"""
+
+# Groups whose orders were all deleted or moved keep a row of zeros, the
+# reports skip them.
+_APPLY = f"""
+    INSERT INTO {TABLE} AS r (day, Produkti, status_porosie, revenue, cost, order_count)
+    SELECT * FROM ({_AGGREGATE})
+        AS delta (day, Produkti, status_porosie, revenue, cost, order_count)
+    WHERE revenue <> 0 OR cost <> 0 OR order_count <> 0
+    ORDER BY 1, 2, 3
+    ON CONFLICT (day, Produkti, status_porosie) DO UPDATE SET
+        revenue = r.revenue + EXCLUDED.revenue,
+        cost = r.cost + EXCLUDED.cost,
+        order_count = r.order_count + EXCLUDED.order_count
+"""
+
+_TRIGGERS = deltas.delta_triggers("rollup", _APPLY)
+
+
+def initialize(conn):
+    """Creates the rollup table, filling it the first time it is created."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass(%s)", (TABLE,))
+    existed = cursor.fetchone()[0] is not None
+
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+            day DATE NOT NULL,
+            Produkti TEXT NOT NULL,
+            status_porosie TEXT NOT NULL,
+            revenue FLOAT NOT NULL,
+            cost FLOAT NOT NULL,
+            order_count INTEGER NOT NULL,
+            PRIMARY KEY (day, Produkti, status_porosie)
+        )
+        """
+    )
+    if not existed:
+        rebuild(conn)
+
+
+def install_triggers(conn):
+    """Moves the rollup to exact sums kept by triggers, then refills it.
+
+    Sums kept by adding deltas must not pick up float rounding, so the amounts
+    become NUMERIC like the counters'.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        ALTER TABLE {TABLE}
+            ALTER COLUMN revenue TYPE NUMERIC(14, 2),
+            ALTER COLUMN cost TYPE NUMERIC(14, 2)
+        """
+    )
+    cursor.execute(_TRIGGERS)
+    rebuild(conn)
+
+
+def rebuild(conn):
+    """Recomputes the whole rollup table from the inventory."""
+    deltas.rebuild(conn, TABLE, _AGGREGATE)
+
+
+def aggregate(source):
+    """The rollup rows of ``source``, inventory rows with a ``sign`` column.
+
+    Plain SQL that SQLite runs as well.
+    """
+    return deltas.aggregate(_AGGREGATE, source)
+
+
+def daily_profit(conn, status="Likujduar", date_from=None, date_to=None):
+    """Revenue and cost per day for orders with the given status.
+
+    ``date_from`` and ``date_to`` optionally limit the days, both included.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT day, SUM(revenue), SUM(cost)
+        FROM {TABLE}
+        WHERE status_porosie = %s AND order_count > 0
+            AND (%s::date IS NULL OR day >= %s::date)
+            AND (%s::date IS NULL OR day <= %s::date)
+        GROUP BY day
+        ORDER BY day
+        """,
+        (status, date_from, date_from, date_to, date_to),
+    )
+    return pd.DataFrame(cursor.fetchall(), columns=["day", "revenue", "cost"])
+
+
+def monthly_profit(conn, status="Likujduar"):
+    """Revenue and cost per month (``YYYY-MM``) for orders with the given status."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT to_char(day, 'YYYY-MM') AS month, SUM(revenue), SUM(cost)
+        FROM {TABLE}
+        WHERE status_porosie = %s AND order_count > 0
+        GROUP BY month
+        ORDER BY month
+        """,
+        (status,),
+    )
+    return pd.DataFrame(cursor.fetchall(), columns=["month", "revenue", "cost"])
+
+
+def product_counts(conn, date_from, date_to):
+    """Number of orders per product between two days, all statuses included."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT Produkti, SUM(order_count)
+        FROM {TABLE}
+        WHERE day BETWEEN %s AND %s AND Produkti <> '' AND order_count > 0
+        GROUP BY Produkti
+        ORDER BY Produkti
+        """,
+        (date_from, date_to),
+    )
+    return pd.DataFrame(cursor.fetchall(), columns=["Produkti", "Count"])
+
+
+if __name__ == "__main__":
+    deltas.main("duda.rollups", TABLE, rebuild)
@@ -0,0 +1,217 @@
+"""Typo-tolerant search over the customers, products and descriptions.
+
+The search box of the Inventory page ranks orders by how well the words of
+the query match the words of ``Porositesi``, ``Produkti`` and
+``Description``: a misspelled name, or the first letters of a word while it
+is still being typed, find the order too.
+
+Postgres matches with pg_trgm's word similarity, served by the GIN trigram
+index of migration 10.  Where the extension is not installed the search
+falls back to an unranked substring match.  The SQLite backend keeps a
+``TrigramIndex`` of its rows in memory instead, scored the same way.
+"""
+
+import copy
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from duda import inventory
+
+# Shorter queries match too many orders to be worth ranking.
+MIN_QUERY_LENGTH = 3
+
+# Ranked results returned per query.
+LIMIT = 50
+
+# Lowest word similarity counted as a match, pg_trgm's
+# ``word_similarity_threshold``; lower finds more typos and more noise.
+THRESHOLD = 0.4
+
+# The searched text; the index of migration 10 is on this exact expression.
+SEARCH_TEXT = (
+    "(coalesce(Porositesi, '') || ' ' || coalesce(Produkti, '') "
+    "|| ' ' || coalesce(Description, ''))"
+)
+
+
+def initialize(conn):
+    """Installs pg_trgm and the trigram index, where the server ships it.
+
+    Idempotent, so it can be run again once the extension was installed.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    if cursor.fetchone() is None:
+        print("pg_trgm is not available, search matches substrings", file=sys.stderr)
+        return
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS inventory_search_trgm_idx
+            ON inventory USING gin ({SEARCH_TEXT} gin_trgm_ops)
+        """)
+
+
+def has_trigrams(conn):
+    """Whether pg_trgm, and so the trigram index, is installed."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    return cursor.fetchone() is not None
+
+
+def load_matches(conn, query, limit=LIMIT, trigrams=True):
+    """Loads the orders best matching ``query``, best first.
+
+    Equally good matches come newest first.  Without ``trigrams`` any order
+    containing the query matches, newest first.
+    """
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return inventory.frame_from_rows([])
+    if not trigrams:
+        return inventory.read_frame(
+            conn,
+            f"""
+            SELECT {', '.join(inventory.COLUMNS)}
+            FROM inventory
+            WHERE {SEARCH_TEXT} ILIKE %s
+            ORDER BY id DESC
+            LIMIT %s
+            """,
+            (f"%{inventory.escape_like(query)}%", limit),
+        )
+
+    cursor = conn.cursor()
+    # Local to the transaction; <% compares against it and can use the index
+    cursor.execute(
+        "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+        (str(THRESHOLD),),
+    )
+    return inventory.read_frame(
+        conn,
+        f"""
+        SELECT {', '.join(inventory.COLUMNS)}
+        FROM inventory
+        WHERE %(query)s <%% {SEARCH_TEXT}
+        ORDER BY word_similarity(%(query)s, {SEARCH_TEXT}) DESC, id DESC
+        LIMIT %(limit)s
+        """,
+        {"query": query, "limit": limit},
+    )
+
+
+def _words(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def trigrams(word):
+    """The trigrams of one word, padded the way pg_trgm pads them."""
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """In-memory trigram index of the searched text of every order.
+
+    The distinct words of all orders are indexed by their trigrams, and each
+    word lists the rows it occurs in.  A query is matched against the words,
+    not the rows, so a lookup stays fast with a million orders.
+
+    As with pg_trgm's word similarity, a row scores the share of the query's
+    trigrams found in its words, each query word counting its best matching
+    word; so the first letters of a word already score high, and a typo in
+    one word of the query still leaves the others to match.
+
+    Rows changed after the build go through ``updated()``, which indexes them
+    apart until the next build.
+    """
+
+    def __init__(self, ids, texts):
+        """``ids`` and ``texts`` are aligned, one searched text per order."""
+        self.ids = np.asarray(ids, dtype=np.int64)
+        # Rows changed since the build: id -> text, None once deleted
+        self.changed = {}
+        self._hidden = None
+        self._overlay = None
+        tokens = (
+            pd.Series(texts, dtype=object)
+            .fillna("")
+            .str.lower()
+            .str.findall(r"\w+")
+            .explode()
+            .dropna()
+        )
+        codes, self.vocabulary = pd.factorize(tokens)
+        order = np.argsort(codes, kind="stable")
+        # Rows of word i are _rows[_offsets[i]:_offsets[i + 1]]
+        self._rows = tokens.index.to_numpy()[order]
+        self._offsets = np.searchsorted(
+            codes[order], np.arange(len(self.vocabulary) + 1)
+        )
+
+        grams = {}
+        for code, word in enumerate(self.vocabulary):
+            for gram in trigrams(word):
+                grams.setdefault(gram, []).append(code)
+        self._grams = {gram: np.array(codes) for gram, codes in grams.items()}
+
+    def updated(self, ids, texts):
+        """A copy searching the rows ``ids`` by their new ``texts``.
+
+        A ``None`` text drops a deleted row.  The copy shares the built index
+        and reindexes the changed rows alone; this index is left as it was,
+        for the searches still running on it.
+        """
+        index = copy.copy(self)
+        index.changed = {**self.changed, **dict(zip(ids, texts))}
+        index._hidden = np.isin(self.ids, list(index.changed))
+        current = {
+            row_id: text for row_id, text in index.changed.items() if text is not None
+        }
+        index._overlay = TrigramIndex(list(current), list(current.values()))
+        return index
+
+    def search(self, query, limit=LIMIT):
+        """Returns the ids of the best matching rows, best first."""
+        query_words = _words(query)
+        if len(query.strip()) < MIN_QUERY_LENGTH or not query_words:
+            return []
+
+        ids, scores = self.ids, self._scores(query_words)
+        if self._overlay is not None:
+            scores[self._hidden] = 0
+            ids = np.concatenate([ids, self._overlay.ids])
+            scores = np.concatenate([scores, self._overlay._scores(query_words)])
+
+        found = np.flatnonzero(scores >= THRESHOLD)
+        # Best score first, newest order first among equals
+        ranked = found[np.lexsort((-ids[found], -scores[found]))]
+        return ids[ranked[:limit]].tolist()
+
+    def _scores(self, query_words):
+        # Per row, the share of the query's trigrams found in its words
+        shared = np.zeros(len(self.ids))
+        total = 0
+        for word in query_words:
+            query_grams = trigrams(word)
+            total += len(query_grams)
+            counts = self._shared_trigrams(query_grams)
+            # Words sharing less than this add little, and would touch most rows
+            matched = np.flatnonzero(counts >= len(query_grams) * THRESHOLD / 2)
+            # Best match per row: better words are written last and win
+            best = np.zeros(len(self.ids))
+            for code in matched[np.argsort(counts[matched], kind="stable")]:
+                best[self._rows[self._offsets[code] : self._offsets[code + 1]]] = (
+                    counts[code]
+                )
+            shared += best
+        return shared / total
+
+    def _shared_trigrams(self, query_grams):
+        # How many of ``query_grams`` each vocabulary word has
+        hits = [self._grams[gram] for gram in query_grams if gram in self._grams]
+        if not hits:
+            return np.zeros(len(self.vocabulary), dtype=np.int64)
+        return np.bincount(np.concatenate(hits), minlength=len(self.vocabulary))
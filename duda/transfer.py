@@ -0,0 +1,229 @@
+"""Bulk CSV/Excel import and CSV export of the inventory through COPY.
+
+Files are read and written in chunks, so memory stays bounded however many
+rows move.  Large backfills can skip the upload form::
+
+    python -m duda.transfer import orders.csv
+    python -m duda.transfer export 2024-01-01 2024-12-31 orders.csv
+"""
+
+import io
+import sys
+import time
+import uuid
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from duda import assets, inventory
+
+# Columns read from and written to files, in file order.
+COLUMNS = list(inventory.EDITABLE_COLUMNS)
+REQUIRED_COLUMNS = ["date_created", "magazinim", "status_porosie"]
+PRICE_COLUMNS = ["Cmim_shitje", "Cmim_pound", "Cmim_blerje"]
+
+CHUNK_ROWS = 50_000
+
+# Rejected rows kept for the import report, the rest are only counted.
+MAX_REJECTED_SAMPLE = 1_000
+
+# Prepared exports wait for their download here, under unguessable names.
+# Streamlit's static file handler streams them from disk at ``EXPORT_URL``.
+EXPORT_DIR = assets.STATIC_DIR / "exports"
+EXPORT_URL = "app/static/exports"
+
+# Exports are removed this long after they were prepared, downloaded or not,
+# so the ones of sessions that ended go too.
+EXPORT_TTL_SECONDS = 3600
+
+# The largest file Streamlit's static file handler serves.
+MAX_EXPORT_BYTES = 200 * 1024 * 1024
+
+
+def read_chunks(file, file_name, chunk_rows=CHUNK_ROWS):
+    """Yields frames of at most ``chunk_rows`` rows of a CSV or Excel file."""
+    if file_name.lower().endswith((".xlsx", ".xlsm")):
+        yield from _excel_chunks(file, chunk_rows)
+    else:
+        yield from pd.read_csv(
+            file, chunksize=chunk_rows, dtype=str, keep_default_na=False
+        )
+
+
+def validate(chunk, products):
+    """Splits a chunk into rows ready for COPY and rejected rows.
+
+    Rejected rows get a ``problem`` column explaining why.
+    """
+    by_name = {column.lower(): column for column in COLUMNS}
+    chunk = chunk.rename(columns=lambda name: by_name.get(str(name).strip().lower(), name))
+    missing = [column for column in REQUIRED_COLUMNS if column not in chunk]
+    if missing:
+        raise ValueError(f"Mungojne kolonat: {', '.join(missing)}")
+
+    chunk = chunk.reindex(columns=COLUMNS)
+    # Empty cells, whatever the file format, are NULLs
+    text_columns = [column for column in COLUMNS if column not in PRICE_COLUMNS]
+    chunk[text_columns] = (
+        chunk[text_columns]
+        .astype("string")
+        .apply(lambda column: column.str.strip())
+        .replace("", pd.NA)
+    )
+    raw_prices = chunk[PRICE_COLUMNS].mask(chunk[PRICE_COLUMNS] == "")
+    prices = raw_prices.apply(pd.to_numeric, errors="coerce")
+    dates = pd.to_datetime(chunk["date_created"], errors="coerce")
+
+    problem = pd.Series("", index=chunk.index)
+    problem[dates.isna()] = "date_created e pavlefshme"
+    problem[~chunk["status_porosie"].isin(inventory.STATUSES)] = "status_porosie i panjohur"
+    problem[~chunk["magazinim"].isin(inventory.STORAGE_OPTIONS)] = "magazinim i panjohur"
+    problem[chunk["Produkti"].notna() & ~chunk["Produkti"].isin(products)] = (
+        "Produkti nuk eshte ne liste"
+    )
+    problem[(prices.isna() & raw_prices.notna()).any(axis=1)] = (
+        "cmim jo numerik"
+    )
+
+    valid = problem == ""
+    chunk["date_created"] = dates.dt.date
+    chunk[PRICE_COLUMNS] = prices
+    return chunk[valid], chunk[~valid].assign(problem=problem[~valid])
+
+
+def import_chunks(conn, chunks, on_progress=None):
+    """Streams validated chunks into the inventory with COPY FROM STDIN.
+
+    Runs in the caller's transaction.  Returns the number of imported rows,
+    the number of rejected rows and a sample of the rejected ones.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT Produkti FROM products")
+    products = {row[0] for row in cursor.fetchall()}
+
+    copy_sql = f"COPY inventory ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+    def write(valid):
+        buffer = io.StringIO()
+        valid.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+
+    return import_with(write, products, chunks, on_progress)
+
+
+def import_with(write, products, chunks, on_progress=None):
+    """The validation loop of ``import_chunks``, for any way of writing rows.
+
+    ``write`` is called with every chunk's valid rows.  Returns what
+    ``import_chunks`` does.
+    """
+    imported, rejected_count, rejected_samples = 0, 0, []
+    for chunk in chunks:
+        valid, rejected = validate(chunk, products)
+        write(valid)
+        imported += len(valid)
+        rejected_count += len(rejected)
+        room = MAX_REJECTED_SAMPLE - sum(len(sample) for sample in rejected_samples)
+        if room > 0 and not rejected.empty:
+            rejected_samples.append(rejected.head(room))
+        if on_progress is not None:
+            on_progress(imported, rejected_count)
+
+    sample = (
+        pd.concat(rejected_samples)
+        if rejected_samples
+        else pd.DataFrame(columns=[*COLUMNS, "problem"])
+    )
+    return imported, rejected_count, sample
+
+
+def export_csv(conn, out, date_from, date_to, statuses=(), products=(), client=None):
+    """Streams the orders of a filter into ``out`` as CSV with COPY TO.
+
+    The filter is ``inventory.load_filtered``'s.  ``out`` is a binary file;
+    the rows never become a DataFrame.
+    """
+    query, params = inventory.filtered_query(
+        date_from, date_to, statuses, products, client, columns=COLUMNS
+    )
+    cursor = conn.cursor()
+    query = cursor.mogrify(query, params).decode()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+
+
+def write_export(write):
+    """Runs ``write(out)`` into a new file of ``EXPORT_DIR``, returns its name.
+
+    Exports past ``EXPORT_TTL_SECONDS`` are removed first; a failed export
+    leaves no file behind.
+    """
+    remove_stale_exports()
+    EXPORT_DIR.mkdir(exist_ok=True)
+    path = EXPORT_DIR / f"{uuid.uuid4().hex}.csv"
+    try:
+        with open(path, "wb") as out:
+            write(out)
+        if path.stat().st_size > MAX_EXPORT_BYTES:
+            raise ValueError(
+                f"The export is larger than {MAX_EXPORT_BYTES // 2**20} MB, pick fewer days"
+            )
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path.name
+
+
+def remove_stale_exports():
+    if not EXPORT_DIR.exists():
+        return
+    cutoff = time.time() - EXPORT_TTL_SECONDS
+    for path in EXPORT_DIR.iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            # Removed by another session meanwhile
+            pass
+
+
+def remove_export(name):
+    (EXPORT_DIR / name).unlink(missing_ok=True)
+
+
+def _excel_chunks(file, chunk_rows):
+    # Read-only mode streams the sheet instead of loading it whole
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell) for cell in next(rows, ())]
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunk_rows:
+                yield pd.DataFrame(batch, columns=header, dtype=object)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header, dtype=object)
+    finally:
+        workbook.close()
+
+
+if __name__ == "__main__":
+    from duda import db
+
+    args = sys.argv[1:]
+    if args[:1] == ["import"] and len(args) == 2:
+        with open(args[1], "rb") as file, db.connection() as conn:
+            imported, rejected, _ = import_chunks(conn, read_chunks(file, args[1]))
+            conn.commit()
+        print(f"Imported {imported} rows, rejected {rejected}")
+    elif args[:1] == ["export"] and len(args) == 4:
+        with open(args[3], "wb") as out, db.connection() as conn:
+            export_csv(conn, out, args[1], args[2])
+        print(f"Exported to {args[3]}")
+    else:
+        sys.exit(
+            "usage: python -m duda.transfer import FILE\n"
+            "       python -m duda.transfer export FROM TO FILE"
+        )
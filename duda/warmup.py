@@ -0,0 +1,61 @@
+"""Background warmup of the shared caches.
+
+The first visit of a process lands on ``main.py``, which starts this warmup
+while the visitor is still on the landing page.  Opening the repository's
+backend, checking the schema and reading the catalog and the profit reports
+then happen before the Inventory page asks for them.  The inventory snapshot
+is left to the page's unpaged view, the only reader of the whole table.  Each step is
+timed as ``duda_startup_seconds`` in the diagnostics view.
+"""
+
+import sys
+import threading
+import time
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+
+from duda import metrics, products, reports, repository
+
+
+@st.cache_resource(show_spinner=False)
+def start():
+    """Starts the warmup once per process and returns its thread."""
+    thread = threading.Thread(target=_run, name="warmup", daemon=True)
+    # Streamlit's caches only read and write from threads with a script context
+    add_script_run_ctx(thread)
+    thread.start()
+    return thread
+
+
+def prewarm():
+    """Fills the backend, the schema check, the catalog and the reports."""
+    _step("repository", repository.get_primary)
+    # The first checkout opens the pool's minimum number of connections
+    _step("schema", lambda: repository.get_primary().ensure_schema())
+    # Starts the replica's sync loop, if one is configured
+    _step("replica", repository.get_local)
+    _step("catalog", products.catalog)
+    _step("reports", _load_reports)
+
+
+def _run():
+    try:
+        prewarm()
+    except Exception as e:
+        # The caches then fill on first use, as they would without the warmup
+        print(f"Warmup failed: {e!r}", file=sys.stderr)
+
+
+def _step(name, fn):
+    start = time.perf_counter()
+    fn()
+    metrics.REGISTRY.observe("duda_startup_seconds", time.perf_counter() - start, step=name)
+
+
+def _load_reports():
+    engine = reports.get_engine()
+    version = repository.get_repository().data_version()
+    # The tables only, figures are built when a report is opened
+    for future in engine.precompute(version):
+        future.result()
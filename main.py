@@ -1,5 +1,6 @@
 import streamlit as st
 
+from duda import assets, diagnostics, warmup
 
 st.set_page_config(
     initial_sidebar_state="collapsed",
@@ -8,6 +9,14 @@ st.set_page_config(
     page_icon=":shopping_bags:",  # This is an emoji shortcode. Could be a URL too.
 )
 
+# Hidden diagnostics view, see duda/diagnostics.py
+if "diagnostics" in st.query_params:
+    diagnostics.render()
+    st.stop()
+
+# Warm the data pages' caches while the first visitor is still here
+warmup.start()
+
 
 c1, c2, c3 = st.columns(3)
 
@@ -38,16 +47,11 @@ st.markdown(
 # Define a function to show different pages based on the selection
 def main():
 
-    # Define custom CSS for background image
-    # background_image_url = "/Users/enidvyshka/PycharmProjects/Inventory_App/logo.jpg"
-    background_image_url = (
-        "https://github.com/EnidVyshka/EnidVyshka/blob/main/background.JPG?raw=true"
-    )
-    # Replace with your image file or URL
+    # Background resized per viewport width, served from our own static dir
     background_css = f"""
         <style>
+            {assets.background_css(".stApp")}
             .stApp {{
-                background-image: url("{background_image_url}");
                 background-size: cover;
                 background-position-y: left;
                 background-position-x: center;
@@ -69,7 +73,7 @@ def main():
     st.header("")
     st.header("")
 
-    st.image("vector-logo.png", width=200)
+    st.markdown(assets.logo_html(width=200), unsafe_allow_html=True)
     if btn2:
         st.switch_page("pages/Inventory_Page.py")
     if btn3:
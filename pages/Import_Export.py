@@ -0,0 +1,113 @@
+import streamlit as st
+
+from duda import inventory, metrics, products, repository, transfer
+
+timer = metrics.RerunTimer("Import_Export")
+
+c1, c2, c3 = st.columns(3)
+
+with c1:
+    btn1 = st.button("Home", use_container_width=True, key="H4")
+with c2:
+    btn2 = st.button("Inventory Tracker", use_container_width=True, key="I4")
+with c3:
+    btn3 = st.button("Produktet", use_container_width=True, key="P4")
+
+if btn2:
+    st.switch_page("pages/Inventory_Page.py")
+if btn3:
+    st.switch_page("pages/Products.py")
+if btn1:
+    st.switch_page("main.py")
+
+
+st.header("Import / Eksport i te dhenave")
+try:
+    repo = repository.get_repository()
+    repo.ensure_schema()
+except repository.ERRORS as e:
+    st.error(f"Error connecting to database: {e}")
+    st.stop()
+
+# -----------------------------------------------------------------------------
+# Import a CSV or Excel file into the inventory.
+
+st.subheader("Importi")
+st.info(
+    """
+    Skedari duhet te kete kolonat date_created, magazinim dhe status_porosie.
+    Kolonat e tjera (Produkti, Porositesi, Description, Cmim_shitje, Cmim_pound,
+    Cmim_blerje, link) jane opsionale. \n
+    """
+)
+
+uploaded = st.file_uploader("Zgjidhni skedarin", type=["csv", "xlsx"])
+if uploaded is not None and st.button("Importo", type="primary"):
+    progress = st.empty()
+    try:
+        imported, rejected, rejected_sample = repo.import_chunks(
+            transfer.read_chunks(uploaded, uploaded.name),
+            on_progress=lambda done, skipped: progress.caption(
+                f"U importuan {done} rreshta, u refuzuan {skipped}"
+            ),
+        )
+    except (ValueError, *repository.ERRORS) as e:
+        st.error(f"Importi deshtoi, asnje rresht nuk u ruajt: {e}")
+    else:
+        st.success(f"U importuan {imported} rreshta.")
+        if rejected:
+            st.warning(f"{rejected} rreshta u refuzuan:")
+            st.dataframe(rejected_sample, hide_index=True, use_container_width=True)
+
+# -----------------------------------------------------------------------------
+# Export the orders of a filter, the same one as the "Filtrimi" view's, as CSV.
+
+st.subheader("Eksporti")
+e1, e2 = st.columns(2)
+with e1:
+    export_from = st.date_input("Zgjidhni daten e fillimit: ", key="e1")
+with e2:
+    export_to = st.date_input("Zgjidhni daten e mbarimit: ", key="e2")
+e3, e4, e5 = st.columns(3)
+with e3:
+    export_statuses = st.multiselect("Statusi", inventory.STATUSES, key="e3")
+with e4:
+    export_products = st.multiselect("Artikulli", products.catalog(), key="e4")
+with e5:
+    export_client = st.text_input("Klienti", key="e5").strip()
+
+if export_from > export_to:
+    st.warning("Data e fillimit duhet te jete me perpara ne kohe se data e mbarimit")
+elif st.button("Pergatit eksportin"):
+    if "export_file" in st.session_state:
+        transfer.remove_export(st.session_state.pop("export_file")[0])
+    try:
+        name = transfer.write_export(
+            lambda out: repo.export_csv(
+                out,
+                export_from,
+                export_to,
+                tuple(export_statuses),
+                tuple(export_products),
+                export_client or None,
+            )
+        )
+    except (ValueError, *repository.ERRORS) as e:
+        st.error(f"Eksporti deshtoi: {e}")
+    else:
+        st.session_state.export_file = (name, f"inventari_{export_from}_{export_to}.csv")
+
+if "export_file" in st.session_state:
+    name, file_name = st.session_state.export_file
+    if not (transfer.EXPORT_DIR / name).exists():
+        st.session_state.pop("export_file")
+        st.caption("Eksporti i pergatitur ka skaduar, pergatiteni perseri.")
+    else:
+        # A link to the file on disk: a download button would read it whole
+        # into memory again on every rerun
+        st.markdown(
+            f'<a href="{transfer.EXPORT_URL}/{name}" download="{file_name}">Shkarko CSV</a>',
+            unsafe_allow_html=True,
+        )
+
+timer.finish()
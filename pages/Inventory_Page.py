@@ -1,9 +1,19 @@
-from collections import defaultdict
+from datetime import date
 
 import streamlit as st
-import pandas as pd
-import plotly.graph_objs as go
-import psycopg2
+
+from duda import (
+    customers,
+    inventory,
+    metrics,
+    products,
+    replica,
+    reports,
+    repository,
+    search,
+)
+
+timer = metrics.RerunTimer("Inventory")
 
 c1, c2, c3 = st.columns(3)
 
@@ -26,220 +36,109 @@ if btn1:
 # Declare some useful functions.
 
 
-# Function to connect to the Supabase PostgreSQL database
-def connect_to_db():
+def update_data(df, changes):
+    """Hands the changes to the repository; with Postgres they are journaled."""
+    resolved = inventory.resolve_changes(df, changes)
     try:
-        conn = psycopg2.connect(
-            host=st.secrets.db_credentials["host"],
-            port=st.secrets.db_credentials["port"],
-            dbname=st.secrets.db_credentials["db_name"],
-            user=st.secrets.db_credentials["db_user"],
-            password=st.secrets.db_credentials["db_password"],
-        )
-        return conn
-    except Exception as e:
-        st.error(f"Error connecting to database: {e}")
-        return None
+        key = repository.get_repository().save(resolved)
+    except repository.ERRORS as e:
+        st.error(f"Ruajtja deshtoi, asnje ndryshim nuk u ruajt: {e}")
+        return
+    # The journal holds the edits now, the grid shows them as pending until
+    # their result arrives
+    st.session_state.setdefault("pending_saves", {})[key] = resolved
+    st.session_state.pop("inventory_table", None)
+
+
+@st.experimental_fragment(run_every=2)
+def pending_saves_indicator():
+    """Shows the saves still on their way and reruns the page once they land."""
+    keys = st.session_state.get("pending_saves")
+    if not keys:
+        return
+    repo = repository.get_repository()
+    results = repo.save_results(list(keys))
+    if results:
+        st.session_state.pending_saves = {
+            key: resolved for key, resolved in keys.items() if key not in results
+        }
+        st.session_state.save_results = list(results.values())
+        st.rerun()
+    count, last_error = repo.pending_saves()
+    st.info(f"⏳ {count} ruajtje ne pritje per databazen...")
+    if last_error:
+        st.caption(f"Perpjekja e fundit deshtoi, do te provohet perseri: {last_error}")
+
+
+def data_token(repo):
+    """The writes of every instance this page has seen, read before it loads.
+
+    A write landing during the load then still counts as unseen.
+    """
+    return repo.generation("inventory"), repo.generation("products")
+
 
-# Try connecting to the database
-conn = connect_to_db()
+@st.experimental_fragment(run_every=2)
+def live_refresh():
+    """Reruns the page once another instance's write reached this one.
 
-if conn:
-    # You can execute SQL queries here if connected
+    Only while nothing is being edited, the grid's edits refer to its rows by
+    position.
+    """
+    if not st.session_state.get("live_refresh") or st.session_state.get("pending_saves"):
+        return
+    if any(len(v) for v in st.session_state.get("inventory_table", {}).values()):
+        return
+    seen = st.session_state.get("data_token"), st.session_state.get("data_version")
+    repo = repository.get_repository()
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT version();")  # Example query
-        version = cur.fetchone()
-        # st.write(f"PostgreSQL version: {version[0]}")
-        cur.close()
-    except Exception as e:
-        st.error(f"Failed to run query: {e}")
-    finally:
-        conn.close()
-else:
-    st.error("Connection failed.")
-
-
-def initialize_data(conn):
-    """Initializes the inventory table with some data."""
-    cursor = conn.cursor()
-
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS inventory (
-            id SERIAL PRIMARY KEY,
-            Produkti TEXT,
-            Cmim_shitje FLOAT,
-            Cmim_blerje FLOAT,
-            Cmim_pound FLOAT,
-            Description TEXT,
-            magazinim TEXT,
-            status_porosie TEXT,
-            Porositesi TEXT,
-            link TEXT,
-            date_created DATE
-        )
-        """
-    )
+        current = data_token(repo), repo.data_version()
+    except repository.ERRORS:
+        # The next rerun reports the outage
+        return
+    if current != seen:
+        st.rerun()
 
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS products (
-            id SERIAL PRIMARY KEY,
-            Produkti TEXT
-        )
-        """
-    )
 
-    conn.commit()
+def zoom_daily_chart():
+    """Narrows the daily report to the dates boxed on its chart."""
+    boxes = st.session_state.daily_chart["selection"].get("box") or []
+    if boxes and boxes[0].get("x"):
+        # Date axes report the box edges as "YYYY-MM-DD hh:mm:ss" strings
+        days = sorted(date.fromisoformat(str(x)[:10]) for x in boxes[0]["x"])
+        st.session_state.daily_range = (days[0], days[-1])
 
 
-def load_data(conn):
-    """Loads the inventory data from the database."""
-    cursor = conn.cursor()
+def reset_daily_range():
+    st.session_state.pop("daily_range", None)
 
-    try:
-        cursor.execute("SELECT * FROM inventory")
-        data = cursor.fetchall()
-    except:
-        return None
-
-    df = pd.DataFrame(
-        data,
-        columns=[
-            "id",
-            "Produkti",
-            "Cmim_shitje",
-            "Cmim_pound",
-            "Cmim_blerje",
-            "Description",
-            "magazinim",
-            "status_porosie",
-            "Porositesi",
-            "link",
-            "date_created",
-        ],
-    )
 
-    return df
-
-
-def update_data(conn, df, changes):
-    """Updates the inventory data in the database."""
-    cursor = conn.cursor()
-
-    if changes["edited_rows"]:
-        deltas = st.session_state.inventory_table["edited_rows"]
-        rows = []
-
-        for i, delta in deltas.items():
-            row_dict = df.iloc[i].to_dict()
-            row_dict.update({"date_created": row_dict["date_created"].date()})
-            row_dict.update(delta)
-            rows.append(row_dict)
-
-        data_edited = [
-            (
-                row.get('Produkti'),
-                row.get('Cmim_shitje'),
-                row.get('Cmim_pound'),
-                row.get('Cmim_blerje'),
-                row.get('Description'),
-                row.get('magazinim'),
-                row.get('status_porosie'),
-                row.get('Porositesi'),
-                row.get('link'),
-                row.get('date_created'),
-                row.get('id')  # `id` must be the last element
-            )
-            for row in rows
-        ]
-        cursor.executemany(
-            """
-            UPDATE inventory
-            SET
-                Produkti = %s,
-                Cmim_shitje = %s,
-                Cmim_pound = %s,
-                Cmim_blerje = %s,
-                Description = %s,
-                magazinim = %s,
-                status_porosie = %s,
-                Porositesi = %s,
-                link = %s,
-                date_created = %s
-            WHERE id = %s
-            """,
-            data_edited,
-        )
+def reset_inventory_page():
+    """Goes back to the first page and drops edits made on the previous one."""
+    st.session_state.inventory_cursors = [None]
+    st.session_state.pop("inventory_table", None)
 
-    if changes["added_rows"]:
-        data = [
-            (
-                # row.get('id', None),
-                row.get('Produkti', None),
-                row.get('Porositesi', None),
-                row.get('Cmim_shitje', None),
-                row.get('Cmim_pound', None),
-                row.get('Cmim_blerje', None),
-                row.get('Description', None),
-                row.get('magazinim', None),
-                row.get('status_porosie', None),
-                row.get('link', None),
-                row.get('date_created', None)
-            )
-            for row in changes["added_rows"]
-        ]
-
-        cursor.executemany(
-            """
-                INSERT INTO inventory
-                    (Produkti, Porositesi, Cmim_shitje, Cmim_pound, Cmim_blerje, Description, magazinim, status_porosie, link, date_created)
-                VALUES
-                    (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-            data,
-        )
 
-    if changes["deleted_rows"]:
+def go_to_next_page(cursor):
+    st.session_state.inventory_cursors.append(cursor)
+    st.session_state.pop("inventory_table", None)
 
-        data = [(int(df.loc[i, "id"]),) for i in changes["deleted_rows"]]
-        cursor.executemany(
-            "DELETE FROM inventory WHERE id = %s",
-            data,
-        )
 
-    conn.commit()
+def go_to_previous_page():
+    st.session_state.inventory_cursors.pop()
+    st.session_state.pop("inventory_table", None)
 
 
-def fetch_data(table):
-    cursor = conn.cursor()
-    cursor.execute(
-        f"""
-        SELECT * from "{table}";
-        """
-    )
-    result = cursor.fetchall()
-    conn.commit()
-    # conn.close()
-    return result
-
-
-def get_number_of_tickets_with_status(status):
-    cursor = conn.cursor()
-    cursor.execute(
-        f"""
-            SELECT 
-               COUNT(status_porosie) 
-            FROM 
-               "inventory"
-            WHERE
-               status_porosie = '{status}';
-        """
-    )
-    result = cursor.fetchall()
-    conn.commit()
-    return result[0][0]
+def reset_customer_page():
+    st.session_state.customer_cursors = [None]
+
+
+def go_to_next_customers(cursor):
+    st.session_state.customer_cursors.append(cursor)
+
+
+def go_to_previous_customers():
+    st.session_state.customer_cursors.pop()
 
 
 # -----------------------------------------------------------------------------
@@ -257,22 +156,149 @@ st.info(
     """
 )
 
-# Connect to database and create table if needed
-conn = connect_to_db()
-initialize_data(conn)
+# Keyset cursors of the pages visited so far, the last one is the current page
+if "inventory_cursors" not in st.session_state:
+    st.session_state.inventory_cursors = [None]
 
-# Initialize data.
-# if db_was_just_created:
-# initialize_data(conn)
-# st.toast("Database initialized.")
+with st.expander("Faqosja e tabeles"):
+    paged = st.toggle(
+        "Shfaq tabelen me faqe",
+        value=True,
+        key="inventory_paged",
+        on_change=reset_inventory_page,
+    )
+    p1, p2, p3 = st.columns(3)
+    with p1:
+        sort_key = st.selectbox(
+            "Rendit sipas",
+            options=inventory.SORT_KEYS,
+            format_func={"id": "ID", "date_created": "Data"}.get,
+            key="inventory_sort_key",
+            on_change=reset_inventory_page,
+            disabled=not paged,
+        )
+    with p2:
+        page_size = st.selectbox(
+            "Rreshta per faqe",
+            options=[50, 100, 250, 500],
+            index=1,
+            key="inventory_page_size",
+            on_change=reset_inventory_page,
+            disabled=not paged,
+        )
+    with p3:
+        # Optional window, an empty or half-picked range loads every date
+        date_window = st.date_input(
+            "Periudha (opsionale)",
+            value=(),
+            key="inventory_date_window",
+            on_change=reset_inventory_page,
+            disabled=not paged,
+        )
+    st.toggle(
+        "Rifresko tabelen kur dikush tjeter ruan ndryshime",
+        value=True,
+        key="live_refresh",
+        disabled=repository.get_listener() is None,
+    )
 
-# Load data from database
-df = load_data(conn)
-df["date_created"] = pd.to_datetime(df["date_created"])
-# Display data with editable table
+# Migrate the schema once per process, then read everything the page needs
+# in one transaction
+next_cursor = None
+try:
+    repo = repository.get_repository()
+    st.session_state.data_token = data_token(repo)
+    repo.ensure_schema()
+    with repo.transaction():
+        # The key of the page's caches, read before the load like the token
+        st.session_state.data_version = repo.data_version()
+        if paged:
+            date_from, date_to = date_window if len(date_window) == 2 else (None, None)
+            df, next_cursor = repo.load_page(
+                sort_key=sort_key,
+                after=st.session_state.inventory_cursors[-1],
+                page_size=page_size,
+                date_from=date_from,
+                date_to=date_to,
+            )
+        else:
+            # One shared, delta-refreshed copy of the inventory for the whole page
+            df = repo.refresh_snapshot(inventory.get_snapshot())
+        status_counts, stock = repo.counters()
+except repository.ERRORS as e:
+    st.error(f"Error connecting to database: {e}")
+    st.stop()
+if isinstance(repo, replica.Replica) and repo.last_error:
+    st.caption("Databaza nuk po pergjigjet, po shfaqen te dhenat e kopjes lokale.")
+timer.lap("load")
+
+# Live counters, kept current by database triggers
+status_counts = status_counts.set_index("status_porosie")
+kpis = st.columns(len(inventory.STATUSES) + 1)
+for column, status in zip(kpis, inventory.STATUSES):
+    column.metric(status, int(status_counts["count"].get(status, 0)))
+kpis[-1].metric(
+    "Xhiro ne pritje (ALL)", f"{status_counts['amount'].get('Pending', 0):,.2f}"
+)
+with st.expander("Stoku ne inventar"):
+    st.dataframe(
+        stock,
+        column_config={
+            "Produkti": st.column_config.TextColumn("Artikulli"),
+            "count": st.column_config.NumberColumn("Sasia"),
+        },
+        hide_index=True,
+        use_container_width=True,
+    )
+
+# Typo-tolerant search over all orders, ranked, not just the page in the grid
+query = st.text_input(
+    "Kerko porosi",
+    placeholder="Klienti, artikulli ose pershkrimi",
+    key="inventory_search",
+).strip()
+if len(query) >= search.MIN_QUERY_LENGTH:
+    try:
+        found = repository.matches(st.session_state.data_version, query)
+    except repository.ERRORS as e:
+        st.error(f"Kerkimi deshtoi: {e}")
+    else:
+        st.caption(f"U gjeten {len(found)} porosi, me te pershtatshmet ne fillim.")
+        st.dataframe(
+            found,
+            column_order=[
+                "date_created",
+                "Porositesi",
+                "Produkti",
+                "Description",
+                "status_porosie",
+                "Cmim_shitje",
+            ],
+            column_config={
+                "date_created": st.column_config.DateColumn("Data"),
+                "Porositesi": st.column_config.TextColumn("Klienti"),
+                "Produkti": st.column_config.TextColumn("Artikulli"),
+                "status_porosie": st.column_config.TextColumn("Order Status"),
+                "Cmim_shitje": st.column_config.NumberColumn(format="ALL %.2f"),
+            },
+            hide_index=True,
+            use_container_width=True,
+        )
+elif query:
+    st.caption(f"Shkruani te pakten {search.MIN_QUERY_LENGTH} shkronja per te kerkuar.")
+timer.lap("search")
+
+# Display data with editable table.  Saves still on their way are shown over
+# the loaded rows, and the grid stays read-only until they land: its edits
+# refer to the rows by position and row_version.
+pending = st.session_state.get("pending_saves")
 edited_df = st.data_editor(
-    df.drop(columns=["id"]),
+    inventory.editor_frame(
+        inventory.with_pending(df, pending.values()) if pending else df,
+        products.catalog(),
+    ),
     column_order=[
+        *(["pending"] if pending else []),
         "date_created",
         "Porositesi",
         "Produkti",
@@ -284,28 +310,27 @@ edited_df = st.data_editor(
         "Cmim_blerje",
     ],
     # disabled=['id'],  # Don't allow editing the 'id' column.
-    num_rows="dynamic",  # Allow appending/deleting rows.
+    disabled=bool(pending),
+    num_rows="fixed" if pending else "dynamic",  # Allow appending/deleting rows.
     column_config={
+        "pending": st.column_config.TextColumn("⏳ Ne pritje"),
         "date_created": st.column_config.DateColumn("Data", required=True),
         "Porositesi": st.column_config.TextColumn("Klienti"),
         "Produkti": st.column_config.SelectboxColumn(
-            "Artikulli", options=[t[1:][0] for t in fetch_data("products")]
+            "Artikulli", options=products.catalog()
         ),
         "magazinim": st.column_config.SelectboxColumn(
             "Magazinim",
             # help="The category of the app",
             width="medium",
-            options=[
-                "Porosi e re",
-                "Inventar",
-            ],
+            options=inventory.STORAGE_OPTIONS,
             required=True,
         ),
         "status_porosie": st.column_config.SelectboxColumn(
             "Order Status",
             # help="The category of the app",
             width="medium",
-            options=["Pending", "Likujduar", "Dorezuar", "Anulluar", "Kthyer"],
+            options=inventory.STATUSES,
             required=True,
         ),
         # "link": st.column_config.LinkColumn("Foto"),
@@ -329,280 +354,315 @@ st.button(
     disabled=not has_uncommitted_changes,
     # Update data in database
     on_click=update_data,
-    args=(conn, df, st.session_state.inventory_table),
+    args=(df, st.session_state.inventory_table),
 )
-
-data_from_db = fetch_data("inventory")
-data_to_df = pd.DataFrame(data_from_db)
-
-df_renamed = data_to_df.rename(
-    columns={
-        1: "Produkti",
-        2: "Cmim_shitje",
-        4: "Cmim_blerje",
-        7: "Statusi",
-        10: "Data",
-    }
-)
-
-st.subheader(" ⚙️ Filtrimi i te dhenave ")
-with st.expander("Klikoni KETU per te filtruar tabelen"):
-    q1, q2 = st.columns(2)
-    with q1:
-        st.title("")
-        data1 = st.date_input("Zgjidhni daten e fillimit: ", key="q1")
-    with q2:
-        st.title("")
-        data2 = st.date_input("Zgjidhni daten e mbarimit: ", key="q2")
-    if data1 > data2:
-        st.warning(
-            "Data e fillimit duhet te jete me perpara ne kohe se data e mbarimit"
-        )
-    else:
-        try:
-            df_renamed["Data"] = pd.to_datetime(df_renamed["Data"])
-            filtered_dff = df_renamed[
-                (df_renamed["Data"].dt.date >= data1)
-                & (df_renamed["Data"].dt.date <= data2)
-                ]
-            filtered_dff["date_only"] = filtered_dff["Data"].dt.date
-            st.dataframe(
-                filtered_dff,
-                column_order=[
-                    "date_only",
-                    "8",
-                    "Produkti",
-                    "5",
-                    "6",
-                    "Statusi",
-                    "Cmim_shitje",
-                    "3",
-                    "Cmim_blerje",
-                ],
-                column_config={
-                    "date_only": st.column_config.DateColumn("Date"),
-                    "8": st.column_config.TextColumn("Klienti"),
-                    "5": st.column_config.TextColumn("Description"),
-                    "6": st.column_config.TextColumn("Magazinim"),
-                    "7": st.column_config.TextColumn("Order Status"),
-                    "Produkti": st.column_config.TextColumn("Artikulli"),
-                    "Porositesi": st.column_config.TextColumn("Klienti"),
-                    "Cmim_shitje": st.column_config.NumberColumn(
-                        "Cmim Shitje", format="ALL %.2f"
-                    ),
-                    "Cmim_blerje": st.column_config.NumberColumn(
-                        "Cmim Blerje", format="ALL %.2f"
-                    ),
-                    "3": st.column_config.NumberColumn("Cmim Pound", format="£ %.2f"),
-                },
-                use_container_width=True,
-            )  # Display the DataFrame inside the expander
-        except:
-            st.error("Databaze eshte bosh. Ju lutem shtoni artikuj")
-
-if not df.empty:
-    st.markdown("## 📈 Statistika dhe Raporte")
-
-    # Define options
-    options = ["Raport Mujor Profit", "Raport Ditor Profit", "Raport Sipas Produktit"]
-
-    # Add a placeholder option
-    options_with_placeholder = ["Zgjidhni nje raport..."] + options
-
-    report_type = st.selectbox("Zgjidhni llojin e raportit: ", options_with_placeholder)
-    df_likujduar = df_renamed[df_renamed["Statusi"] == "Likujduar"]
-
-    # Group by 'Category' and calculate sum of 'Value'
-    grouped_df = (
-        df_likujduar.groupby("Data")
-        .agg({"Cmim_shitje": "sum", "Cmim_blerje": "sum"})
-        .reset_index()
+pending_saves_indicator()
+if repository.get_listener() is not None:
+    live_refresh()
+
+save_results = st.session_state.pop("save_results", [])
+for result in save_results:
+    if result["error"]:
+        st.error(f"Databaza refuzoi nje ruajtje, ajo nuk u ruajt: {result['error']}")
+conflicts = [conflict for result in save_results for conflict in result["conflicts"]]
+if conflicts:
+    st.error(
+        f"{len(conflicts)} rreshta nuk u ruajten sepse dikush tjeter i ndryshoi "
+        "ndermjet. Tabela tregon tani versionin e tyre te fundit, aplikoni "
+        "perseri ndryshimet nese duhen. Te gjitha ndryshimet e tjera u ruajten."
+    )
+    st.dataframe(
+        [
+            {
+                "ID": conflict["id"],
+                "Ndryshimi juaj": (
+                    ", ".join(f"{k}: {v}" for k, v in conflict["change"].items())
+                    if conflict["change"] is not None
+                    else "Fshirje"
+                ),
+                "Gjendja": (
+                    "U ndryshua" if conflict["status"] == "changed" else "U fshi"
+                ),
+            }
+            for conflict in conflicts
+        ],
+        hide_index=True,
     )
 
-    grouped_df.columns = ["Dita", "Xhiro (ALL)", "Blerje (ALL)"]
-    grouped_df["Difference"] = grouped_df["Xhiro (ALL)"] - grouped_df["Blerje (ALL)"]
-
-    if report_type == "Raport Ditor Profit":
-        st.subheader("\nRaport Ditor Profit")
-        st.data_editor(
-            grouped_df, use_container_width=True, hide_index=True, disabled=True
+if paged:
+    n1, n2, n3 = st.columns([1, 1, 4])
+    with n1:
+        st.button(
+            "Faqja e meparshme",
+            disabled=has_uncommitted_changes
+            or len(st.session_state.inventory_cursors) == 1,
+            on_click=go_to_previous_page,
         )
-        st.subheader("\nGrafiku Ditor Profit")
-        fig = go.Figure()
-        grouped_df["Dita"] = grouped_df["Dita"].astype(str)
-
-        for column in grouped_df.columns[
-                      1:
-                      ]:  # Skip the first column (Month) for x-values
-            fig.add_trace(
-                go.Scatter(
-                    x=grouped_df["Dita"],  # x-values (months)
-                    y=grouped_df[column],  # y-values
-                    mode="lines+markers",
-                    name=column,
-                )
-            )
-
-        # Update layout for the chart
-        fig.update_layout(
-            xaxis_title="Dita",
-            yaxis_title="Vlerat",
-            xaxis=dict(
-                tickformat="%d %b %Y ",  # Format: 'Jan 2024'
-                tickvals=grouped_df["Dita"],  # Ensure all months are displayed
-            ),
-            template="plotly_white",
+    with n2:
+        st.button(
+            "Faqja tjeter",
+            disabled=has_uncommitted_changes or next_cursor is None,
+            on_click=go_to_next_page,
+            args=(next_cursor,),
         )
+    with n3:
+        st.caption(f"Faqja {len(st.session_state.inventory_cursors)}")
 
-        # Display the plotly chart in Streamlit
-        st.plotly_chart(fig)
-
-        # print(grouped_df.shape)
-        df_dropped = grouped_df.drop("Blerje (ALL)", axis=1)
-        df_dropped.set_index("Dita", inplace=True)
+timer.lap("editor")
 
-        # st.line_chart(df_dropped)
 
-    elif report_type == "Raport Sipas Produktit":
-        a1, a2 = st.columns(2)
-        with a1:
+@st.experimental_fragment
+def filter_section():
+    """The filter view; its widgets rerun only this function."""
+    section_timer = metrics.RerunTimer("Inventory:filter")
+    st.subheader(" ⚙️ Filtrimi i te dhenave ")
+    with st.expander("Klikoni KETU per te filtruar tabelen"):
+        q1, q2 = st.columns(2)
+        with q1:
             st.title("")
-            data_e_pare = st.date_input("Zgjidhni daten e fillimit: ", key="d1")
-        with a2:
+            data1 = st.date_input("Zgjidhni daten e fillimit: ", key="q1")
+        with q2:
             st.title("")
-            data_e_dyte = st.date_input("Zgjidhni daten e mbarimit: ", key="d2")
-
-        if data_e_pare > data_e_dyte:
+            data2 = st.date_input("Zgjidhni daten e mbarimit: ", key="q2")
+        q3, q4, q5 = st.columns(3)
+        with q3:
+            filter_statuses = st.multiselect("Statusi", inventory.STATUSES, key="q3")
+        with q4:
+            filter_products = st.multiselect("Artikulli", products.catalog(), key="q4")
+        with q5:
+            filter_client = st.text_input("Klienti", key="q5").strip()
+        if data1 > data2:
             st.warning(
                 "Data e fillimit duhet te jete me perpara ne kohe se data e mbarimit"
             )
         else:
+            try:
+                # Only the matching rows are read, and kept until the next save
+                filtered_dff = repository.filtered(
+                    st.session_state.data_version,
+                    data1,
+                    data2,
+                    tuple(filter_statuses),
+                    tuple(filter_products),
+                    filter_client or None,
+                ).rename(columns={"status_porosie": "Statusi", "date_created": "Data"})
+            except repository.ERRORS as e:
+                st.error(f"Filtrimi deshtoi: {e}")
+            else:
+                if filtered_dff.empty:
+                    st.info("Asnje porosi nuk i pershtatet ketij filtri.")
+                else:
+                    filtered_dff["date_only"] = filtered_dff["Data"].dt.date
+                    st.dataframe(
+                        filtered_dff,
+                        column_order=[
+                            "date_only",
+                            "Porositesi",
+                            "Produkti",
+                            "Description",
+                            "magazinim",
+                            "Statusi",
+                            "Cmim_shitje",
+                            "Cmim_pound",
+                            "Cmim_blerje",
+                        ],
+                        column_config={
+                            "date_only": st.column_config.DateColumn("Date"),
+                            "Description": st.column_config.TextColumn("Description"),
+                            "magazinim": st.column_config.TextColumn("Magazinim"),
+                            "Statusi": st.column_config.TextColumn("Order Status"),
+                            "Produkti": st.column_config.TextColumn("Artikulli"),
+                            "Porositesi": st.column_config.TextColumn("Klienti"),
+                            "Cmim_shitje": st.column_config.NumberColumn(
+                                "Cmim Shitje", format="ALL %.2f"
+                            ),
+                            "Cmim_blerje": st.column_config.NumberColumn(
+                                "Cmim Blerje", format="ALL %.2f"
+                            ),
+                            "Cmim_pound": st.column_config.NumberColumn(
+                                "Cmim Pound", format="£ %.2f"
+                            ),
+                        },
+                        use_container_width=True,
+                    )  # Display the DataFrame inside the expander
+
+    section_timer.finish()
+
+
+@st.experimental_fragment
+def reports_section(has_orders):
+    """The reports; picking one or changing its dates reruns only this function."""
+    section_timer = metrics.RerunTimer("Inventory:reports")
+    # Built in the background once per data version, so this is mostly a lookup
+    engine = reports.get_engine()
+    version = st.session_state.data_version
+    engine.precompute(version)
+    if has_orders:
+        st.markdown("## 📈 Statistika dhe Raporte")
+
+        # Define options
+        options = [reports.MONTHLY, reports.DAILY, reports.BY_PRODUCT, reports.BY_CUSTOMER]
+
+        # Add a placeholder option
+        options_with_placeholder = ["Zgjidhni nje raport..."] + options
+
+        report_type = st.selectbox(
+            "Zgjidhni llojin e raportit: ", options_with_placeholder
+        )
 
-            raport_ditor_produkt = (
-                df_renamed.groupby(["Data", "Produkti"])
-                .size()
-                .reset_index(name="Count")
-            )
-            # st.dataframe(raport_ditor_produkt,
-            #              use_container_width=True,
-            #              hide_index=True)
-
-            raport_ditor_produkt["Data"] = pd.to_datetime(raport_ditor_produkt["Data"])
-            # raport_ditor_produkt
-
-            filtered_df_by_timerange = raport_ditor_produkt[
-                (raport_ditor_produkt["Data"].dt.date >= data_e_pare)
-                & (raport_ditor_produkt["Data"].dt.date <= data_e_dyte)
-                ]
+        if report_type == reports.DAILY:
+            # A range picked on the chart is re-fetched at full resolution
+            daily_range = st.session_state.get("daily_range")
+            report = engine.get(version, reports.DAILY, *(daily_range or ()))
+            section_timer.lap("report_data")
 
-            filtered_df_by_timerange = filtered_df_by_timerange.groupby("Produkti")[
-                "Count"
-            ].sum()
+            st.subheader("\nRaport Ditor Profit")
+            st.data_editor(
+                report.table, use_container_width=True, hide_index=True, disabled=True
+            )
+            st.subheader("\nGrafiku Ditor Profit")
+            if daily_range:
+                st.caption(f"Periudha {daily_range[0]} - {daily_range[1]}")
+                st.button("Shfaq te gjithe periudhen", on_click=reset_daily_range)
+            else:
+                st.caption(
+                    "Zgjidhni nje interval ne grafik (Box Select) per ta pare ne detaje."
+                )
+            st.plotly_chart(
+                report.figure,
+                key="daily_chart",
+                on_select=zoom_daily_chart,
+                selection_mode="box",
+            )
 
-            filtered_df_by_timerange = filtered_df_by_timerange.reset_index()
+        elif report_type == reports.BY_PRODUCT:
+            a1, a2 = st.columns(2)
             with a1:
+                st.title("")
+                data_e_pare = st.date_input("Zgjidhni daten e fillimit: ", key="d1")
+            with a2:
+                st.title("")
+                data_e_dyte = st.date_input("Zgjidhni daten e mbarimit: ", key="d2")
 
-                st.subheader("Tabela Permbledhese sipas Produktit")
-                st.subheader("")
-                st.dataframe(
-                    filtered_df_by_timerange, use_container_width=True, hide_index=True
+            if data_e_pare > data_e_dyte:
+                st.warning(
+                    "Data e fillimit duhet te jete me perpara ne kohe se data e mbarimit"
                 )
-
-            if not filtered_df_by_timerange.empty:
-                fig = go.Figure(
-                    data=[
-                        go.Pie(
-                            labels=filtered_df_by_timerange["Produkti"],
-                            values=filtered_df_by_timerange["Count"],
-                            hole=0.3,  # Creates a donut chart; set to 0 for a regular pie chart
-                            textinfo="label+value",  # Display label and percentage on the pie chart
-                            insidetextorientation="radial",  # Ensures text is displayed radially inside the pie
-                        )
-                    ]
+            else:
+                report = engine.get(
+                    version, reports.BY_PRODUCT, data_e_pare, data_e_dyte
                 )
-
-                # Update layout
-                fig.update_layout(
-                    annotations=[
-                        dict(text="Chart", x=0.5, y=0.5, font_size=25, showarrow=False)
-                    ]
+                section_timer.lap("report_data")
+                with a1:
+
+                    st.subheader("Tabela Permbledhese sipas Produktit")
+                    st.subheader("")
+                    st.dataframe(
+                        report.table,
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+
+                if report.figure is not None:
+                    # Display the pie chart in Streamlit
+                    with a2:
+                        st.subheader("Grafiku Permbledhes sipas Produktit")
+                        st.plotly_chart(report.figure)
+                else:
+                    st.warning(
+                        "Nuk ka te dhena shitje per daten e zgjedhur. Provoni nje date tjeter!"
+                    )
+
+        elif report_type == reports.MONTHLY:
+            report = engine.get(version, reports.MONTHLY)
+            section_timer.lap("report_data")
+
+            st.subheader("\nRaport Mujor Profit")
+            st.data_editor(
+                report.table, use_container_width=True, hide_index=True, disabled=True
+            )
+            st.subheader("Grafiku Permbledhes Mujor Profit")
+            st.plotly_chart(report.figure)
+
+        elif report_type == reports.BY_CUSTOMER:
+            # Keyset cursors of the ledger pages visited, like the grid's
+            if "customer_cursors" not in st.session_state:
+                st.session_state.customer_cursors = [None]
+            cursors = st.session_state.customer_cursors
+            k1, k2 = st.columns(2)
+            with k1:
+                ledger_sort = st.selectbox(
+                    "Rendit klientet sipas",
+                    options=list(customers.SORT_KEYS),
+                    format_func={
+                        "revenue": "Xhiro",
+                        "margin": "Fitimi",
+                        "pending": "Balanca ne pritje",
+                        "orders": "Numri i porosive",
+                        "returns": "Kthimet",
+                    }.get,
+                    key="customer_sort_key",
+                    on_change=reset_customer_page,
                 )
-
-                # Display the pie chart in Streamlit
-                with a2:
-                    st.subheader("Grafiku Permbledhes sipas Produktit")
-                    st.plotly_chart(fig)
-            else:
-                st.warning(
-                    "Nuk ka te dhena shitje per daten e zgjedhur. Provoni nje date tjeter!"
+            with k2:
+                ledger_size = st.selectbox(
+                    "Kliente per faqe (Top N)",
+                    options=[10, 25, 50, 100],
+                    index=[10, 25, 50, 100].index(customers.PAGE_SIZE),
+                    key="customer_page_size",
+                    on_change=reset_customer_page,
                 )
-
-    elif report_type == "Raport Mujor Profit":
-        grouped_df["Dita"] = pd.to_datetime(grouped_df["Dita"])
-        grouped_df["YearMonth"] = grouped_df["Dita"].dt.to_period("M")
-
-        # Group by 'YearMonth' and aggregate
-        grouped_df = (
-            grouped_df.groupby("YearMonth")
-            .agg(
-                {
-                    "Xhiro (ALL)": "sum",
-                    "Blerje (ALL)": "sum",
-                }
+            report = engine.get(
+                version, reports.BY_CUSTOMER, ledger_sort, cursors[-1], ledger_size
             )
-            .reset_index()
-        )
-
-        grouped_df["Difference"] = (
-                grouped_df["Xhiro (ALL)"] - grouped_df["Blerje (ALL)"]
-        )
-        grouped_df.rename(
-            columns={
-                "YearMonth": "Muaji",
-            },
-            inplace=True,
-        )
+            section_timer.lap("report_data")
 
-        st.subheader("\nRaport Mujor Profit")
-        st.data_editor(
-            grouped_df, use_container_width=True, hide_index=True, disabled=True
-        )
-        st.subheader("Grafiku Permbledhes Mujor Profit")
-        # df_dropped = grouped_df.drop('Blerje (ALL)', axis=1)
-        # df_dropped.set_index('Muaji', inplace=True)
-        # st.line_chart(df_dropped)
-
-        fig = go.Figure()
-        grouped_df["Muaji"] = grouped_df["Muaji"].astype(str)
-
-        for column in grouped_df.columns[
-                      1:
-                      ]:  # Skip the first column (Month) for x-values
-            fig.add_trace(
-                go.Scatter(
-                    x=grouped_df["Muaji"],  # x-values (months)
-                    y=grouped_df[column],  # y-values
-                    mode="lines+markers",
-                    name=column,
-                )
+            st.subheader("\nRaport Sipas Klientit")
+            st.caption(
+                "Xhiro dhe fitimi llogariten nga porosite e likujduara, "
+                "balanca ne pritje nga porosite Pending."
+            )
+            st.dataframe(
+                report.table,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    column: st.column_config.NumberColumn(format="ALL %.2f")
+                    for column in [
+                        "Xhiro (ALL)",
+                        "Fitimi (ALL)",
+                        "Balanca ne pritje (ALL)",
+                    ]
+                },
             )
+            m1, m2, m3 = st.columns([1, 1, 4])
+            with m1:
+                st.button(
+                    "Faqja e meparshme",
+                    key="customers_previous",
+                    disabled=len(cursors) == 1,
+                    on_click=go_to_previous_customers,
+                )
+            with m2:
+                st.button(
+                    "Faqja tjeter",
+                    key="customers_next",
+                    disabled=report.next_cursor is None,
+                    on_click=go_to_next_customers,
+                    args=(report.next_cursor,),
+                )
+            with m3:
+                st.caption(f"Faqja {len(cursors)}")
+            if report.figure is not None:
+                st.plotly_chart(report.figure)
+
+    section_timer.lap("report_render")
+    section_timer.finish()
 
-        # Update layout for the chart
-        fig.update_layout(
-            xaxis_title="Muaji",
-            yaxis_title="Vlerat",
-            xaxis=dict(
-                tickformat="%b %Y",  # Format: 'Jan 2024'
-                tickvals=grouped_df["Muaji"],  # Ensure all months are displayed
-            ),
-            template="plotly_dark",
-        )
 
-        st.plotly_chart(fig)
+filter_section()
+timer.lap("filter")
 
-#
-# nr_lik_prod = get_number_of_tickets_with_status(status="Likujduar")
-# nr_pending_prods = get_number_of_tickets_with_status(status="Pending")
-#
-# st.error(f"Numri i produkteve me status PENDING eshte: {nr_pending_prods}")
-# st.success(f"Numri i produkteve me status  LIKUJDUAR eshte: {nr_lik_prod}")
+reports_section(has_orders=status_counts["count"].sum() > 0)
+timer.lap("reports")
+timer.finish()
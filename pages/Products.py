@@ -1,10 +1,10 @@
-import sqlite3
-from pathlib import Path
-
 import pandas as pd
-import psycopg2
 import streamlit as st
 
+from duda import metrics, products, repository
+
+timer = metrics.RerunTimer("Products")
+
 c1, c2, c3 = st.columns(3)
 
 with c1:
@@ -22,81 +22,45 @@ if btn1:
     st.switch_page("main.py")
 
 
-st.header("Manaxhimi i Produkteve")
-
-
-def connect_to_db():
+def read_catalog():
+    """The catalog, or the error and the end of the run if it cannot be read."""
     try:
-        conn = psycopg2.connect(
-            host=st.secrets.db_credentials["host"],
-            port=st.secrets.db_credentials["port"],
-            dbname=st.secrets.db_credentials["db_name"],
-            user=st.secrets.db_credentials["db_user"],
-            password=st.secrets.db_credentials["db_password"],
-        )
-        return conn
-    except Exception as e:
+        return products.catalog()
+    except repository.ERRORS as e:
         st.error(f"Error connecting to database: {e}")
-        return None
-
-
-conn = connect_to_db()
-
+        st.stop()
 
-def insert_non_existing_values_to_table(table_name, name):
-    cursor = conn.cursor()
-    cursor.execute(
-        f"""
-            INSERT INTO "{table_name}"(Produkti)
-            SELECT '{name}'
-            WHERE
-            NOT EXISTS (
-            SELECT Produkti FROM "{table_name}" WHERE Produkti = '{name}'
-            );
-        """
-    )
 
-
-def fetch_data(table):
-    cursor = conn.cursor()
-    cursor.execute(
-        f"""
-        SELECT * from "{table}";
-        """
-    )
-    result = cursor.fetchall()
-    conn.commit()
-    # conn.close()
-    return result
-
-
-def delete_value_from_table(table_name, name):
-    cursor = conn.cursor()
-    cursor.execute(
-        f"""
-        DELETE FROM "{table_name}"
-        WHERE Produkti = '{name}';
-        """
-    )
-    conn.commit()
+st.header("Manaxhimi i Produkteve")
+try:
+    repository.get_repository().ensure_schema()
+except repository.ERRORS as e:
+    st.error(f"Error connecting to database: {e}")
+    st.stop()
 
 
-prod = st.text_input("Produkti i ri")
+new_products = st.text_area("Produkte te reja (nje per rresht)")
 if st.button("Shto ne liste"):
-    insert_non_existing_values_to_table("products", f"{prod}")
-# insert_non_existing_values_to_table("products", "sd")
+    try:
+        added = products.add_products(new_products.splitlines())
+    except repository.ERRORS as e:
+        st.error(f"Shtimi deshtoi, asnje produkt nuk u shtua: {e}")
+    else:
+        st.success(f"U shtuan {added} produkte te reja.")
 
-del_prod = st.selectbox(
-    "Produkti i vjeter", options=[t[1:][0] for t in fetch_data("products")]
-)
+del_prod = st.selectbox("Produkti i vjeter", options=read_catalog())
 
 if st.button("Hiq nga lista"):
-    delete_value_from_table("products", f"{del_prod}")
+    try:
+        products.delete_product(del_prod)
+    except repository.ERRORS as e:
+        st.error(f"Heqja deshtoi, produkti nuk u hoq: {e}")
 
 st.subheader("Tabela permbledhese e produkteve")
 st.dataframe(
-    fetch_data("products"),
+    pd.DataFrame({"Produkti": read_catalog()}),
     hide_index=True,
-    column_order=["1"],
-    column_config={"1": st.column_config.TextColumn("Lista e produkteve")},
+    column_config={"Produkti": st.column_config.TextColumn("Lista e produkteve")},
 )
+
+timer.finish()
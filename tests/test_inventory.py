@@ -0,0 +1,148 @@
+import json
+from datetime import date
+
+import pytest
+
+from duda import inventory, repository
+
+
+def order(row_id, day=date(2024, 1, 1), row_version=1, **values):
+    """A row of ``inventory.COLUMNS``."""
+    row = {
+        "id": row_id,
+        "Produkti": None,
+        "Cmim_shitje": 10.0,
+        "Cmim_pound": None,
+        "Cmim_blerje": 4.0,
+        "Description": f"order {row_id}",
+        "magazinim": "Porosi e re",
+        "status_porosie": "Pending",
+        "Porositesi": "Arta",
+        "link": None,
+        "date_created": day,
+        "row_version": row_version,
+        **values,
+    }
+    return tuple(row[column] for column in inventory.COLUMNS)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = repository.SQLiteRepository(str(tmp_path / "duda.sqlite3"))
+    repo.replace_all([order(1), order(2, row_version=3), order(3)])
+    return repo
+
+
+def test_resolve_changes_maps_positions_to_ids_and_versions():
+    df = inventory.frame_from_rows([order(7), order(9, row_version=4)])
+    changes = {
+        "edited_rows": {1: {"Cmim_shitje": 12.5, "id": 1}},
+        "deleted_rows": [0],
+        "added_rows": [{"Produkti": "Fustan", "status_porosie": "Pending"}],
+    }
+
+    resolved = inventory.resolve_changes(df, changes)
+
+    assert resolved == {
+        "edited": [[9, 4, {"Cmim_shitje": 12.5}]],
+        "deleted": [[7, 1]],
+        "added": [{"Produkti": "Fustan", "status_porosie": "Pending"}],
+    }
+    # The journal stores it as JSON
+    assert json.loads(json.dumps(resolved)) == resolved
+
+
+def test_resolve_changes_drops_edits_of_deleted_rows():
+    df = inventory.frame_from_rows([order(7), order(9)])
+    changes = {
+        "edited_rows": {0: {"Description": "x"}, 1: {"id": 3}},
+        "deleted_rows": [0],
+        "added_rows": [],
+    }
+
+    resolved = inventory.resolve_changes(df, changes)
+
+    assert resolved["edited"] == []
+    assert resolved["deleted"] == [[7, 1]]
+
+
+def test_apply_changes_writes_rows_at_the_shown_version(repo):
+    conflicts = repo.apply_changes(
+        {"edited": [[2, 3, {"Cmim_shitje": 20}]], "deleted": [[3, 1]], "added": []}
+    )
+
+    assert conflicts == []
+    rows = repo.load_page(page_size=10)[0].set_index("id")
+    assert rows.loc[2, "Cmim_shitje"] == 20
+    assert rows.loc[2, "row_version"] == 4
+    assert list(rows.index) == [1, 2]
+
+
+def test_apply_changes_reports_rows_changed_or_deleted_meanwhile(repo):
+    repo.apply_changes(
+        {"edited": [[1, 1, {"Description": "theirs"}]], "deleted": [[2, 3]], "added": []}
+    )
+
+    conflicts = repo.apply_changes(
+        {
+            "edited": [[1, 1, {"Description": "mine"}], [2, 3, {"Cmim_shitje": 1}]],
+            "deleted": [[3, 1]],
+            "added": [],
+        }
+    )
+
+    assert sorted(conflicts, key=lambda c: c["id"]) == [
+        {"id": 1, "change": {"Description": "mine"}, "status": "changed"},
+        {"id": 2, "change": {"Cmim_shitje": 1}, "status": "deleted"},
+    ]
+    rows = repo.load_page(page_size=10)[0].set_index("id")
+    assert rows.loc[1, "Description"] == "theirs"
+    assert 3 not in rows.index
+
+
+def walk_pages(repo, page_size, **kwargs):
+    ids, after = [], None
+    while True:
+        page, after = repo.load_page(after=after, page_size=page_size, **kwargs)
+        ids += page["id"].tolist()
+        if after is None:
+            return ids
+
+
+def test_split_page_returns_the_cursor_of_the_last_row_shown():
+    frame = inventory.frame_from_rows(
+        [order(4, date(2024, 1, 2)), order(5, date(2024, 1, 3)), order(6)]
+    )
+
+    page, cursor = inventory.split_page(frame, "date_created", 2)
+    assert page["id"].tolist() == [4, 5]
+    assert cursor == (date(2024, 1, 3), 5)
+
+    assert inventory.split_page(frame, "id", 2)[1] == 5
+    assert inventory.split_page(frame, "id", 3)[1] is None
+
+
+def test_split_page_encodes_a_missing_date_as_none():
+    frame = inventory.frame_from_rows([order(4, None), order(5, None)])
+
+    assert inventory.split_page(frame, "date_created", 1)[1] == (None, 4)
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 5])
+def test_date_pages_reach_orders_without_a_date(tmp_path, page_size):
+    repo = repository.SQLiteRepository(str(tmp_path / "duda.sqlite3"))
+    repo.replace_all(
+        [
+            order(1, date(2024, 3, 1)),
+            order(2, None),
+            order(3, date(2024, 1, 1)),
+            order(4, date(2024, 3, 1)),
+            order(5, None),
+        ]
+    )
+
+    assert walk_pages(repo, page_size, sort_key="date_created") == [3, 1, 4, 2, 5]
+    assert walk_pages(repo, page_size, sort_key="id") == [1, 2, 3, 4, 5]
+    assert walk_pages(
+        repo, page_size, sort_key="date_created", date_from=date(2024, 2, 1)
+    ) == [1, 4]
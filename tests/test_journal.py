@@ -0,0 +1,186 @@
+import json
+
+import psycopg2
+import pytest
+
+from duda import inventory, journal
+
+
+class FakeDatabase:
+    """The ``applied_saves`` table and the saves written, with transactions.
+
+    ``apply_changes`` is replaced by ``apply``: a save is a dict naming itself
+    and, optionally, its conflicts or the errors it runs into.
+    """
+
+    def __init__(self):
+        self.applied = {}
+        self.writes = []
+        self.unreachable = False
+        # Transient errors each save still runs into, by name
+        self.failures = {}
+
+    def getconn(self):
+        if self.unreachable:
+            raise psycopg2.OperationalError("could not connect to server")
+        return FakeConnection(self)
+
+    def putconn(self, conn):
+        pass
+
+    def apply(self, conn, resolved):
+        name = resolved["name"]
+        if self.failures.get(name):
+            self.failures[name] -= 1
+            raise psycopg2.OperationalError("server closed the connection")
+        if resolved.get("reject"):
+            raise psycopg2.DataError(f"invalid input in {name}")
+        conn.writes.append(name)
+        return resolved.get("conflicts", [])
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.rollback()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.database.applied.update(self.applied)
+        self.database.writes += self.writes
+        self.rollback()
+
+    def rollback(self):
+        self.applied, self.writes = {}, []
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+        self._row = None
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        applied = {**self.conn.database.applied, **self.conn.applied}
+        if sql.startswith("INSERT INTO applied_saves (key) VALUES"):
+            self.rowcount = int(params[0] not in applied)
+            if self.rowcount:
+                self.conn.applied[params[0]] = (None, None)
+        elif sql.startswith("INSERT INTO applied_saves (key, error)"):
+            self.conn.applied[params[0]] = (None, params[1])
+        elif sql.startswith("UPDATE applied_saves SET conflicts"):
+            self.conn.applied[params[1]] = (json.loads(params[0]), None)
+        elif sql.startswith("SELECT conflicts, error FROM applied_saves"):
+            self._row = applied[params[0]]
+        elif not sql.startswith("DELETE FROM applied_saves"):
+            raise AssertionError(f"unexpected SQL: {sql}")
+
+    def fetchone(self):
+        return self._row
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(inventory, "apply_changes", database.apply)
+    return database
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch, database):
+    # Flush from the test, not from the worker thread, and retry at once
+    monkeypatch.setattr(journal.Journal, "_run", lambda self: None)
+    monkeypatch.setattr(journal.Journal._apply_with_retry.retry, "sleep", lambda s: None)
+    return journal.Journal(str(tmp_path / "journal.sqlite3"), database)
+
+
+CONFLICT = {"id": 7, "change": {"Description": "x"}, "status": "changed"}
+
+
+def test_flush_applies_the_saves_and_keeps_their_conflicts(log, database):
+    first = log.append({"name": "first"})
+    second = log.append({"name": "second", "conflicts": [CONFLICT]})
+
+    assert log.flush() == 2
+
+    assert database.writes == ["first", "second"]
+    assert log.results([first, second]) == {
+        first: {"conflicts": [], "error": None},
+        second: {"conflicts": [CONFLICT], "error": None},
+    }
+    assert log.pending() == (0, None)
+
+
+def test_a_rejected_save_does_not_hold_back_the_others(log, database):
+    keys = [
+        log.append({"name": "before"}),
+        log.append({"name": "bad", "reject": True}),
+        log.append({"name": "after"}),
+    ]
+
+    assert log.flush() == 3
+
+    assert database.writes == ["before", "after"]
+    results = log.results(keys)
+    assert results[keys[1]]["error"] == "invalid input in bad"
+    assert results[keys[0]]["error"] is None and results[keys[2]]["error"] is None
+
+
+def test_a_transient_error_retries_the_batch(log, database):
+    key = log.append({"name": "flaky"})
+    database.failures["flaky"] = 2
+
+    assert log.flush() == 1
+
+    assert database.writes == ["flaky"]
+    assert log.results([key])[key] == {"conflicts": [], "error": None}
+
+
+def test_a_failed_flush_keeps_the_results_of_saves_applied_before_it(log, database):
+    keys = [
+        log.append({"name": "conflicting", "conflicts": [CONFLICT]}),
+        log.append({"name": "bad", "reject": True}),
+        log.append({"name": "flaky"}),
+    ]
+    # The rejected save sends the batch one save per transaction, the first
+    # two are committed before every attempt fails on the third
+    database.failures["flaky"] = 5
+
+    with pytest.raises(psycopg2.OperationalError):
+        log.flush()
+    assert log.pending()[0] == 3
+    assert log.flush() == 3
+
+    assert database.writes == ["conflicting", "flaky"]
+    results = log.results(keys)
+    assert results[keys[0]] == {"conflicts": [CONFLICT], "error": None}
+    assert results[keys[1]]["error"] == "invalid input in bad"
+    assert results[keys[2]] == {"conflicts": [], "error": None}
+
+
+def test_a_save_flushed_twice_is_applied_once(log, database):
+    key = log.append({"name": "once", "conflicts": [CONFLICT]})
+    # Committed, but the process stopped before the journal was updated
+    log._apply_with_retry([(1, key, json.dumps({"name": "once", "conflicts": [CONFLICT]}))])
+
+    assert log.flush() == 1
+
+    assert database.writes == ["once"]
+    assert log.results([key])[key] == {"conflicts": [CONFLICT], "error": None}
+
+
+def test_saves_stay_journaled_while_the_database_is_unreachable(log, database):
+    key = log.append({"name": "offline"})
+    database.unreachable = True
+
+    with pytest.raises(psycopg2.OperationalError):
+        log.flush()
+    assert log.pending() == (1, "could not connect to server")
+    assert log.results([key]) == {}
+
+    database.unreachable = False
+    assert log.flush() == 1
+    assert database.writes == ["offline"]
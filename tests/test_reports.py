@@ -0,0 +1,44 @@
+import numpy as np
+
+from duda import reports
+
+
+def test_lttb_keeps_every_point_of_short_series():
+    x = np.arange(10)
+    y = np.random.default_rng(0).random(10)
+
+    assert reports.lttb(x, y, 10).tolist() == list(range(10))
+    assert reports.lttb(x, y, 2).tolist() == list(range(10))
+
+
+def test_lttb_keeps_the_ends_in_order():
+    x = np.arange(10_000)
+    y = np.random.default_rng(0).random(10_000)
+
+    keep = reports.lttb(x, y, 500)
+
+    assert len(keep) == 500
+    assert keep[0] == 0 and keep[-1] == 9_999
+    assert (np.diff(keep) > 0).all()
+
+
+def test_lttb_keeps_spikes():
+    x = np.arange(5_000)
+    y = np.zeros(5_000)
+    y[1234], y[4321] = 100.0, -50.0
+
+    keep = reports.lttb(x, y, 100)
+
+    assert 1234 in keep
+    assert 4321 in keep
+
+
+def test_lttb_follows_uneven_x():
+    # Days as int64 nanoseconds, as the daily report passes them
+    x = np.cumsum(np.random.default_rng(0).integers(1, 5, 3_000)) * 86_400 * 10**9
+    y = np.sin(np.arange(3_000) / 100)
+
+    keep = reports.lttb(x, y, 300)
+
+    assert len(keep) == 300
+    assert np.abs(np.interp(x, x[keep], y[keep]) - y).max() < 0.1
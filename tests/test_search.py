@@ -0,0 +1,46 @@
+from duda import search
+
+ORDERS = {
+    1: "Arta Hoxha Fustan i kuq",
+    2: "Besnik Kola Kepuce sportive",
+    3: "Arta Hoxha Canta lekure",
+    4: "Drita Leka Fustan nuseje",
+}
+
+
+def build(orders=ORDERS):
+    return search.TrigramIndex(list(orders), list(orders.values()))
+
+
+def test_trigrams_are_padded_like_pg_trgm():
+    assert search.trigrams("cat") == {"  c", " ca", "cat", "at "}
+
+
+def test_search_tolerates_typos():
+    assert build().search("Besnk")[0] == 2
+    assert build().search("kepuze")[0] == 2
+
+
+def test_search_matches_the_first_letters_of_a_word():
+    assert build().search("Drit") == [4]
+
+
+def test_search_ranks_equal_matches_newest_first():
+    assert build().search("fustan") == [4, 1]
+    assert build().search("Arta Hoxha") == [3, 1]
+
+
+def test_search_ignores_short_and_wordless_queries():
+    assert build().search("Ar") == []
+    assert build().search("  ...  ") == []
+
+
+def test_updated_searches_changed_rows_and_leaves_the_original_as_it_was():
+    index = build()
+
+    updated = index.updated([1, 4], ["Arta Hoxha Xhaketa", None])
+
+    assert updated.search("fustan") == []
+    assert updated.search("xhaketa") == [1]
+    assert index.search("fustan") == [4, 1]
+    assert updated.updated([5], ["Vesa Xhaketa"]).search("xhaketa") == [5, 1]
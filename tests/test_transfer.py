@@ -0,0 +1,83 @@
+import io
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from duda import repository, transfer
+
+CSV = """\
+DATE_CREATED , Produkti,Cmim_shitje,magazinim,status_porosie,Porositesi
+2024-01-05,Fustan,12.5,Inventar,Pending,Arta
+2024-01-06,,,Porosi e re,Likujduar, Besa
+not a date,Fustan,1,Inventar,Pending,Arta
+2024-01-07,Fustan,1,Inventar,Humbur,Arta
+2024-01-07,Fustan,1,Depo,Pending,Arta
+2024-01-07,Kapele,1,Inventar,Pending,Arta
+2024-01-07,Fustan,dhjete,Inventar,Pending,Arta
+"""
+
+
+def read(text):
+    return pd.concat(transfer.read_chunks(io.StringIO(text), "orders.csv"))
+
+
+def test_validate_types_the_valid_rows():
+    valid, _ = transfer.validate(read(CSV), {"Fustan"})
+
+    assert list(valid.columns) == transfer.COLUMNS
+    assert valid["date_created"].tolist() == [date(2024, 1, 5), date(2024, 1, 6)]
+    assert valid["Cmim_shitje"].iloc[0] == 12.5
+    # Empty cells are NULLs, text is trimmed
+    assert pd.isna(valid["Produkti"].iloc[1])
+    assert pd.isna(valid["Cmim_shitje"].iloc[1])
+    assert valid["Porositesi"].tolist() == ["Arta", "Besa"]
+
+
+def test_validate_explains_every_rejected_row():
+    _, rejected = transfer.validate(read(CSV), {"Fustan"})
+
+    assert rejected["problem"].tolist() == [
+        "date_created e pavlefshme",
+        "status_porosie i panjohur",
+        "magazinim i panjohur",
+        "Produkti nuk eshte ne liste",
+        "cmim jo numerik",
+    ]
+
+
+def test_validate_requires_the_required_columns():
+    with pytest.raises(ValueError, match="magazinim, status_porosie"):
+        transfer.validate(read("date_created,Produkti\n2024-01-05,Fustan\n"), set())
+
+
+def test_import_and_export_round_trip_on_sqlite(tmp_path):
+    repo = repository.SQLiteRepository(str(tmp_path / "duda.sqlite3"))
+    repo.add_products(["Fustan"])
+
+    chunks = transfer.read_chunks(io.StringIO(CSV), "orders.csv", chunk_rows=3)
+    imported, rejected, sample = repo.import_chunks(chunks)
+    assert (imported, rejected, len(sample)) == (2, 5, 5)
+
+    out = io.BytesIO()
+    repo.export_csv(out, date(2024, 1, 1), date(2024, 1, 31), statuses=("Pending",))
+    exported = pd.read_csv(io.BytesIO(out.getvalue()))
+    assert list(exported.columns) == transfer.COLUMNS
+    assert exported[["date_created", "Porositesi"]].values.tolist() == [
+        ["2024-01-05", "Arta"]
+    ]
+
+
+def test_a_failed_export_leaves_no_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "EXPORT_DIR", tmp_path / "exports")
+
+    def fail(out):
+        out.write(b"date_created\n")
+        raise RuntimeError("connection lost")
+
+    with pytest.raises(RuntimeError):
+        transfer.write_export(fail)
+    assert list((tmp_path / "exports").iterdir()) == []
+
+    name = transfer.write_export(lambda out: out.write(b"date_created\n"))
+    assert [path.name for path in (tmp_path / "exports").iterdir()] == [name]